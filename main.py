@@ -1,12 +1,18 @@
 import src.fetch_data as fetch_data
 import src.fetchOHLC as fetchOHLC
 import src.RelativeStrength as RelativeStrength
-import src.criteria as criteria
+import src.db as db
+import src.notifier as notifier
+import src.price_cache as price_cache
+import src.storage as storage
+import src.timeframes as timeframes
+from src.ohlc_store import OHLCStore
+from src.streaming_signals import SignalStateStore
 import pandas as pd
-from datetime import datetime
-from sqlalchemy import create_engine, text
-import requests
+from datetime import datetime, timezone
+from sqlalchemy import bindparam, text
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,75 +22,99 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
-# Database configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
-
-# Database connection
-db_connection_str = f'mysql+pymysql://{DB_CONFIG["user"]}:{DB_CONFIG["password"]}@{DB_CONFIG["host"]}/{DB_CONFIG["database"]}'
-engine = create_engine(db_connection_str)
-
 # Forward testing variables
 INITIAL_CASH = 1000
 open_positions = {}
 MAX_POSITIONS = 3
 
+# Messages are queued and delivered in batches from a background thread (src/notifier.py)
+telegram = None
+
 def send_telegram_message(message):
+    global telegram
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("Telegram configuration missing. Skipping message.")
         return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-    except Exception as e:
-        print(f"Failed to send Telegram message: {e}")
+    if telegram is None:
+        telegram = notifier.TelegramNotifier(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
+    telegram.send(message)
 
 def initialize_portfolio():
     global open_positions
-    query = "SELECT * FROM Trades WHERE status = 'OPEN'"
-    with engine.connect() as conn:
-        open_trades = pd.read_sql(query, conn)
+    open_trades = storage.get_storage().open_trades()
     open_positions = {row['token_id']: row.to_dict() for _, row in open_trades.iterrows()}
     cash_spent = sum(row['entry_price'] * row.get('units', 100) for row in open_positions.values())  # Default to 100 if units missing
     return INITIAL_CASH - cash_spent
 
-def update_portfolio(cash, today_date, today_datetime):
+# Today's last open/close and the name of every token the run touches, in one query
+def load_market_snapshot(token_ids, day_start, day_end, table="Historical_Prices"):
+    """Return {token_id: {"name", "open", "close"}}; open/close are those of the token's last bar in
+    [day_start, day_end) of the price table (None when it has none there)"""
+    snapshot = {token_id: {"name": token_id, "open": None, "close": None} for token_id in token_ids}
+    if not snapshot:
+        return snapshot
+    # A plain epoch range on timestamp (rather than DATE(timestamp)) lets MySQL use the (token_id, timestamp) key
+    query = text(f"""
+        SELECT token_id, timestamp, open, close, NULL AS name
+        FROM {table}
+        WHERE token_id IN :token_ids AND timestamp >= :day_start AND timestamp < :day_end
+        UNION ALL
+        SELECT id, NULL, NULL, NULL, name
+        FROM Base_tokens
+        WHERE id IN :token_ids
+    """).bindparams(bindparam("token_ids", expanding=True))
+    with db.get_engine().connect() as conn:
+        rows = conn.execute(query, {"token_ids": list(snapshot), "day_start": day_start, "day_end": day_end}).all()
+    last_bar = {}
+    for token_id, timestamp, open_price, close_price, name in rows:
+        if timestamp is None:
+            snapshot[token_id]["name"] = name
+        elif timestamp >= last_bar.get(token_id, timestamp):
+            last_bar[token_id] = timestamp
+            snapshot[token_id].update(open=open_price, close=close_price)
+    return snapshot
+
+# Epoch bounds [start, end) of the current UTC day, whose candle holds today's prices
+def utc_day_bounds(now=None):
+    today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    day_start = int(datetime(today.year, today.month, today.day, tzinfo=timezone.utc).timestamp())
+    return day_start, day_start + 86400
+
+def update_portfolio(cash, today_datetime, snapshot):
+    """Value the open positions at today's close (entry price without one) and return the Portfolio row"""
     positions_value = 0
-    if open_positions:
-        token_ids = ','.join(f"'{tid}'" for tid in open_positions.keys())
-        query = f"SELECT token_id, close FROM Historical_Prices WHERE token_id IN ({token_ids}) AND DATE(timestamp) = '{today_date}'"
-        with engine.connect() as conn:
-            price_data = pd.read_sql(query, conn)
-            price_dict = {row['token_id']: row['close'] for _, row in price_data.iterrows()}
-        for token_id, trade in open_positions.items():
-            current_price = price_dict.get(token_id, trade['entry_price'])
-            units = trade.get('units', 100)  # Default to 100 if units missing
-            positions_value += current_price * units
+    for token_id, trade in open_positions.items():
+        current_price = snapshot.get(token_id, {}).get("close")
+        if current_price is None:
+            current_price = trade['entry_price']
+        units = trade.get('units', 100)  # Default to 100 if units missing
+        positions_value += current_price * units
     equity = cash + positions_value
-    portfolio_data = {'date': today_datetime, 'equity': equity, 'cash': cash, 'positions_value': positions_value}
-    with engine.connect() as conn:
-        try:
-            pd.DataFrame([portfolio_data]).to_sql('Portfolio', conn, if_exists='append', index=False)
-            conn.commit()
-            print("Portfolio updated")
-        except Exception as e:
-            print(f"Error updating portfolio: {e}")
-    return equity
-
-def main():
+    return {'date': today_datetime, 'equity': equity, 'cash': cash, 'positions_value': positions_value}
+
+# Apply the run's trade closes, trade opens and portfolio rows in one transaction
+def record_run(closed_trades, opened_trades, portfolio_rows):
+    try:
+        storage.get_storage().record_trades(closed_trades, opened_trades, portfolio_rows)
+    except Exception as e:
+        print(f"Error recording trades and portfolio (nothing was written): {e}")
+        return False
+    for trade in closed_trades:
+        print(f"Trade closed for {trade['token_id']}")
+    for trade in opened_trades:
+        print(f"Trade inserted for {trade['token_id']}")
+    print("Portfolio updated")
+    return True
+
+def main(timeframe="1d"):
+    """Run the strategy with the ranking and DEMA-DMI/CHOCH signals on `timeframe` candles (1d, 4h or 1h)"""
+    stored = timeframes.stored_timeframe(timeframe)
     current_datetime = datetime.now()
-    today_date = current_datetime.strftime('%Y-%m-%d')
     today_datetime = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
 
     # Step 1: Read yesterday's top_tokens.txt
     yesterday_tokens = []
-    top_tokens_file = "src/top_tokens.txt"
+    top_tokens_file = RelativeStrength.top_tokens_path(timeframe)
     if os.path.exists(top_tokens_file):
         with open(top_tokens_file, "r") as file:
             yesterday_tokens = file.read().splitlines()
@@ -95,8 +125,9 @@ def main():
     # Step 2: Fetch data and generate new top_tokens.txt
     steps = [
         ("Fetching tokens from CoinGecko...", fetch_data.main),
-        ("Fetching OHLC data for today...", fetchOHLC.main),
-        ("Calculating relative strength and identifying top 3 tokens...", RelativeStrength.print_top_ranked_tokens)
+        ("Fetching OHLC data for today...", lambda: fetchOHLC.main(stored)),
+        ("Calculating relative strength and identifying top 3 tokens...",
+         lambda: RelativeStrength.print_top_ranked_tokens(timeframe=timeframe))
     ]
     for message, func in steps:
         print(message)
@@ -126,10 +157,14 @@ def main():
             print(message)
             send_telegram_message(message)
 
-    # Fetch historical data
-    query = "SELECT token_id, timestamp, open, high, low, close FROM Historical_Prices"
-    historical_data = pd.read_sql(query, engine)
-    historical_data["timestamp"] = pd.to_datetime(historical_data["timestamp"], unit="s")
+    # Fetch the top tokens' candles of the timeframe (daily ones from the local price cache)
+    if timeframe == "1d":
+        price_cache.refresh()
+    historical_data = timeframes.load_ohlc(timeframe, token_ids=top_tokens, parse_dates=True)
+    store = OHLCStore(historical_data)
+
+    # DEMA-DMI/CHOCH state of this timeframe saved by the previous run; only bars added since then are processed
+    signal_states = SignalStateStore(timeframe=timeframe).load()
 
     # Evaluate trading signals and simulate trades
     message = "\nEvaluating trading signals and simulating trades for top 3 tokens..."
@@ -137,7 +172,17 @@ def main():
     send_telegram_message(message)
 
     cash = initialize_portfolio()
-    equity = update_portfolio(cash, today_date, today_datetime)  # Get current equity
+
+    # Prices and names for the open positions and today's top tokens in one query
+    day_start, day_end = utc_day_bounds()
+    snapshot = load_market_snapshot(sorted(set(open_positions) | set(top_tokens)), day_start, day_end,
+                                    timeframes.price_table(stored))
+
+    # Trade and portfolio writes are collected here and applied together at the end of the run
+    closed_trades = []
+    opened_trades = []
+    portfolio_rows = [update_portfolio(cash, today_datetime, snapshot)]
+    equity = portfolio_rows[0]['equity']  # Get current equity
     cash_per_position = equity / MAX_POSITIONS  # Allocate 33% of current equity
 
     # Manage portfolio
@@ -145,135 +190,98 @@ def main():
     desired_positions = set(top_tokens)
 
     # Close positions not in top_tokens
-    with engine.connect() as conn:
-        for token_id in current_positions - desired_positions:
-            if token_id in open_positions:
-                trade = open_positions[token_id]
-                price_data = pd.read_sql(f"SELECT open, close FROM Historical_Prices WHERE token_id = '{token_id}' AND DATE(timestamp) = '{today_date}'", conn)
-                if not price_data.empty:
-                    exit_price = price_data['open'].iloc[-1]
-                    units = trade.get('units', 100)  # Default to 100 if units missing
-                    profit_loss = (exit_price - trade['entry_price']) * units
-                    try:
-                        conn.execute(
-                            text("""
-                                UPDATE Trades
-                                SET exit_date = :exit_date, exit_price = :exit_price,
-                                    profit_loss = :profit_loss, status = 'CLOSED'
-                                WHERE trade_id = :trade_id
-                            """),
-                            {'exit_date': today_datetime, 'exit_price': exit_price,
-                             'profit_loss': profit_loss, 'trade_id': trade['trade_id']}
-                        )
-                        conn.commit()
-                        print(f"Trade closed for {token_id}")
-                    except Exception as e:
-                        print(f"Error closing trade for {token_id}: {e}")
-                    cash += exit_price * units
-                    del open_positions[token_id]
-                    message = f"Closed LONG trade for {token_id}: Profit/Loss = ${profit_loss:.2f}\n"
-                    print(message)
-                    send_telegram_message(message)
-
-    # Evaluate and open new positions
-    with engine.connect() as conn:
-        for token_id in top_tokens:
-            token_data = historical_data[historical_data["token_id"] == token_id].copy()
-            if token_data.empty or len(token_data) < 2:
-                message = f"No data available for {token_id}. Skipping."
+    for token_id in current_positions - desired_positions:
+        if token_id in open_positions:
+            trade = open_positions[token_id]
+            exit_price = snapshot[token_id]['open']
+            if exit_price is not None:
+                units = trade.get('units', 100)  # Default to 100 if units missing
+                profit_loss = (exit_price - trade['entry_price']) * units
+                closed_trades.append({'token_id': token_id, 'exit_date': today_datetime, 'exit_price': exit_price,
+                                      'profit_loss': profit_loss, 'trade_id': trade['trade_id']})
+                cash += exit_price * units
+                del open_positions[token_id]
+                message = f"Closed LONG trade for {token_id}: Profit/Loss = ${profit_loss:.2f}\n"
                 print(message)
                 send_telegram_message(message)
-                continue
-
-            token_data = token_data.sort_values("timestamp").reset_index(drop=True)
-            latest_data = token_data.iloc[-1]
-            previous_data = token_data.iloc[-2]
-
-            latest_timestamp = latest_data['timestamp'].strftime('%Y-%m-%d %H:%M')
-            signal = criteria.dema_dmi(token_data["close"], token_data["high"], token_data["low"])
-            previous_signal = signal.iloc[-2]
-            latest_choch = criteria.BOSCHOCH.MarketStructure.bos_choch(
-                token_data[["open", "high", "low", "close"]], 
-                criteria.BOSCHOCH.MarketStructure.swing_highs_lows(token_data[["open", "high", "low", "close"]], swing_length=1),
-                close_break=True
-            )["CHOCH"].iloc[-1]
-
-            position = "NO POSITION"
-            if previous_signal == 1 and pd.isna(latest_choch):
-                position = "LONG"
-            elif latest_choch == -1:
-                position = "EXIT (Bearish CHOCH)"
-            elif latest_choch == 1 and previous_signal == 1:
-                position = "LONG (Bullish CHOCH Re-entry)"
-            elif previous_signal == -1:
-                position = "EXIT"
-
-            token_name = pd.read_sql(f"SELECT name FROM Base_tokens WHERE id = '{token_id}'", conn)["name"].iloc[0] if not pd.read_sql(f"SELECT name FROM Base_tokens WHERE id = '{token_id}'", conn).empty else token_id
-
-            trade_message = ""
-            if token_id in open_positions:
-                if position.startswith("EXIT"):
-                    trade = open_positions[token_id]
-                    exit_price = latest_data['open']
-                    units = trade.get('units', 100)  # Default to 100 if units missing
-                    profit_loss = (exit_price - trade['entry_price']) * units
-                    try:
-                        conn.execute(
-                            text("""
-                                UPDATE Trades
-                                SET exit_date = :exit_date, exit_price = :exit_price,
-                                    profit_loss = :profit_loss, status = 'CLOSED'
-                                WHERE trade_id = :trade_id
-                            """),
-                            {'exit_date': today_datetime, 'exit_price': exit_price,
-                             'profit_loss': profit_loss, 'trade_id': trade['trade_id']}
-                        )
-                        conn.commit()
-                        print(f"Trade closed for {token_id}")
-                    except Exception as e:
-                        print(f"Error closing trade for {token_id}: {e}")
-                    cash += exit_price * units
-                    del open_positions[token_id]
-                    trade_message = f"Closed LONG trade: Profit/Loss = ${profit_loss:.2f}\n"
-            elif position == "LONG" and len(open_positions) < MAX_POSITIONS:
-                entry_price = latest_data['open']
-                units = cash_per_position / entry_price  # Allocate 33% of equity
-                if cash >= units * entry_price:
-                    trade_data = {
-                        'token_id': token_id, 'entry_date': today_datetime,
-                        'entry_price': entry_price, 'position_type': 'LONG', 'status': 'OPEN',
-                        'units': units  # Store dynamic units
-                    }
-                    try:
-                        pd.DataFrame([trade_data]).to_sql('Trades', conn, if_exists='append', index=False)
-                        conn.commit()
-                        print(f"Trade inserted for {token_id}")
-                    except Exception as e:
-                        print(f"Error inserting trade for {token_id}: {e}")
-                    trade_id = conn.execute(text("SELECT LAST_INSERT_ID()")).scalar()
-                    trade_data['trade_id'] = trade_id
-                    open_positions[token_id] = trade_data
-                    cash -= units * entry_price
-                    trade_message = f"Opened LONG trade at ${entry_price:.8f} with {units:.2f} units\n"
-
-            message = (
-                f"----------------- // -----------------\n"
-                f"\nToken: {token_name} ({token_id})\n"
-                f"  Timestamp: {latest_timestamp}\n"
-                f"  Latest Close: ${latest_data['close']:.8f}\n"
-                f"  DEMA-DMI Signal (Previous Day): {previous_signal}\n"
-                f"  CHOCH Signal (Today): {latest_choch}\n"
-                f"  Recommended Position: {position}\n"
-                f"  Trade Action: {trade_message if trade_message else 'No trade action taken'}\n"
-            )
+
+    # Evaluate and open new positions
+    for token_id in top_tokens:
+        token_data = store.frame(token_id)
+        if token_data.empty or len(token_data) < 2:
+            message = f"No data available for {token_id}. Skipping."
             print(message)
             send_telegram_message(message)
+            continue
+
+        latest_data = token_data.iloc[-1]
+        previous_data = token_data.iloc[-2]
+
+        latest_timestamp = latest_data['timestamp'].strftime('%Y-%m-%d %H:%M')
+        signal_state = signal_states.advance(token_id, token_data)
+        previous_signal = signal_state.previous_signal
+        latest_choch = signal_state.latest_choch
+
+        position = "NO POSITION"
+        if previous_signal == 1 and pd.isna(latest_choch):
+            position = "LONG"
+        elif latest_choch == -1:
+            position = "EXIT (Bearish CHOCH)"
+        elif latest_choch == 1 and previous_signal == 1:
+            position = "LONG (Bullish CHOCH Re-entry)"
+        elif previous_signal == -1:
+            position = "EXIT"
 
-    # Update portfolio
-    equity = update_portfolio(cash, today_date, today_datetime)
+        token_name = snapshot[token_id]['name']
+
+        trade_message = ""
+        if token_id in open_positions:
+            if position.startswith("EXIT"):
+                trade = open_positions[token_id]
+                exit_price = latest_data['open']
+                units = trade.get('units', 100)  # Default to 100 if units missing
+                profit_loss = (exit_price - trade['entry_price']) * units
+                closed_trades.append({'token_id': token_id, 'exit_date': today_datetime, 'exit_price': exit_price,
+                                      'profit_loss': profit_loss, 'trade_id': trade['trade_id']})
+                cash += exit_price * units
+                del open_positions[token_id]
+                trade_message = f"Closed LONG trade: Profit/Loss = ${profit_loss:.2f}\n"
+        elif position == "LONG" and len(open_positions) < MAX_POSITIONS:
+            entry_price = latest_data['open']
+            units = cash_per_position / entry_price  # Allocate 33% of equity
+            if cash >= units * entry_price:
+                trade_data = {
+                    'token_id': token_id, 'entry_date': today_datetime,
+                    'entry_price': entry_price, 'position_type': 'LONG', 'status': 'OPEN',
+                    'units': units  # Store dynamic units
+                }
+                opened_trades.append(trade_data)
+                open_positions[token_id] = trade_data
+                cash -= units * entry_price
+                trade_message = f"Opened LONG trade at ${entry_price:.8f} with {units:.2f} units\n"
+
+        message = (
+            f"----------------- // -----------------\n"
+            f"\nToken: {token_name} ({token_id})\n"
+            f"  Timestamp: {latest_timestamp}\n"
+            f"  Latest Close: ${latest_data['close']:.8f}\n"
+            f"  DEMA-DMI Signal (Previous Day): {previous_signal}\n"
+            f"  CHOCH Signal (Today): {latest_choch}\n"
+            f"  Recommended Position: {position}\n"
+            f"  Trade Action: {trade_message if trade_message else 'No trade action taken'}\n"
+        )
+        print(message)
+        send_telegram_message(message)
+    signal_states.save()
+
+    # Update portfolio and write every trade change in one transaction
+    portfolio_rows.append(update_portfolio(cash, today_datetime, snapshot))
+    equity = portfolio_rows[-1]['equity']
+    record_run(closed_trades, opened_trades, portfolio_rows)
     message = f"Portfolio Equity at {today_datetime}: ${equity:.2f}"
     print(message)
     send_telegram_message(message)
+    print(db.pool_status())
 
 if __name__ == "__main__":
     message = (
@@ -283,4 +291,10 @@ if __name__ == "__main__":
     )
     print(message)
     send_telegram_message(message)
-    main()
\ No newline at end of file
+    try:
+        # python3 main.py [--timeframe=4h]
+        main(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--timeframe=")), "1d"))
+    finally:
+        # Deliver the queued notifications (bounded by TELEGRAM_FLUSH_TIMEOUT)
+        if telegram is not None:
+            telegram.close()
\ No newline at end of file
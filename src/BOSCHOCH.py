@@ -45,37 +45,10 @@ class MarketStructure:
         - Bearish CHOCH (exit): High -> Lower Low, signal at the lower low.
         - Bullish CHOCH (re-entry): High -> Lower Low -> Higher High, signal at the higher high.
         """
-        swingHighLow = swing_highs_lows.copy()
-        choch = np.zeros(len(ohlc), dtype=np.float64)
-        level = np.zeros(len(ohlc), dtype=np.float64)
-
-        level_order = []
-        highLow_order = []
-        last_positions = []
-
-        for i in range(len(ohlc)):
-            if not np.isnan(swingHighLow["HighLow"][i]):
-                level_order.append(swingHighLow["Level"][i])
-                highLow_order.append(swingHighLow["HighLow"][i])
-                last_positions.append(i)
-
-                # Bearish CHOCH: High -> Lower Low, signal at the lower low
-                if len(level_order) >= 2:
-                    if (highLow_order[-2:] == [1, -1] and 
-                        level_order[-1] < level_order[-2]):
-                        choch[i] = -1  # Signal at the lower low
-                        level[i] = level_order[-2]  # Level is the high
-
-                # Bullish CHOCH: High -> Lower Low -> Higher High, signal at the higher high
-                if len(level_order) >= 3:
-                    if (highLow_order[-3:] == [1, -1, 1] and 
-                        level_order[-2] < level_order[-3] and  # Lower low
-                        level_order[-1] > level_order[-3]):    # Higher high
-                        choch[i] = 1  # Signal at the higher high
-                        level[i] = level_order[-2]  # Level is the lower low
-
-        choch = np.where(choch != 0, choch, np.nan)
-        level = np.where(level != 0, level, np.nan)
+        choch, level = cls._choch_kernel(
+            swing_highs_lows["HighLow"].to_numpy(dtype=np.float64),
+            swing_highs_lows["Level"].to_numpy(dtype=np.float64),
+        )
 
         return pd.concat(
             [
@@ -85,4 +58,88 @@ class MarketStructure:
                 pd.Series(np.nan, index=ohlc.index, name="BrokenIndex"),
             ],
             axis=1,
-        )
\ No newline at end of file
+        )
+
+    @staticmethod
+    def _choch_kernel(highlow, swing_level, segments=None):
+        """
+        Single pass over the swing points only (bars without a swing are skipped).
+        Each swing point is compared with the one or two swing points before it, which
+        is the same as keeping the last three swing points as state. With `segments`
+        (one id per bar) the comparison never reaches back into another token's bars.
+        """
+        choch = np.zeros(len(highlow), dtype=np.float64)
+        level = np.zeros(len(highlow), dtype=np.float64)
+
+        points = np.flatnonzero(~np.isnan(highlow))
+        hl = highlow[points]
+        lv = swing_level[points]
+        same = np.ones(len(points), dtype=bool) if segments is None else np.r_[False, segments[points][1:] == segments[points][:-1]]
+
+        # Bearish CHOCH: High -> Lower Low, signal at the lower low
+        k = np.arange(1, len(points))
+        bearish = same[k] & (hl[k - 1] == 1) & (hl[k] == -1) & (lv[k] < lv[k - 1])
+        choch[points[k[bearish]]] = -1
+        level[points[k[bearish]]] = lv[k[bearish] - 1]
+
+        # Bullish CHOCH: High -> Lower Low -> Higher High, signal at the higher high
+        k = np.arange(2, len(points))
+        bullish = (same[k] & same[k - 1] & (hl[k - 2] == 1) & (hl[k - 1] == -1) & (hl[k] == 1)
+                   & (lv[k - 1] < lv[k - 2]) & (lv[k] > lv[k - 2]))
+        choch[points[k[bullish]]] = 1
+        level[points[k[bullish]]] = lv[k[bullish] - 1]
+
+        choch = np.where(choch != 0, choch, np.nan)
+        level = np.where(level != 0, level, np.nan)
+        return choch, level
+
+    @classmethod
+    def choch_batch(cls, high: np.ndarray, low: np.ndarray, offsets: np.ndarray):
+        """
+        Swing highs/lows and CHOCH for many tokens stored back to back in one array.
+        Token t owns bars offsets[t]:offsets[t + 1]. Returns (CHOCH, Level) arrays matching
+        bos_choch(ohlc, swing_highs_lows(ohlc)) run on each token separately.
+        """
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        offsets = np.asarray(offsets)
+        starts = offsets[:-1][offsets[:-1] < len(high)]
+
+        # Previous bar of the same token (NaN on each token's first bar)
+        prev_high = np.r_[np.nan, high[:-1]]
+        prev_low = np.r_[np.nan, low[:-1]]
+        prev_high[starts] = np.nan
+        prev_low[starts] = np.nan
+        highlow = np.where(high > prev_high, 1, np.where(low < prev_low, -1, np.nan))
+        swing_level = np.where(~np.isnan(highlow), np.where(highlow == 1, high, low), np.nan)
+
+        segments = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        return cls._choch_kernel(highlow, swing_level, segments)
+
+# Throughput of bos_choch per token and of choch_batch on synthetic random-walk bars
+def benchmark(n_tokens=1000, n_bars=5000, repeat=3):
+    import time
+
+    rng = np.random.default_rng(0)
+    close = np.exp(np.cumsum(rng.normal(0, 0.02, (n_tokens, n_bars)), axis=1))
+    high = close * (1 + rng.uniform(0, 0.02, close.shape))
+    low = close * (1 - rng.uniform(0, 0.02, close.shape))
+    frames = [DataFrame({"high": high[t], "low": low[t]}) for t in range(n_tokens)]
+    offsets = np.arange(n_tokens + 1) * n_bars
+
+    def best_of(function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    total = n_tokens * n_bars
+    per_token = best_of(lambda: [MarketStructure.bos_choch(f, MarketStructure.swing_highs_lows(f)) for f in frames])
+    batched = best_of(lambda: MarketStructure.choch_batch(high.ravel(), low.ravel(), offsets))
+    print(f"CHOCH on {n_tokens} tokens x {n_bars} bars: per token {total / per_token / 1e6:.1f}M bars/sec "
+          f"({per_token:.2f} s), batched {total / batched / 1e6:.1f}M bars/sec ({batched:.2f} s)")
+
+if __name__ == "__main__":
+    benchmark()
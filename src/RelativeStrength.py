@@ -1,26 +1,35 @@
 import pandas as pd
 import numpy as np
-import talib as ta
-from sqlalchemy import create_engine, text
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from sqlalchemy import text
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import hashlib
 import os
+import sys
+from src.watermarks import IngestionWatermarks
+import src.db as db
+import src.indicators as indicators
+import src.price_cache as price_cache
+import src.timeframes as timeframes
 
 # Load environment variables
 load_dotenv()
 
-# Database configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
+# Directory holding the persisted pair state for incremental runs
+RS_STATE_DIR = os.getenv("RS_STATE_DIR", "src/rs_state")
 
-# Create a SQLAlchemy engine
+# Token pairs scored together in one tile of the full computation (bounds its memory to a few
+# (bars x tile) arrays instead of (bars x all pairs))
+RS_TILE_PAIRS = int(os.getenv("RS_TILE_PAIRS", "8192"))
+
+# Worker processes sharing the pair tiles of the full computation (1 computes them in this process)
+RS_WORKERS = int(os.getenv("RS_WORKERS", "1"))
+
+# Shared SQLAlchemy engine
 def create_db_engine():
-    db_url = f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
-    return create_engine(db_url)
+    return db.get_engine()
 
 # Fetch historical price data from the database
 def fetch_historical_prices(token_id):
@@ -39,22 +48,14 @@ def fetch_historical_prices(token_id):
 # Fetch the latest timestamp for each token
 def fetch_latest_timestamps():
     """Fetch the latest timestamp for each token from the database"""
-    engine = create_db_engine()
-    query = text('''
-        SELECT token_id, MAX(timestamp) as latest_timestamp 
-        FROM Historical_Prices 
-        GROUP BY token_id
-    ''')
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    return df.set_index('token_id')['latest_timestamp'].to_dict()
+    return IngestionWatermarks(create_db_engine()).load().as_dict()
 
 # Calculate RSI and EMA trend
 def calculate_rsi_ema_trend(prices):
     """Calculate RSI and EMA trend for a given price series"""
     close_array = np.asarray(prices)
-    rsi = ta.RSI(close_array, timeperiod=14)
-    rsi_ema = ta.EMA(rsi, timeperiod=3)
+    rsi = indicators.rsi(close_array, 14)
+    rsi_ema = indicators.ema(rsi, 3)
     score = np.full_like(rsi_ema, np.nan, dtype=np.float32)
     score[rsi_ema > 50] = 1
     score[rsi_ema < 50] = 0
@@ -68,87 +69,378 @@ def fetch_all_tokens():
     df = pd.read_sql(query, engine)
     return df['id'].tolist()
 
-def calculate_relative_strength():
-    """Calculate relative strength for all tokens"""
-    tokens = fetch_all_tokens()
-    latest_timestamps = fetch_latest_timestamps()
-    prices_df = pd.DataFrame()
-
-    # Fetch historical prices for all tokens
-    for token in tokens:
-        df = fetch_historical_prices(token)
-        if not df.empty and len(df) >= 14:  # Ensure at least 14 days of data
-            df.set_index('timestamp', inplace=True)
-            # Filter data up to the latest timestamp for the token
-            latest_timestamp = latest_timestamps.get(token)
-            if latest_timestamp:
-                df = df[df.index <= latest_timestamp]
-            prices_df[token] = df['close']
-        #else:
-        #    print(f"Skipping token {token}: insufficient data")
-
-    # Calculate pairwise ratios
-    ratio_data = {}
+# Index of the first non-NaN row in each column (number of rows if the column is all NaN)
+def _first_valid_rows(values):
+    valid = ~np.isnan(values)
+    first = valid.argmax(axis=0)
+    first[~valid.any(axis=0)] = values.shape[0]
+    return first
+
+# Shift every column up by its offset (or back down with inverse=True), padding with NaN
+def _shift_columns(values, offsets, inverse=False):
+    cols = np.flatnonzero(offsets)
+    if len(cols) == 0:
+        return values
+    rows = np.arange(values.shape[0])[:, None]
+    rows = rows - offsets[None, cols] if inverse else rows + offsets[None, cols]
+    valid = (rows >= 0) & (rows < values.shape[0])
+    shifted = values[np.clip(rows, 0, values.shape[0] - 1), cols[None, :]]
+    values = values.copy()
+    values[:, cols] = np.where(valid, shifted, np.nan)
+    return values
+
+# Calculate RSI and EMA trend for every column of a (T, P) price matrix at once
+def calculate_rsi_ema_trend_matrix(prices, rsi_period=14, ema_period=3):
+    """Column-wise equivalent of calculate_rsi_ema_trend for a 2-D price matrix"""
+    prices = np.asarray(prices, dtype=np.float64)
+    # TA-Lib starts each series at its first valid value, so align every column to row 0
+    offsets = _first_valid_rows(prices)
+    # The kernels take one series per row; the transposed views keep the time-major layout
+    rsi = indicators.rsi(_shift_columns(prices, offsets).T, rsi_period)
+    rsi_ema = indicators.ema(rsi, ema_period).T
+    score = np.full(rsi_ema.shape, np.nan, dtype=np.float32)
+    score[rsi_ema > 50] = 1
+    score[rsi_ema < 50] = 0
+    return _shift_columns(score, offsets, inverse=True).astype(np.float32)
+
+def relative_strength_from_prices(prices_df, rsi_period=14, ema_period=3, tile_pairs=None, workers=None):
+    """Calculate relative strength from a wide close-price frame (one column per token)"""
     ids = prices_df.columns
-    for i in range(len(ids)):
-        for j in range(i + 1, len(ids)):
-            token1 = ids[i]
-            token2 = ids[j]
-            ratio_col = f'{token1}_to_{token2}'
-            ratio_data[ratio_col] = prices_df[token1] / prices_df[token2]
-
-    ratio_df = pd.DataFrame(ratio_data, index=prices_df.index)
-
-    # Calculate RSI and EMA trend for each ratio
-    ratio_trend_data = {}
-    for col in ratio_df.columns:
-        ratio_prices = ratio_df[[col]].copy()
-        ratio_prices.columns = ['close']
-        ratio_prices['Signal'] = calculate_rsi_ema_trend(ratio_prices['close'])
-        ratio_trend_data[col] = ratio_prices['Signal']
-
-    ratio_trend_df = pd.DataFrame(ratio_trend_data, index=ratio_df.index).dropna(how='all')
-
-    # Split trend data into individual token contributions
-    split_trend_data = {}
-    i = 0
-    for col in ratio_trend_df.columns:
-        token1, token2 = col.split('_to_')
-        split_trend_data[f'{token1}_{i}'] = ratio_trend_df[col]
-        split_trend_data[f'{token2}_{i}'] = np.where(
-            ratio_trend_df[col].isna(), np.nan, np.where(ratio_trend_df[col] == 0, 1, 0)
-        )
-        i += 1
-
-    split_trend_df = pd.DataFrame(split_trend_data, index=ratio_trend_df.index)
-
-    # Calculate relative strength for each token
-    relative_strength_data = {}
-    grouped_columns = {}
-
-    for col in split_trend_df.columns:
-        base_name = '_'.join(col.split('_')[:-1])
-        if base_name not in grouped_columns:
-            grouped_columns[base_name] = []
-        grouped_columns[base_name].append(col)
-
-    for base_name, cols in grouped_columns.items():
-        relative_strength_data[base_name] = split_trend_df[cols].sum(axis=1, min_count=1)
-
-    relative_strength_df = pd.DataFrame(relative_strength_data, index=split_trend_df.index)
+    if len(ids) < 2:
+        return pd.DataFrame(index=prices_df.index[:0], columns=ids, dtype=int)
+
+    # Score the token pairs (i < j) tile by tile, adding each tile's wins into per-token totals
+    prices = prices_df.to_numpy(dtype=np.float64)
+    tile_pairs = tile_pairs or RS_TILE_PAIRS
+    workers = workers or RS_WORKERS
+    n_pairs = len(ids) * (len(ids) - 1) // 2
+    if workers > 1 and n_pairs > tile_pairs:
+        wins, scored = _parallel_wins(prices, tile_pairs, workers, rsi_period, ema_period)
+    else:
+        pair_i, pair_j = np.triu_indices(len(ids), k=1)
+        wins, scored = _pair_range_wins(prices, pair_i, pair_j, tile_pairs, rsi_period, ema_period)
+    wins[~scored] = np.nan
+
+    # Drop rows where no pair has a trend yet
+    keep = scored.any(axis=1)
 
     # Normalize relative strength to a percentage
-    num_columns = relative_strength_df.shape[1]
-    relative_strength_df = (relative_strength_df / num_columns) * 100
-    relative_strength_df = relative_strength_df.fillna(0).astype(int)
+    relative_strength_df = pd.DataFrame(wins[keep], index=prices_df.index[keep], columns=ids)
+    relative_strength_df = (relative_strength_df / len(ids)) * 100
+    return relative_strength_df.fillna(0).astype(int)
+
+# Per-token (T, N) win totals and "has a scored pair" flags of the given pairs, one tile at a time
+def _pair_range_wins(prices, pair_i, pair_j, tile_pairs, rsi_period=14, ema_period=3):
+    wins = np.zeros(prices.shape)
+    scored = np.zeros(prices.shape, dtype=bool)
+    for start in range(0, len(pair_i), tile_pairs):
+        stop = min(start + tile_pairs, len(pair_i))
+        _accumulate_tile(prices, pair_i[start:stop], pair_j[start:stop], wins, scored, rsi_period, ema_period)
+    return wins, scored
+
+# Worker state: the shared price matrix and the pair list
+_worker = {}
+
+def _init_tile_worker(name, shape, rsi_period, ema_period):
+    block = shared_memory.SharedMemory(name=name)
+    pair_i, pair_j = np.triu_indices(shape[1], k=1)
+    _worker.update(block=block, prices=np.ndarray(shape, dtype=np.float64, buffer=block.buf),
+                   pair_i=pair_i, pair_j=pair_j, rsi_period=rsi_period, ema_period=ema_period)
+
+def _score_pair_range(start, stop, tile_pairs):
+    """Partial win totals of pairs start..stop; float32 holds the counts exactly (they stay below 2^24)"""
+    wins, scored = _pair_range_wins(_worker["prices"], _worker["pair_i"][start:stop], _worker["pair_j"][start:stop],
+                                     tile_pairs, _worker["rsi_period"], _worker["ema_period"])
+    return wins.astype(np.float32), scored
+
+def _parallel_wins(prices, tile_pairs, workers, rsi_period=14, ema_period=3):
+    """Split the pair tiles across a process pool that maps the prices from shared memory.
+
+    Every task covers whole tiles and the partial totals are integer counts added in task order,
+    so the result is the same as the single-process one for any number of workers.
+    """
+    n_pairs = prices.shape[1] * (prices.shape[1] - 1) // 2
+    n_tiles = -(-n_pairs // tile_pairs)
+    # A few tasks per worker keeps them busy when some tiles finish faster
+    bounds = np.linspace(0, n_tiles, min(n_tiles, workers * 4) + 1).round().astype(int) * tile_pairs
+    ranges = [(int(start), int(min(stop, n_pairs))) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    block = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=block.buf)[:] = prices
+        wins = np.zeros(prices.shape)
+        scored = np.zeros(prices.shape, dtype=bool)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_tile_worker,
+                                 initargs=(block.name, prices.shape, rsi_period, ema_period)) as pool:
+            futures = [pool.submit(_score_pair_range, start, stop, tile_pairs) for start, stop in ranges]
+            for future in futures:
+                partial_wins, partial_scored = future.result()
+                wins += partial_wins
+                scored |= partial_scored
+    finally:
+        block.close()
+        block.unlink()
+    return wins, scored
+
+# Score one tile of token pairs and add the wins into the (T, N) totals
+def _accumulate_tile(prices, pair_i, pair_j, wins, scored, rsi_period=14, ema_period=3):
+    """Add the wins of pairs (pair_i, pair_j), ordered like np.triu_indices, into wins/scored in place"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = prices[:, pair_i] / prices[:, pair_j]
+    scores = calculate_rsi_ema_trend_matrix(ratios, rsi_period, ema_period)
+    del ratios
+    pair_scored = ~np.isnan(scores)
+    # Token i wins when the ratio trends up, token j when it trends down
+    up = np.where(pair_scored, scores, 0)
+    down = np.where(pair_scored, 1 - scores, 0)
+    # Pairs sharing a first token are consecutive and their second tokens are consecutive too
+    starts = np.flatnonzero(np.r_[True, pair_i[1:] != pair_i[:-1]])
+    firsts = pair_i[starts]
+    wins[:, firsts] += np.add.reduceat(up, starts, axis=1, dtype=np.float64)
+    scored[:, firsts] |= np.logical_or.reduceat(pair_scored, starts, axis=1)
+    for start, stop in zip(starts, np.r_[starts[1:], len(pair_i)]):
+        seconds = slice(pair_j[start], pair_j[stop - 1] + 1)
+        wins[:, seconds] += down[:, start:stop]
+        scored[:, seconds] |= pair_scored[:, start:stop]
+
+# Reduce (rows, P) pair scores to (rows, N) per-token win counts (NaN where a token has no scored pair)
+def _pair_scores_to_wins(scores, pair_i, pair_j, n_tokens):
+    # Token i wins when the ratio trends up, token j when it trends down
+    scored = ~np.isnan(scores)
+    win_matrix = np.zeros((scores.shape[0], n_tokens, n_tokens), dtype=np.float32)
+    win_matrix[:, pair_i, pair_j] = np.where(scored, scores, 0)
+    win_matrix[:, pair_j, pair_i] = np.where(scored, 1 - scores, 0)
+    scored_matrix = np.zeros(win_matrix.shape, dtype=bool)
+    scored_matrix[:, pair_i, pair_j] = scored
+    scored_matrix[:, pair_j, pair_i] = scored
+    wins = win_matrix.sum(axis=2, dtype=np.float64)
+    wins[~scored_matrix.any(axis=2)] = np.nan
+    return wins
+
+# Stream (token_id, timestamp, close) for every Base token in one query
+def fetch_all_closes(chunk_size=50000):
+    """Fetch close prices for the whole universe as numpy arrays, ordered by token and time"""
+    engine = create_db_engine()
+    query = text('''
+        SELECT token_id, timestamp, close 
+        FROM Historical_Prices 
+        WHERE token_id IN (SELECT id FROM Base_tokens) 
+        ORDER BY token_id, timestamp
+    ''')
+    token_ids, timestamps, closes = [], [], []
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query)
+        for rows in result.partitions(chunk_size):
+            token_chunk, timestamp_chunk, close_chunk = zip(*rows)
+            token_ids.append(np.asarray(token_chunk, dtype=object))
+            timestamps.append(np.asarray(timestamp_chunk, dtype=np.int64))
+            closes.append(np.asarray(close_chunk, dtype=np.float64))
+    if not token_ids:
+        return np.array([], dtype=object), np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    return np.concatenate(token_ids), np.concatenate(timestamps), np.concatenate(closes)
+
+# Pivot long (token_id, timestamp, close) arrays into the wide prices_df layout
+def pivot_closes(tokens, token_ids, timestamps, closes, latest_timestamps=None, min_bars=14):
+    """Return a float64 (timestamp x token) frame for tokens with at least min_bars rows.
+
+    Matches the frame built one column at a time: columns follow `tokens`, the index is the
+    first kept token's timestamps in order, and other tokens are aligned to it (missing bars are NaN).
+    A (token, timestamp) listed more than once keeps its last close.
+    """
+    latest_timestamps = latest_timestamps or {}
+    token_index = pd.Index(tokens)
+    cols = token_index.get_indexer(token_ids)
+    known = cols >= 0
+    # A bar listed twice counts once and keeps its last close, as in the price cache
+    known[known] = ~pd.DataFrame({"col": cols[known], "timestamp": timestamps[known]}).duplicated(keep="last").to_numpy()
+    counts = np.bincount(cols[known], minlength=len(tokens))
+
+    # Ensure at least 14 days of data, then filter data up to the latest timestamp for the token
+    cutoffs = np.array([latest_timestamps.get(token) or np.iinfo(np.int64).max for token in tokens], dtype=np.int64)
+    kept = counts >= min_bars
+    rows = known & kept[np.where(known, cols, 0)]
+    rows &= timestamps <= cutoffs[np.where(known, cols, 0)]
+    cols, row_timestamps, row_closes = cols[rows], timestamps[rows], closes[rows]
+
+    kept_cols = np.flatnonzero(kept)
+    if len(kept_cols) == 0:
+        return pd.DataFrame()
+    index = pd.Index(np.sort(row_timestamps[cols == kept_cols[0]]), name='timestamp')
+    matrix = np.full((len(index), len(kept_cols)), np.nan)
+    positions = index.get_indexer(row_timestamps)
+    aligned = positions >= 0
+    column_of = np.full(len(tokens), -1)
+    column_of[kept_cols] = np.arange(len(kept_cols))
+    matrix[positions[aligned], column_of[cols[aligned]]] = row_closes[aligned]
+    return pd.DataFrame(matrix, index=index, columns=token_index[kept_cols])
+
+# Build the wide close-price frame (one column per token) from the database
+def load_prices(timeframe="1d"):
+    """Load close prices for every token with at least 14 bars of the timeframe"""
+    tokens = fetch_all_tokens()
+    if timeframe != "1d":
+        # Intraday closes come from the hourly table (resampled for 4h)
+        bars = timeframes.load_ohlc(timeframe, columns=["token_id", "timestamp", "close"])
+        token_ids = bars["token_id"].to_numpy(dtype=object)
+        timestamps = bars["timestamp"].to_numpy(dtype=np.int64)
+        closes = bars["close"].to_numpy(dtype=np.float64)
+        return pivot_closes(tokens, token_ids, timestamps, closes)
+    if price_cache.available():
+        # Pull only the new bars into the local cache, then read the closes from it
+        latest_timestamps = price_cache.refresh().as_dict()
+        cached = price_cache.load(columns=["token_id", "timestamp", "close"])
+        token_ids = cached["token_id"].to_numpy(dtype=object)
+        timestamps = cached["timestamp"].to_numpy(dtype=np.int64)
+        closes = cached["close"].to_numpy(dtype=np.float64)
+    else:
+        latest_timestamps = fetch_latest_timestamps()
+        token_ids, timestamps, closes = fetch_all_closes()
+    return pivot_closes(tokens, token_ids, timestamps, closes, latest_timestamps)
+
+def calculate_relative_strength(timeframe="1d"):
+    """Calculate relative strength for all tokens"""
+    return relative_strength_from_prices(load_prices(timeframe))
+
+# Incremental relative strength: per-pair RSI/EMA state persisted between daily runs
+def _new_pair_state(n_pairs):
+    return {
+        "bars": np.full(n_pairs, -1, dtype=np.int64),  # Bars seen since the pair's first valid ratio
+        "prev": np.zeros(n_pairs),
+        "gain": np.zeros(n_pairs),
+        "loss": np.zeros(n_pairs),
+        "ema": np.zeros(n_pairs),
+        "rows": 0,
+        "history": "",
+        "strength": np.zeros(0),
+        "strength_row": -1,
+    }
+
+def _advance_pair_state(state, ratios, rsi_period=14, ema_period=3):
+    """Advance every pair's Wilder RSI and EMA state by one bar and return the pair scores"""
+    bars = np.where(state["bars"] >= 0, state["bars"] + 1, np.where(np.isnan(ratios), -1, 0))
+    diff = ratios - state["prev"]
+    state["prev"] = np.where(bars >= 0, ratios, state["prev"])
+
+    # Same operation order as indicators.rsi: seed with a plain average, then Wilder smoothing
+    smooth = bars > rsi_period
+    loss = np.where(smooth, state["loss"] * (rsi_period - 1), state["loss"])
+    gain = np.where(smooth, state["gain"] * (rsi_period - 1), state["gain"])
+    down = diff < 0
+    loss = np.where((bars >= 1) & down, loss - diff, loss)
+    gain = np.where((bars >= 1) & ~down, gain + diff, gain)
+    has_rsi = bars >= rsi_period
+    state["loss"] = np.where(has_rsi, loss * (1.0 / rsi_period), loss)
+    state["gain"] = np.where(has_rsi, gain * (1.0 / rsi_period), gain)
+    total = state["gain"] + state["loss"]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(total > 0, 100.0 * (state["gain"] / total), 0.0)
+
+    # Same operation order as indicators.ema: seed with the average of the first values
+    ema_start = rsi_period + ema_period - 1
+    ema = np.where(has_rsi & (bars <= ema_start), state["ema"] + rsi, state["ema"])
+    ema = np.where(bars == ema_start, ema / ema_period, ema)
+    ema = np.where(bars > ema_start, ((rsi - ema) * (2.0 / (ema_period + 1))) + ema, ema)
+    state["ema"] = ema
+    state["bars"] = bars
+
+    score = np.full(len(ratios), np.nan, dtype=np.float32)
+    score[(bars >= ema_start) & (ema > 50)] = 1
+    score[(bars >= ema_start) & (ema < 50)] = 0
+    return score
 
-    return relative_strength_df
+def _universe_hash(ids):
+    return hashlib.sha1("\n".join(ids).encode()).hexdigest()[:16]
+
+def _history_hash(prices):
+    return hashlib.sha1(np.ascontiguousarray(prices).tobytes()).hexdigest()
+
+def _load_pair_state(path, prices):
+    """Load persisted pair state, or None if it is missing or the stored history has changed"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        state = {key: stored[key] for key in stored.files}
+    state["rows"] = int(state["rows"])
+    state["history"] = str(state["history"])
+    state["strength_row"] = int(state["strength_row"])
+    if state["rows"] > len(prices) or _history_hash(prices[:state["rows"]]) != state["history"]:
+        return None
+    return state
+
+def _save_pair_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Only the current universe's state is kept
+    for name in os.listdir(os.path.dirname(path)):
+        if name.startswith("rs_state_") and os.path.join(os.path.dirname(path), name) != path:
+            os.remove(os.path.join(os.path.dirname(path), name))
+    np.savez(path, **state)
+
+def _advance_rows(state, prices, stop, pair_i, pair_j):
+    """Advance the pair state over rows state["rows"]..stop of the price matrix"""
+    for t in range(state["rows"], stop):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = _advance_pair_state(state, prices[t, pair_i] / prices[t, pair_j])
+        if not np.isnan(scores).all():
+            state["strength"] = _pair_scores_to_wins(scores[None, :], pair_i, pair_j, prices.shape[1])[0]
+            state["strength_row"] = t
+    state["rows"] = max(state["rows"], stop)
+    return state
+
+def calculate_todays_relative_strength(prices_df, verify=False, timeframe="1d"):
+    """Return the latest relative strength row, advancing the persisted pair state by the new bars only.
+
+    The saved state stops at the last closed bar: the latest candle is rewritten by every ingestion
+    run until it closes, so it is applied on top of the checkpoint each time instead of saved.
+    """
+    ids = list(prices_df.columns)
+    if len(ids) < 2:
+        return relative_strength_from_prices(prices_df).iloc[-1]
+
+    prices = prices_df.to_numpy(dtype=np.float64)
+    # Intraday timeframes keep their state in a subdirectory so they don't evict the daily one
+    state_dir = RS_STATE_DIR if timeframe == "1d" else os.path.join(RS_STATE_DIR, timeframe)
+    path = os.path.join(state_dir, f"rs_state_{_universe_hash(ids)}.npz")
+    pair_i, pair_j = np.triu_indices(len(ids), k=1)
+
+    # A new universe or a rewritten closed history starts again from the first bar
+    closed = len(prices) - 1
+    state = _load_pair_state(path, prices[:closed])
+    if state is None:
+        state = _new_pair_state(len(pair_i))
+    _advance_rows(state, prices, closed, pair_i, pair_j)
+    state["history"] = _history_hash(prices[:closed])
+    _save_pair_state(path, state)
+
+    # The latest (possibly still open) bar goes on a copy of the checkpoint
+    state = {key: (value.copy() if isinstance(value, np.ndarray) else value) for key, value in state.items()}
+    _advance_rows(state, prices, len(prices), pair_i, pair_j)
+
+    if state["strength_row"] < 0:
+        return relative_strength_from_prices(prices_df).iloc[-1]
+    todays_data = pd.Series(state["strength"], index=prices_df.columns, name=prices_df.index[state["strength_row"]])
+    todays_data = ((todays_data / len(ids)) * 100).fillna(0).astype(int)
+
+    if verify:
+        full_data = relative_strength_from_prices(prices_df).iloc[-1]
+        if todays_data.equals(full_data) and todays_data.name == full_data.name:
+            print("Incremental relative strength matches the full recompute.")
+        else:
+            print("Incremental relative strength differs from the full recompute. Discarding saved state.")
+            os.remove(path)
+            return full_data
+    return todays_data
+
+# File holding the top token IDs of a timeframe's ranking (read by main.py)
+def top_tokens_path(timeframe="1d"):
+    return 'src/top_tokens.txt' if timeframe == "1d" else f'src/top_tokens_{timeframe}.txt'
 
 # Print the top-ranked tokens based on relative strength and save top 5 token IDs to a file
-def print_top_ranked_tokens():
+def print_top_ranked_tokens(incremental=True, verify=False, timeframe="1d"):
     """Print the top-ranked tokens based on relative strength and save top 5 token IDs to a file"""
-    relative_strength_df = calculate_relative_strength()
-    todays_data = relative_strength_df.iloc[-1]
+    if incremental:
+        todays_data = calculate_todays_relative_strength(load_prices(timeframe), verify=verify, timeframe=timeframe)
+    else:
+        todays_data = calculate_relative_strength(timeframe).iloc[-1]
     todays_top_tokens = todays_data.sort_values(ascending=False).head(3)
 
     # Fetch token names from the database
@@ -168,12 +460,64 @@ def print_top_ranked_tokens():
 
     # Save the top 5 token IDs to a file
     top_5_tokens = todays_top_tokens.head(5).index.tolist()
-    with open('src/top_tokens.txt', 'w') as f:
+    top_tokens_file = top_tokens_path(timeframe)
+    with open(top_tokens_file, 'w') as f:
         for token_id in top_5_tokens:
             f.write(f"{token_id}\n")
 
     #print("Top 5 token IDs saved to 'top_tokens.txt'")
 
+# One relative strength computation on synthetic prices, reporting time and peak RSS (run in a fresh process)
+def _peak_rss_run(n_tokens, bars, tile_pairs):
+    import resource
+    import time
+    rng = np.random.default_rng(0)
+    prices = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.05, (bars, n_tokens)), axis=0)))
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    relative_strength_from_prices(prices, tile_pairs=tile_pairs)
+    seconds = time.perf_counter() - start
+    print(seconds, before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+# Peak RSS of the full computation against the universe size, tiled and with every pair in one tile
+def benchmark_memory(token_counts=(100, 250, 500, 1000), bars=365, tile_pairs=RS_TILE_PAIRS, single_tile_up_to=500):
+    import subprocess
+    for n_tokens in token_counts:
+        n_pairs = n_tokens * (n_tokens - 1) // 2
+        # One tile holding every pair is the old O(N^2 * T) footprint, so it only runs where it fits
+        for label, tile in ((f"tiles of {tile_pairs}", tile_pairs), ("one tile", n_pairs)):
+            if tile == n_pairs and n_tokens > single_tile_up_to:
+                continue
+            probe = f"import src.RelativeStrength as RS; RS._peak_rss_run({n_tokens}, {bars}, {tile})"
+            seconds, before, peak = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                                   check=True).stdout.split()[-3:]
+            print(f"N={n_tokens} ({n_pairs} pairs) x {bars} bars, {label}: {float(seconds):.1f} s, "
+                  f"peak RSS {int(peak) / 1024:.0f} MB ({(int(peak) - int(before)) / 1024:.0f} MB above the loaded prices)")
+
+# Time the full computation with 1, 2, 4 and 8 worker processes and check they all agree
+def benchmark_workers(token_counts=(250, 1000), worker_counts=(1, 2, 4, 8), bars=365, tile_pairs=RS_TILE_PAIRS):
+    import time
+    rng = np.random.default_rng(0)
+    for n_tokens in token_counts:
+        prices = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.05, (bars, n_tokens)), axis=0)))
+        expected = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            result = relative_strength_from_prices(prices, tile_pairs=tile_pairs, workers=workers)
+            seconds = time.perf_counter() - start
+            if expected is None:
+                expected, serial_seconds = result, seconds
+            print(f"N={n_tokens} x {bars} bars, {workers} workers: {seconds:.1f} s ({serial_seconds / seconds:.1f}x), "
+                  f"{'same' if result.equals(expected) else 'DIFFERENT'} result as 1 worker")
+    print(f"({os.cpu_count()} CPU cores available)")
+
 # Main execution
 if __name__ == "__main__":
-    print_top_ranked_tokens()
\ No newline at end of file
+    if "--benchmark-memory" in sys.argv:
+        benchmark_memory()
+        sys.exit()
+    if "--benchmark-workers" in sys.argv:
+        benchmark_workers()
+        sys.exit()
+    timeframe = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--timeframe=")), "1d")
+    print_top_ranked_tokens(incremental="--full" not in sys.argv, verify="--verify" in sys.argv, timeframe=timeframe)
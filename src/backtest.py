@@ -1,232 +1,202 @@
 import pandas as pd
 import numpy as np
 # import plotly.graph_objects as go
-from sqlalchemy import create_engine
 from datetime import datetime, timedelta
-import RelativeStrength as RelativeStrength
-import BOSCHOCH as BOSCHOCH
-import pandas_ta as ta
+import src.RelativeStrength as RelativeStrength
+import src.BOSCHOCH as BOSCHOCH
+import src.indicators as indicators
+import src.db as db
+import src.price_cache as price_cache
+from src.ohlc_store import OHLCStore
 from dotenv import load_dotenv
 import os
+import sys
 
 # Load environment variables
 load_dotenv()
 
-# Database configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
-
-# Database connection
-db_connection_str = f'mysql+pymysql://{DB_CONFIG["user"]}:{DB_CONFIG["password"]}@{DB_CONFIG["host"]}/{DB_CONFIG["database"]}'
-engine = create_engine(db_connection_str)
-
-# Helper function for RMA
-def ta_rma(series, length):
-    return series.ewm(alpha=1 / length, min_periods=length, adjust=False).mean()
-
-# DEMA-DMI function
-def dema_dmi(close, high, low, len_dema=5, adx_smoothing_len=3, di_len=5):
-    demah = ta.dema(high, length=len_dema)
-    demal = ta.dema(low, length=len_dema)
-    u = np.diff(demah, prepend=np.nan)
-    d = -np.diff(demal, prepend=np.nan)
-    p = np.where((u > d) & (u > 0), u, 0)
-    m = np.where((d > u) & (d > 0), d, 0)
-    p = pd.Series(p, index=close.index)
-    m = pd.Series(m, index=close.index)
-    tr = ta.true_range(high, low, close)
-    t = ta_rma(tr, di_len)
-    plus = 100 * ta_rma(p, di_len) / t
-    minus = 100 * ta_rma(m, di_len) / t
-    plus = pd.Series(np.nan_to_num(plus), index=close.index)
-    minus = pd.Series(np.nan_to_num(minus), index=close.index)
-    sum_dm = plus + minus
-    adx_numerator = np.abs(plus - minus) / np.where(sum_dm == 0, 1, sum_dm)
-    adx_series = pd.Series(adx_numerator, index=close.index)
-    adx = 100 * ta_rma(adx_series, adx_smoothing_len)
-    adx_rising = adx > adx.shift(1)
-    dmil = (plus > minus) & adx_rising
-    dmis = minus > plus
-    signal = np.where(dmil & ~dmis, 1, np.where(dmis, -1, np.nan))
-    return pd.Series(signal, index=close.index).ffill()
+# Indicator settings used by the live strategy
+DEFAULT_PARAMS = {"rsi_period": 14, "ema_period": 3, "len_dema": 5, "adx_smoothing_len": 3, "di_len": 5}
 
 # Relative strength function (unchanged)
-def calculate_relative_strength_up_to_date(historical_data, end_timestamp):
-    tokens = RelativeStrength.fetch_all_tokens()
+def calculate_relative_strength_up_to_date(store, end_timestamp, tokens=None):
+    if tokens is None:
+        tokens = RelativeStrength.fetch_all_tokens()
     prices_df = pd.DataFrame()
     for token in tokens:
-        df = historical_data[historical_data["token_id"] == token][["timestamp", "close"]]
-        if not df.empty and len(df) >= 14:
-            df.set_index("timestamp", inplace=True)
-            df = df[df.index <= end_timestamp]
-            prices_df[token] = df["close"]
+        if store.count(token, end=end_timestamp) >= 14:
+            prices_df[token] = store.closes(token, end=end_timestamp)
     if prices_df.empty:
         return pd.DataFrame()
-    ratio_data = {}
-    ids = prices_df.columns
-    for i in range(len(ids)):
-        for j in range(i + 1, len(ids)):
-            token1 = ids[i]
-            token2 = ids[j]
-            ratio_col = f'{token1}_to_{token2}'
-            ratio_data[ratio_col] = prices_df[token1] / prices_df[token2]
-    ratio_df = pd.DataFrame(ratio_data, index=prices_df.index)
-    ratio_trend_data = {}
-    for col in ratio_df.columns:
-        ratio_prices = ratio_df[[col]].copy()
-        ratio_prices.columns = ['close']
-        ratio_prices['Signal'] = RelativeStrength.calculate_rsi_ema_trend(ratio_prices['close'])
-        ratio_trend_data[col] = ratio_prices['Signal']
-    ratio_trend_df = pd.DataFrame(ratio_trend_data, index=ratio_df.index).dropna(how='all')
-    split_trend_data = {}
-    i = 0
-    for col in ratio_trend_df.columns:
-        token1, token2 = col.split('_to_')
-        split_trend_data[f'{token1}_{i}'] = ratio_trend_df[col]
-        split_trend_data[f'{token2}_{i}'] = np.where(
-            ratio_trend_df[col].isna(), np.nan, np.where(ratio_trend_df[col] == 0, 1, 0)
-        )
-        i += 1
-    split_trend_df = pd.DataFrame(split_trend_data, index=ratio_trend_df.index)
-    relative_strength_data = {}
-    grouped_columns = {}
-    for col in split_trend_df.columns:
-        base_name = '_'.join(col.split('_')[:-1])
-        if base_name not in grouped_columns:
-            grouped_columns[base_name] = []
-        grouped_columns[base_name].append(col)
-    for base_name, cols in grouped_columns.items():
-        relative_strength_data[base_name] = split_trend_df[cols].sum(axis=1, min_count=1)
-    relative_strength_df = pd.DataFrame(relative_strength_data, index=split_trend_df.index)
-    num_columns = relative_strength_df.shape[1]
-    relative_strength_df = (relative_strength_df / num_columns) * 100
-    return relative_strength_df.fillna(0).astype(int)
+    return RelativeStrength.relative_strength_from_prices(prices_df)
 
-# Backtest function
-def run_backtest():
-    # Define backtest period: last 6 months ending March 22, 2025
-    end_date = datetime(2025, 3, 22)
-    start_date = end_date - timedelta(days=180)
-    print(f"Backtesting from {start_date} to {end_date}")
+# Calculate DEMA-DMI and CHOCH signals for one token's full, time-sorted history
+def calculate_token_signals(token_data, len_dema=5, adx_smoothing_len=3, di_len=5):
+    signal = indicators.dema_dmi(token_data["close"], token_data["high"], token_data["low"], len_dema, adx_smoothing_len, di_len)
+    ohlc = token_data[["open", "high", "low", "close"]]
+    swing_data = BOSCHOCH.MarketStructure.swing_highs_lows(ohlc, swing_length=1)
+    choch_data = BOSCHOCH.MarketStructure.bos_choch(ohlc, swing_data, close_break=True)
+    return signal, choch_data["CHOCH"].to_numpy()
 
-    # Fetch all historical price data
-    query = "SELECT token_id, timestamp, open, high, low, close FROM Historical_Prices"
-    historical_data = pd.read_sql(query, engine)
-    historical_data["timestamp"] = pd.to_datetime(historical_data["timestamp"], unit="s")
+# The same signals for every token of a store in one batched pass
+def calculate_store_signals(store, len_dema=5, adx_smoothing_len=3, di_len=5):
+    """{token_id: (DEMA-DMI signal, CHOCH)} over each token's full history"""
+    slices = sorted(store.slices.items(), key=lambda item: item[1][0])
+    if not slices:
+        return {}
+    # Tokens sit back to back in the store's arrays
+    first, last = slices[0][1][0], slices[-1][1][1]
+    offsets = np.array([start for _, (start, _) in slices] + [last]) - first
+    high, low, close = (store.columns[column][first:last] for column in ("high", "low", "close"))
+    signal = indicators.dema_dmi_batch(close, high, low, offsets, len_dema, adx_smoothing_len, di_len)
+    choch, _ = BOSCHOCH.MarketStructure.choch_batch(high, low, offsets)
+    return {token_id: (signal[start - first:stop - first], choch[start - first:stop - first]) for token_id, (start, stop) in slices}
 
-    # Fetch Bitcoin_PH data
-    btc_query = "SELECT timestamp, close FROM Bitcoin_PH WHERE btc_id = 'bitcoin'"
-    btc_data = pd.read_sql(btc_query, engine)
-    btc_data["timestamp"] = pd.to_datetime(btc_data["timestamp"], unit="s")
-    btc_data = btc_data[(btc_data["timestamp"].dt.date >= start_date.date()) & 
-                        (btc_data["timestamp"].dt.date <= end_date.date())]
-    btc_data = btc_data.sort_values("timestamp")
+class DailyRecomputeMarket:
+    """Market view that recomputes relative strength and signals from the history up to each day"""
 
-    # Calculate buy-and-hold Bitcoin equity
-    initial_balance = 1000
-    btc_equity_curve = []
-    btc_timestamps = []
-    if not btc_data.empty:
-        btc_initial_price = btc_data["close"].iloc[0]
-        btc_shares = initial_balance / btc_initial_price
-        btc_equity_curve = [btc_shares * close for close in btc_data["close"]]
-        btc_timestamps = btc_data["timestamp"]
-    else:
-        print("Warning: No Bitcoin_PH data available for the period.")
+    def __init__(self, store, tokens):
+        self.store = store
+        self.tokens = tokens
 
-    # Get unique dates in the data
-    unique_dates = sorted(historical_data["timestamp"].dt.date.unique())
-    backtest_dates = [d for d in unique_dates if start_date.date() <= d <= end_date.date()]
-    if not backtest_dates:
-        raise ValueError("No data available for the backtest period.")
+    def top_tokens(self, timestamp, count):
+        rs_df = calculate_relative_strength_up_to_date(self.store, timestamp, self.tokens)
+        if rs_df.empty:
+            return None
+        return rs_df.iloc[-1].sort_values(ascending=False).head(count).index.tolist()
+
+    def last_price(self, token_id, timestamp, column="close"):
+        values = self.store.window(token_id, end=timestamp)[column]
+        return None if len(values) == 0 else values[-1]
+
+    def signals(self, token_id, timestamp):
+        """Return (previous DEMA-DMI signal, latest CHOCH, latest open), or None with under 2 bars"""
+        token_data = self.store.frame(token_id, end=timestamp)
+        if len(token_data) < 2:
+            return None
+        signal, choch = calculate_token_signals(token_data)
+        i = len(token_data) - 1
+        return signal[i - 1], choch[i], token_data["open"].iloc[i]
+
+class WalkForwardMarket:
+    """Market view that computes each series once over the full history and reads day t from row t.
+
+    RSI/EMA, DEMA-DMI and CHOCH only look backward, so the value at row t of the full-history
+    series equals the last value of the series recomputed on the history up to t. Relative
+    strength is recomputed only when the token universe (tokens with at least 14 bars) changes.
 
-    # Initialize portfolio
+    `params` overrides the indicator settings (rsi_period, ema_period, len_dema, adx_smoothing_len,
+    di_len), and `rs_cache` lets several markets with the same RSI/EMA settings share RS frames.
+    """
+
+    def __init__(self, store, tokens, params=None, rs_cache=None):
+        self.store = store
+        self.tokens = tokens
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.rs_cache = rs_cache if rs_cache is not None else {}
+        self._universe = None
+        self._rs_df = None
+        self._signals = None
+
+    def top_tokens(self, timestamp, count):
+        universe = [token for token in self.tokens if self.store.count(token, end=timestamp) >= 14]
+        if not universe:
+            return None
+        if universe != self._universe:
+            key = (tuple(universe), self.params["rsi_period"], self.params["ema_period"])
+            if key not in self.rs_cache:
+                prices_df = pd.DataFrame()
+                for token in universe:
+                    prices_df[token] = self.store.closes(token)
+                self.rs_cache[key] = RelativeStrength.relative_strength_from_prices(
+                    prices_df, self.params["rsi_period"], self.params["ema_period"])
+            self._rs_df = self.rs_cache[key]
+            self._universe = universe
+        rows = self._rs_df.index.searchsorted(timestamp, side="right")
+        if rows == 0:
+            return None
+        return self._rs_df.iloc[rows - 1].sort_values(ascending=False).head(count).index.tolist()
+
+    def last_price(self, token_id, timestamp, column="close"):
+        bars = self.store.count(token_id, end=timestamp)
+        return None if bars == 0 else self.store.window(token_id)[column][bars - 1]
+
+    def signals(self, token_id, timestamp):
+        """Return (previous DEMA-DMI signal, latest CHOCH, latest open), or None with under 2 bars"""
+        bars = self.store.count(token_id, end=timestamp)
+        if bars < 2:
+            return None
+        if self._signals is None:
+            self._signals = calculate_store_signals(
+                self.store, self.params["len_dema"], self.params["adx_smoothing_len"], self.params["di_len"])
+        signal, choch = self._signals[token_id]
+        i = bars - 1
+        return signal[i - 1], choch[i], self.store.window(token_id)["open"][i]
+
+# Simulate the strategy day by day against a market view
+def simulate(market, backtest_dates, initial_balance=1000, max_positions=3, verbose=True):
     balance = initial_balance
     portfolio = {}  # token_id: {'shares': float, 'entry_price': float, 'entry_date': date}
     equity_curve = []
     timestamps = []
-    MAX_POSITIONS = 3
+    trades = []  # (date, action, token_id, price)
+    MAX_POSITIONS = max_positions
+    log = print if verbose else (lambda *args: None)
 
-    # Simulate day-by-day backtest
     for idx, current_date in enumerate(backtest_dates):
         current_timestamp = pd.Timestamp(current_date).replace(hour=23, minute=59, second=59)
-        print(f"Processing {current_date}")
+        log(f"Processing {current_date}")
 
         # Step 1: Calculate pre-trade equity (using previous day's close)
         pre_trade_equity = balance
         if idx > 0:  # Skip first day as no previous data
             prev_timestamp = pd.Timestamp(backtest_dates[idx - 1]).replace(hour=23, minute=59, second=59)
-            historical_prev = historical_data[historical_data["timestamp"] <= prev_timestamp]
             for token_id in portfolio:
-                token_data = historical_prev[historical_prev["token_id"] == token_id]
-                if not token_data.empty:
-                    prev_close = token_data["close"].iloc[-1]
+                prev_close = market.last_price(token_id, prev_timestamp)
+                if prev_close is not None:
                     pre_trade_equity += portfolio[token_id]["shares"] * prev_close
 
         # Step 2: Calculate relative strength and get top 3 tokens
-        historical_up_to_date = historical_data[historical_data["timestamp"] <= current_timestamp]
-        if historical_up_to_date.empty:
-            equity_curve.append(pre_trade_equity if idx > 0 else balance)
-            timestamps.append(current_timestamp)
-            continue
-
-        rs_df = calculate_relative_strength_up_to_date(historical_up_to_date, current_timestamp)
-        if rs_df.empty:
+        top_tokens = market.top_tokens(current_timestamp, MAX_POSITIONS)
+        if top_tokens is None:
             equity_curve.append(pre_trade_equity if idx > 0 else balance)
             timestamps.append(current_timestamp)
             continue
 
-        todays_data = rs_df.iloc[-1]
-        top_tokens = todays_data.sort_values(ascending=False).head(MAX_POSITIONS).index.tolist()
-
         # Step 3: Close positions not in top 3 (swapping logic)
         current_positions = set(portfolio.keys())
         desired_positions = set(top_tokens)
         for token_id in current_positions - desired_positions:
             if token_id in portfolio:
-                token_data = historical_up_to_date[historical_up_to_date["token_id"] == token_id]
-                if not token_data.empty:
-                    token_data = token_data.sort_values("timestamp").reset_index(drop=True)
-                    exit_price = token_data["open"].iloc[-1]
+                exit_price = market.last_price(token_id, current_timestamp, "open")
+                if exit_price is not None:
                     shares = portfolio[token_id]["shares"]
                     balance += shares * exit_price
-                    print(f"Swapped out {token_id} at ${exit_price:.8f} on {current_date}")
+                    log(f"Swapped out {token_id} at ${exit_price:.8f} on {current_date}")
+                    trades.append((current_date, "SWAP_OUT", token_id, exit_price))
                     del portfolio[token_id]
 
         # Step 4: Evaluate signals and manage up to 3 positions
         entry_occurred = False
         for token_id in top_tokens:
-            token_data = historical_up_to_date[historical_up_to_date["token_id"] == token_id]
-            if token_data.empty or len(token_data) < 2:
+            token_signals = market.signals(token_id, current_timestamp)
+            if token_signals is None:
                 continue
-            token_data = token_data.sort_values("timestamp").reset_index(drop=True)
-            signal = dema_dmi(token_data["close"], token_data["high"], token_data["low"])
-            i = len(token_data) - 1
-            previous_signal = signal.iloc[i-1] if i > 0 else np.nan
-            latest_close = token_data["close"].iloc[i]
-
-            # Calculate CHOCH
-            ohlc = token_data[["open", "high", "low", "close"]]
-            swing_data = BOSCHOCH.MarketStructure.swing_highs_lows(ohlc, swing_length=1)
-            choch_data = BOSCHOCH.MarketStructure.bos_choch(ohlc, swing_data, close_break=True)
-            latest_choch = choch_data["CHOCH"].iloc[i]
+            previous_signal, latest_choch, latest_open = token_signals
 
             # Determine action
             if token_id in portfolio:
                 if previous_signal == -1 or latest_choch == -1:
-                    exit_price = token_data["open"].iloc[i]
+                    exit_price = latest_open
                     shares = portfolio[token_id]["shares"]
                     balance += shares * exit_price
-                    print(f"Exited {token_id} at ${exit_price:.8f} on {current_date} (Exit Signal)")
+                    log(f"Exited {token_id} at ${exit_price:.8f} on {current_date} (Exit Signal)")
+                    trades.append((current_date, "EXIT", token_id, exit_price))
                     del portfolio[token_id]
             else:
                 if (previous_signal == 1 and pd.isna(latest_choch)) or (latest_choch == 1 and previous_signal == 1):
                     if len(portfolio) < MAX_POSITIONS:
-                        entry_price = token_data["open"].iloc[i]
+                        entry_price = latest_open
                         shares = (balance / (MAX_POSITIONS - len(portfolio))) / entry_price
                         portfolio[token_id] = {
                             "shares": shares,
@@ -234,7 +204,8 @@ def run_backtest():
                             "entry_date": current_date
                         }
                         balance -= shares * entry_price
-                        print(f"Entered {token_id} at ${entry_price:.8f} on {current_date}")
+                        log(f"Entered {token_id} at ${entry_price:.8f} on {current_date}")
+                        trades.append((current_date, "ENTRY", token_id, entry_price))
                         entry_occurred = True
 
         # Step 5: Update equity curve
@@ -244,19 +215,72 @@ def run_backtest():
         else:
             daily_equity = balance
             for token_id in portfolio:
-                token_data = historical_up_to_date[historical_up_to_date["token_id"] == token_id]
-                if not token_data.empty:
-                    latest_close = token_data["close"].iloc[-1]
+                latest_close = market.last_price(token_id, current_timestamp)
+                if latest_close is not None:
                     daily_equity += portfolio[token_id]["shares"] * latest_close
             equity_curve.append(daily_equity if idx > 0 else balance)  # Use balance for first day
         timestamps.append(current_timestamp)
 
+    return balance, portfolio, equity_curve, timestamps, trades
+
+# Fetch all historical price data
+def load_historical_data():
+    price_cache.refresh()
+    return price_cache.load(parse_dates=True)
+
+# Get the dates in the data that fall inside the backtest period
+def get_backtest_dates(historical_data, start_date, end_date):
+    unique_dates = sorted(historical_data["timestamp"].dt.date.unique())
+    backtest_dates = [d for d in unique_dates if start_date.date() <= d <= end_date.date()]
+    if not backtest_dates:
+        raise ValueError("No data available for the backtest period.")
+    return backtest_dates
+
+# Backtest function
+def run_backtest(walk_forward=True):
+    # Define backtest period: last 6 months ending March 22, 2025
+    end_date = datetime(2025, 3, 22)
+    start_date = end_date - timedelta(days=180)
+    print(f"Backtesting from {start_date} to {end_date}")
+
+    # Fetch all historical price data
+    historical_data = load_historical_data()
+
+    # Fetch Bitcoin_PH data
+    btc_query = "SELECT timestamp, close FROM Bitcoin_PH WHERE btc_id = 'bitcoin'"
+    btc_data = pd.read_sql(btc_query, db.get_engine())
+    btc_data["timestamp"] = pd.to_datetime(btc_data["timestamp"], unit="s")
+    btc_data = btc_data[(btc_data["timestamp"].dt.date >= start_date.date()) & 
+                        (btc_data["timestamp"].dt.date <= end_date.date())]
+    btc_data = btc_data.sort_values("timestamp")
+
+    # Calculate buy-and-hold Bitcoin equity
+    initial_balance = 1000
+    btc_equity_curve = []
+    btc_timestamps = []
+    if not btc_data.empty:
+        btc_initial_price = btc_data["close"].iloc[0]
+        btc_shares = initial_balance / btc_initial_price
+        btc_equity_curve = [btc_shares * close for close in btc_data["close"]]
+        btc_timestamps = btc_data["timestamp"]
+    else:
+        print("Warning: No Bitcoin_PH data available for the period.")
+
+    # Get unique dates in the data
+    backtest_dates = get_backtest_dates(historical_data, start_date, end_date)
+
+    # Simulate day-by-day backtest
+    tokens = RelativeStrength.fetch_all_tokens()
+    market_class = WalkForwardMarket if walk_forward else DailyRecomputeMarket
+    market = market_class(OHLCStore(historical_data), tokens)
+    balance, portfolio, equity_curve, timestamps, trades = simulate(market, backtest_dates, initial_balance)
+
     # Final equity calculation
     final_balance = balance
+    last_timestamp = historical_data["timestamp"].max()
     for token_id in portfolio:
-        token_data = historical_data[historical_data["token_id"] == token_id]
-        if not token_data.empty:
-            final_price = token_data["close"].iloc[-1]
+        final_price = market.last_price(token_id, last_timestamp)
+        if final_price is not None:
             final_balance += portfolio[token_id]["shares"] * final_price
     print(f"Final Portfolio Balance: ${final_balance:.2f}")
 
@@ -286,6 +310,23 @@ def run_backtest():
     )
     fig.show()
     """
+    return final_balance, equity_curve, trades
+
+# Check that the walk-forward engine reproduces the per-day recompute exactly
+def verify_walk_forward(days=30):
+    historical_data = load_historical_data()
+    end_date = datetime(2025, 3, 22)
+    backtest_dates = get_backtest_dates(historical_data, end_date - timedelta(days=days), end_date)
+    tokens = RelativeStrength.fetch_all_tokens()
+    store = OHLCStore(historical_data)
+    expected = simulate(DailyRecomputeMarket(store, tokens), backtest_dates)
+    actual = simulate(WalkForwardMarket(store, tokens), backtest_dates)
+    if expected[4] != actual[4] or expected[2] != actual[2]:
+        raise AssertionError("Walk-forward backtest diverged from the per-day recompute")
+    print(f"Walk-forward backtest matches the per-day recompute ({len(actual[4])} trades over {len(backtest_dates)} days)")
 
 if __name__ == "__main__":
-    run_backtest()
\ No newline at end of file
+    if "--verify" in sys.argv:
+        verify_walk_forward()
+    else:
+        run_backtest(walk_forward="--recompute" not in sys.argv)
@@ -1,82 +1,43 @@
 import pandas as pd
-import pandas_ta as ta
 import numpy as np
 # import plotly.graph_objects as go
-from sqlalchemy import create_engine
+from sqlalchemy import text
 import src.BOSCHOCH as BOSCHOCH
+import src.indicators as indicators
+import src.db as db
 from dotenv import load_dotenv
 import os
 
 # Load environment variables
 load_dotenv()
 
-# Database configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
-
-# Database connection
-db_connection_str = f'mysql+pymysql://{DB_CONFIG["user"]}:{DB_CONFIG["password"]}@{DB_CONFIG["host"]}/{DB_CONFIG["database"]}'
-engine = create_engine(db_connection_str)
-
-# Fetch historical price data
-query = "SELECT token_id, timestamp, open, high, low, close FROM Historical_Prices"
-historical_data = pd.read_sql(query, engine)
-
-# Fetch top tokens
-with open("src/top_tokens.txt", "r") as file:
-    top_tokens = file.read().splitlines()
-
-# Helper function for RMA
-def ta_rma(series, length):
-    return series.ewm(alpha=1 / length, min_periods=length, adjust=False).mean()
-
-# DEMA-DMI function
-def dema_dmi(close, high, low, len_dema=5, adx_smoothing_len=3, di_len=5):
-    demah = ta.dema(high, length=len_dema)
-    demal = ta.dema(low, length=len_dema)
-    
-    u = np.diff(demah, prepend=np.nan)
-    d = -np.diff(demal, prepend=np.nan)
-    
-    p = np.where((u > d) & (u > 0), u, 0)
-    m = np.where((d > u) & (d > 0), d, 0)
-    
-    p = pd.Series(p, index=close.index)
-    m = pd.Series(m, index=close.index)
-    
-    tr = ta.true_range(high, low, close)
-    t = ta_rma(tr, di_len)
-    
-    plus = 100 * ta_rma(p, di_len) / t
-    minus = 100 * ta_rma(m, di_len) / t
-
-    plus = pd.Series(np.nan_to_num(plus), index=close.index)
-    minus = pd.Series(np.nan_to_num(minus), index=close.index)
-    
-    sum_dm = plus + minus
-    adx_numerator = np.abs(plus - minus) / np.where(sum_dm == 0, 1, sum_dm)
-    adx_series = pd.Series(adx_numerator, index=close.index)
-    adx = 100 * ta_rma(adx_series, adx_smoothing_len)
-    
-    adx_rising = adx > adx.shift(1)
-    dmil = (plus > minus) & adx_rising
-    dmis = minus > plus
-
-    signal = np.where(dmil & ~dmis, 1, np.where(dmis, -1, np.nan))
-    return pd.Series(signal, index=close.index).ffill()
-
-# Process each token
-for token_id in top_tokens:
-    token_data = historical_data[historical_data["token_id"] == token_id].copy()
+# Shared database engine (created on first use so importing this module stays side-effect free)
+def get_engine():
+    return db.get_engine()
+
+# Fetch historical price data for one token
+def fetch_token_history(token_id):
+    query = text("SELECT token_id, timestamp, open, high, low, close FROM Historical_Prices WHERE token_id = :token_id ORDER BY timestamp")
+    with get_engine().connect() as conn:
+        return pd.read_sql(query, conn, params={"token_id": token_id})
+
+# Read the token ids saved by RelativeStrength
+def read_top_tokens(path="src/top_tokens.txt"):
+    with open(path, "r") as file:
+        return file.read().splitlines()
+
+# Per-token backtest: DEMA-DMI entries, CHOCH exits and re-entries against buy-and-hold
+def backtest_token(token_id, historical_data=None):
+    """Simulate the single-token strategy; loads the token's history when none is given"""
+    if historical_data is None:
+        token_data = fetch_token_history(token_id)
+    else:
+        token_data = historical_data[historical_data["token_id"] == token_id].copy()
     token_data["timestamp"] = pd.to_datetime(token_data["timestamp"], unit="s")
     token_data = token_data.reset_index(drop=True)
     
     # Calculate DEMA-DMI signal
-    token_data["signal"] = dema_dmi(token_data["close"], token_data["high"], token_data["low"])
+    token_data["signal"] = indicators.dema_dmi(token_data["close"], token_data["high"], token_data["low"])
     
     # Calculate Swing Highs/Lows and CHOCH
     ohlc = token_data[["open", "high", "low", "close"]]
@@ -231,4 +192,21 @@ for token_id in top_tokens:
         xaxis_rangeslider_visible=False
     )
     fig2.show()
-    """
\ No newline at end of file
+    """
+
+    return {
+        "token_id": token_id,
+        "long_entries": long_entries,
+        "long_exits": long_exits,
+        "equity_curve": equity_curve,
+        "buy_hold_equity": buy_hold_equity,
+        "final_balance": final_balance,
+        "final_buy_hold": final_buy_hold,
+    }
+
+# Run the per-token backtest for every token in top_tokens.txt
+def main():
+    return [backtest_token(token_id) for token_id in read_top_tokens()]
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+import threading
+import time
+import os
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME")
+}
+
+# Storage backend: "mysql" (default) or "sqlite", a local database file for offline runs and tests
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "src/rs_algobot.sqlite")
+
+# Connection pool configuration
+POOL_CONFIG = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+}
+
+# Pool metrics for the process: checkouts, total seconds spent waiting for a connection, connections opened
+metrics = {"checkouts": 0, "wait_seconds": 0.0, "connections_opened": 0}
+_metrics_lock = threading.Lock()
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            with _metrics_lock:
+                metrics["wait_seconds"] += time.perf_counter() - start
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Return the process-wide SQLAlchemy engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(database_url(), poolclass=MeteredQueuePool, **POOL_CONFIG, **_connect_args())
+                _register_metrics(engine)
+                _engine = engine
+    return _engine
+
+def database_url(backend=None):
+    backend = backend or DB_BACKEND
+    if backend == "sqlite":
+        return f"sqlite:///{SQLITE_PATH}"
+    if backend != "mysql":
+        raise ValueError(f"Unknown DB_BACKEND {backend!r}; expected 'mysql' or 'sqlite'")
+    return f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
+
+def _connect_args(backend=None):
+    # Pooled SQLite connections are shared by the fetch threads
+    return {"connect_args": {"check_same_thread": False}} if (backend or DB_BACKEND) == "sqlite" else {}
+
+def _register_metrics(engine):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        with _metrics_lock:
+            metrics["connections_opened"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _metrics_lock:
+            metrics["checkouts"] += 1
+
+def pool_status():
+    """Summary line with the pool metrics for this run"""
+    return (
+        f"DB pool: {metrics['connections_opened']} connections opened, "
+        f"{metrics['checkouts']} checkouts, {metrics['wait_seconds']:.3f}s waiting"
+    )
+
+def dispose():
+    """Close every pooled connection (the engine is recreated on next use)"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
@@ -0,0 +1,158 @@
+from bisect import bisect_right
+import json
+import os
+import re
+
+# Token exclusion rules (keywords, regex patterns, deny/allow ids)
+EXCLUSION_RULES_PATH = os.getenv("EXCLUSION_RULES_PATH", "src/exclusion_rules.json")
+
+def _trie_pattern(words):
+    """Regex matching any of `words`, factored by common prefixes so each position is tried once"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # A keyword ends here; the longer ones are optional (the match is still a whole keyword)
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return build(trie)
+
+class ExclusionMatcher:
+    """All exclusion rules compiled into one regex, applied to a whole page of coins in one pass.
+
+    Keywords match anywhere in the name or symbol, case-insensitively, like the old keyword list.
+    Patterns are regexes searched in the name and in the symbol separately (case-insensitive, ^/$
+    anchor each field), so a pattern never matches across fields or coins.
+    deny_ids always exclude a coin and allow_ids always keep it.
+    """
+
+    def __init__(self, keywords=(), patterns=(), deny_ids=(), allow_ids=()):
+        # Keywords are searched in the lowercased text, exactly like `keyword in name.lower()`
+        self.keywords = {keyword.lower(): f"keyword:{keyword}" for keyword in reversed(keywords)}
+        self.patterns = [(re.compile(pattern, re.IGNORECASE), f"regex:{pattern}") for pattern in patterns]
+        # Keywords as one trie regex over the whole page (no capture groups, which slow re down);
+        # keywords are plain text without line breaks, so a match always lies inside one field
+        self.keyword_regex = re.compile(_trie_pattern(self.keywords)) if self.keywords else None
+        # Patterns are user regexes that could span line breaks, so they are searched field by field
+        self.pattern_regex = re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE) if patterns else None
+        self.deny_ids = set(deny_ids)
+        self.allow_ids = set(allow_ids)
+
+    @classmethod
+    def from_config(cls, path=EXCLUSION_RULES_PATH):
+        with open(path, "r") as file:
+            config = json.load(file)
+        return cls(config.get("keywords", []), config.get("patterns", []),
+                   config.get("deny_ids", []), config.get("allow_ids", []))
+
+    def reasons(self, coins):
+        """The rule excluding each coin (None if it is kept), in page order"""
+        reasons = [None] * len(coins)
+        fields = [((coin.get("name") or "").lower(), (coin.get("symbol") or "").lower()) for coin in coins]
+        if self.keyword_regex is not None and coins:
+            # Name and symbol of every coin on its own line of one text
+            starts = []
+            position = 0
+            for name, symbol in fields:
+                starts.append(position)
+                position += len(name) + len(symbol) + 2
+            # One scan over the page text, jumping to the next coin after each coin's first match
+            text = "\n".join(f"{name}\n{symbol}" for name, symbol in fields)
+            match = self.keyword_regex.search(text)
+            while match:
+                i = bisect_right(starts, match.start()) - 1
+                reasons[i] = self.keywords[match.group()]
+                if i + 1 == len(coins):
+                    break
+                match = self.keyword_regex.search(text, starts[i + 1])
+        if self.pattern_regex is not None:
+            for i, (name, symbol) in enumerate(fields):
+                if reasons[i] is None:
+                    reasons[i] = self._pattern_rule(name) or self._pattern_rule(symbol)
+        for i, coin in enumerate(coins):
+            if coin["id"] in self.allow_ids:
+                reasons[i] = None
+            elif coin["id"] in self.deny_ids:
+                reasons[i] = f"deny_id:{coin['id']}"
+        return reasons
+
+    def _pattern_rule(self, field):
+        """The first pattern matching one field, or None"""
+        if not self.pattern_regex.search(field):
+            return None
+        for pattern, rule in self.patterns:
+            if pattern.search(field):
+                return rule
+
+    def filter_page(self, coins):
+        """Split a page into (kept coins, [(excluded coin, rule)])"""
+        kept, excluded = [], []
+        for coin, reason in zip(coins, self.reasons(coins)):
+            if reason is None:
+                kept.append(coin)
+            else:
+                excluded.append((coin, reason))
+        return kept, excluded
+
+    def match(self, coin):
+        """The rule excluding one coin, or None"""
+        return self.reasons([coin])[0]
+
+_default_matcher = None
+
+def default_matcher():
+    """Matcher built from EXCLUSION_RULES_PATH, loaded once per process"""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = ExclusionMatcher.from_config()
+    return _default_matcher
+
+# Compare the matcher with the per-keyword substring scan on a synthetic 10k-coin list
+def benchmark(n_coins=10000, repeat=20):
+    import random
+    import string
+    import time
+
+    random.seed(0)
+    keywords = ExclusionMatcher.from_config().keywords
+
+    def word():
+        return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 8)))
+
+    coins = [{"id": f"coin-{i}",
+              "name": " ".join(word().capitalize() for _ in range(random.randint(1, 3)))
+                      + (" " + random.choice(["Wrapped", "Bridged", "USD", "Staked"]) if random.random() < 0.15 else ""),
+              "symbol": word().upper()[:5]} for i in range(n_coins)]
+
+    def keyword_scan(keyword_list):
+        return [any(keyword in coin["name"].lower() or keyword in coin["symbol"].lower() for keyword in keyword_list)
+                for coin in coins]
+
+    def best_of(function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    for keyword_list in (list(keywords), list(keywords) + [word() for _ in range(137)]):
+        matcher = ExclusionMatcher(keyword_list)
+        assert [reason is not None for reason in matcher.reasons(coins)] == keyword_scan(keyword_list)
+        scan_ms = best_of(lambda: keyword_scan(keyword_list))
+        matcher_ms = best_of(lambda: matcher.filter_page(coins))
+        print(f"{n_coins} coins, {len(keyword_list)} keywords: keyword scan {scan_ms:.1f} ms, "
+              f"matcher {matcher_ms:.1f} ms ({scan_ms / matcher_ms:.1f}x)")
+
+if __name__ == "__main__":
+    benchmark()
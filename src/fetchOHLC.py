@@ -1,30 +1,42 @@
-import mysql.connector
 import pandas as pd
 import requests
-from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
 import time
 from decimal import Decimal
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+import threading
+import resource
+import sys
 import os
+from src.watermarks import IngestionWatermarks
+import src.db as db
+import src.storage as storage
+import src.timeframes as timeframes
 
 # Load environment variables
 load_dotenv()
 
-COINGECKO_API_URL_PRO = "https://pro-api.coingecko.com/api/v3"
+COINGECKO_API_URL_PRO = os.getenv("COINGECKO_API_URL", "https://pro-api.coingecko.com/api/v3")
 API_KEY = os.getenv("COINGECKO_API_KEY")
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
+# Ingestion limits: concurrent requests, CoinGecko plan calls/minute, retries and rows per DB write
+OHLC_CONCURRENCY = int(os.getenv("OHLC_CONCURRENCY", "8"))
+COINGECKO_CALLS_PER_MINUTE = int(os.getenv("COINGECKO_CALLS_PER_MINUTE", "500"))
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+OHLC_WRITE_BATCH = 5000
+
+# CoinGecko interval, longest range per request (days) and history given to new tokens (days), per stored timeframe
+OHLC_TIMEFRAMES = {
+    "1d": {"interval": "daily", "max_days": 180, "history_days": 180},
+    "1h": {"interval": "hourly", "max_days": 31, "history_days": 90},
 }
 
-# Create a SQLAlchemy engine
+# Shared SQLAlchemy engine
 def create_db_engine():
-    db_url = f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
-    return create_engine(db_url)
+    return db.get_engine()
 
 # Database Functions
 def fetch_tokens_from_db():
@@ -34,77 +46,106 @@ def fetch_tokens_from_db():
     df = pd.read_sql(query, engine)
     return {row['id']: row['name'] for _, row in df.iterrows()}
 
-def fetch_latest_timestamp_from_db(token_id):
-    """Fetch the latest timestamp for a token from the database"""
-    engine = create_db_engine()
-    query = text('''
-        SELECT MAX(timestamp) AS latest_timestamp 
-        FROM Historical_Prices 
-        WHERE token_id = :token_id
-    ''')
-    with engine.connect() as conn:
-        result = conn.execute(query, {"token_id": token_id}).fetchone()
-        return result[0] if result[0] else None
-
-def fetch_coingecko_ohlc(token_id, from_timestamp):
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per `per` seconds, with bursts up to `capacity`"""
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else max(1, min(rate, OHLC_CONCURRENCY))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+# Shared HTTP session so connections to CoinGecko are reused across requests and threads
+def create_http_session(pool_size=OHLC_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "accept": "application/json",
+        "x-cg-pro-api-key": API_KEY or ""
+    })
+    return session
+
+# Seconds to wait before retrying: the server's Retry-After if given, else exponential backoff
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return BACKOFF_SECONDS * (2 ** attempt)
+
+def fetch_coingecko_ohlc(token_id, from_timestamp, session=None, limiter=None, interval="daily", to_timestamp=None):
     """Fetch OHLC data from CoinGecko API"""
     if not API_KEY:
         #print("CoinGecko API key missing. Skipping fetch.")
         return []
-    try:
-        to_timestamp = int(datetime.now().timestamp())  # Current time as the end timestamp
-        response = requests.get(
-            f"{COINGECKO_API_URL_PRO}/coins/{token_id}/ohlc/range?vs_currency=usd&from={from_timestamp}&to={to_timestamp}&interval=daily",
-            headers={
-                "accept": "application/json",
-                "x-cg-pro-api-key": API_KEY
-            },
-        )
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        #print(f"API error for {token_id}: {str(e)}")
-        return []
+    session = session or create_http_session(1)
+    to_timestamp = to_timestamp or int(datetime.now().timestamp())  # Current time as the end timestamp
+    url = f"{COINGECKO_API_URL_PRO}/coins/{token_id}/ohlc/range?vs_currency=usd&from={from_timestamp}&to={to_timestamp}&interval={interval}"
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter:
+            limiter.acquire()
+        response = None
+        try:
+            response = session.get(url, timeout=30)
+            # Rate limited or server error: back off and retry
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt < MAX_RETRIES:
+                    time.sleep(_retry_delay(response, attempt))
+                    continue
+            response.raise_for_status()
+            return response.json()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt < MAX_RETRIES:
+                time.sleep(_retry_delay(None, attempt))
+                continue
+            return []
+        except Exception as e:
+            #print(f"API error for {token_id}: {str(e)}")
+            return []
+    return []
+
+# Convert CoinGecko OHLC rows ([ms, open, high, low, close]) into Historical_Prices rows
+def _ohlc_rows(token_id, data):
+    return [
+        {
+            "token_id": token_id,
+            "timestamp": int(row[0] / 1000),  # Convert from milliseconds to seconds
+            "open": float(row[1]),
+            "high": float(row[2]),
+            "low": float(row[3]),
+            "close": float(row[4])
+        }
+        for row in data
+    ]
+
+def _write_ohlc_rows(conn, rows, table="Historical_Prices"):
+    """Upsert price rows in one executemany and commit"""
+    storage.get_storage().upsert_ohlc(conn, rows, table)
+    conn.commit()
 
 def save_ohlc_to_db(token_id, data):
     """Save OHLC data to database with batch insert"""
     try:
         engine = create_db_engine()
         with engine.connect() as conn:
-            # Prepare data for insertion
-            insert_data = []
-            for row in data:
-                timestamp = int(row[0] / 1000)  # Convert from milliseconds to seconds
-                open_price = float(row[1])
-                high_price = float(row[2])
-                low_price = float(row[3])
-                close_price = float(row[4])
-                insert_data.append({
-                    "token_id": token_id,
-                    "timestamp": timestamp,
-                    "open": open_price,
-                    "high": high_price,
-                    "low": low_price,
-                    "close": close_price
-                })
-
-            # Insert data into the database
-            conn.execute(
-                text('''
-                    INSERT INTO Historical_Prices 
-                    (token_id, timestamp, open, high, low, close)
-                    VALUES (:token_id, :timestamp, :open, :high, :low, :close)
-                    ON DUPLICATE KEY UPDATE
-                        open = VALUES(open),
-                        high = VALUES(high),
-                        low = VALUES(low),
-                        close = VALUES(close)
-                '''),
-                insert_data
-            )
-            
-            # Explicitly commit the transaction
-            conn.commit()
+            _write_ohlc_rows(conn, _ohlc_rows(token_id, data))
             #print(f"Transaction committed for {token_id}.")
         
         #print(f"Saved {len(insert_data)} OHLC records for {token_id}")
@@ -116,36 +157,82 @@ def save_ohlc_to_db(token_id, data):
     finally:
         if 'conn' in locals(): conn.close()
 
-def main():
-    # 1. Fetch tokens from the database
-    tokens = fetch_tokens_from_db()
-    if not tokens:
-        #print("No tokens found in the database. Exiting.")
+# Split [from, to] into ranges CoinGecko accepts in one request
+def _request_windows(from_timestamp, to_timestamp, max_days):
+    span = max_days * 86400
+    return [(start, min(start + span, to_timestamp)) for start in range(from_timestamp, to_timestamp, span)] or [(from_timestamp, to_timestamp)]
+
+# Fetch OHLC ranges concurrently and stream the results into one batched DB writer
+def ingest_ohlc(requests_to_make, write_rows, concurrency=OHLC_CONCURRENCY, calls_per_minute=COINGECKO_CALLS_PER_MINUTE, batch_size=OHLC_WRITE_BATCH, timeframe="1d"):
+    """Fetch [(token_id, from_timestamp), ...] and pass rows to write_rows in batches.
+
+    write_rows returns how many of the rows it saved (0 when the write failed); the sum is returned.
+    """
+    settings = OHLC_TIMEFRAMES[timeframe]
+    to_timestamp = int(datetime.now().timestamp())
+    session = create_http_session(concurrency)
+    limiter = TokenBucket(calls_per_minute, capacity=max(1, min(calls_per_minute, concurrency)))
+    pending_rows = []
+    written = 0
+    with session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(fetch_coingecko_ohlc, token_id, window_from, session, limiter, settings["interval"], window_to): token_id
+            for token_id, from_timestamp in requests_to_make
+            for window_from, window_to in _request_windows(from_timestamp, to_timestamp, settings["max_days"])
+        }
+        for future in as_completed(futures):
+            # Drop the finished future so its response isn't held until the whole run ends
+            token_id = futures.pop(future)
+            ohlc_data = future.result()
+            if not ohlc_data:
+                #print(f"No OHLC data found for {token_id}. Skipping.")
+                continue
+            pending_rows.extend(_ohlc_rows(token_id, ohlc_data))
+            if len(pending_rows) >= batch_size:
+                written += write_rows(pending_rows)
+                pending_rows = []
+        if pending_rows:
+            written += write_rows(pending_rows)
+    return written
+
+def main(timeframe="1d"):
+    # 1. Load every token's latest stored timestamp in one query
+    engine = create_db_engine()
+    table = timeframes.price_table(timeframe)
+    watermarks = IngestionWatermarks(engine, table).load()
+
+    # 2. Request ranges only for tokens with an open candle or missing at least one candle of this timeframe
+    history_days = OHLC_TIMEFRAMES[timeframe]["history_days"]
+    default_from = int((datetime.now() - timedelta(days=history_days)).timestamp())  # New tokens get the last history_days
+    requests_to_make = watermarks.plan(default_from, interval=timeframes.TIMEFRAMES[timeframe])
+    if not requests_to_make:
+        #print("All tokens are up to date.")
         return
 
-    # 2. Process each token
-    for token_id, name in tokens.items():
-        #print(f"\nProcessing token: {name} ({token_id})")
-
-        # Fetch the latest timestamp from the database
-        latest_timestamp = fetch_latest_timestamp_from_db(token_id)
-        #if latest_timestamp:
-        #    print(f"Latest timestamp in database for {name}: {latest_timestamp}")
-        #else:
-        #    print(f"No data found in database for {name}. Fetching last 180 days of data.")
-
-        # Calculate the start time for the API request
-        from_timestamp = latest_timestamp if latest_timestamp else int((datetime.now() - timedelta(days=180)).timestamp())
-        #print(f"Fetching data from timestamp: {from_timestamp}")
-
-        # Fetch OHLC data from the API
-        ohlc_data = fetch_coingecko_ohlc(token_id, from_timestamp)
-        if not ohlc_data:
-            #print(f"No OHLC data found for {name}. Skipping.")
-            continue
-
-        # Save OHLC data to the database
-        save_ohlc_to_db(token_id, ohlc_data)
+    # 3. Fetch concurrently and save through a single connection, advancing the watermarks
+    started = time.perf_counter()
+    failed = []
+    with engine.connect() as conn:
+        def write_rows(rows):
+            try:
+                _write_ohlc_rows(conn, rows, table)
+            except Exception as e:
+                conn.rollback()
+                print(f"Database save error for {len(rows)} OHLC rows: {str(e)}")
+                failed.append(len(rows))
+                return 0
+            for row in rows:
+                watermarks.advance(row["token_id"], row["timestamp"])
+            return len(rows)
+        written = ingest_ohlc(requests_to_make, write_rows, timeframe=timeframe)
+
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KB on Linux
+    print(f"Ingested {written} {timeframe} OHLC rows for {len(requests_to_make)} tokens in {elapsed:.1f}s "
+          f"({written / max(elapsed, 1e-9):.0f} rows/s, peak memory {peak_mb:.0f} MB)"
+          + (f"; {sum(failed)} rows failed to save" if failed else ""))
+    return watermarks
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python -m src.fetchOHLC [--timeframe=1h]
+    main(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--timeframe=")), "1d"))
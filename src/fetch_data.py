@@ -1,6 +1,13 @@
 import json
+import hashlib
+import time
 import requests
-import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import src.db as db
+import src.storage as storage
+import src.fetchOHLC as fetchOHLC
+import src.exclusions as exclusions
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -14,142 +21,285 @@ BASE_URL = "https://pro-api.coingecko.com/api/v3"
 # API key
 API_KEY = os.getenv("COINGECKO_API_KEY")
 
-# MySQL database configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
+# Category pages: coins per page, concurrent page requests, and how long a fetched page is reused (seconds)
+PER_PAGE = 250
+CATEGORY_CONCURRENCY = int(os.getenv("CATEGORY_CONCURRENCY", "4"))
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "300"))
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "src/coingecko_cache")
+
+# Categories that make up the token universe
+CATEGORIES = os.getenv("COINGECKO_CATEGORIES", "base-ecosystem").split(",")
+
+def _read_cached_page(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+def _page_path(category_id, page, cache_dir=PAGE_CACHE_DIR):
+    return os.path.join(cache_dir, f"{category_id}-{page}.json")
+
+def _is_fresh(cached, ttl=PAGE_CACHE_TTL):
+    return cached is not None and time.time() - cached["fetched_at"] < ttl
+
+def _write_cached_page(path, etag, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump({"etag": etag, "fetched_at": time.time(), "data": data}, file)
+    os.replace(path + ".tmp", path)
 
 # Fetch coins in a specific category
-def get_coins_in_category(category_id):
+def get_coins_in_category(category_id, page=1, session=None, limiter=None, ttl=PAGE_CACHE_TTL, cache_dir=PAGE_CACHE_DIR,
+                          prepaid=False):
+    """Return one page of the category's coins, or None if it could not be fetched.
+
+    A page fetched less than `ttl` seconds ago is served from the local cache; an older one is
+    revalidated with its ETag, so an unchanged page comes back as 304 without a new body.
+    With `prepaid` the caller already took the first request's token from `limiter`.
+    """
     if not API_KEY:
         print("CoinGecko API key missing. Skipping fetch.")
         return None
+    path = _page_path(category_id, page, cache_dir)
+    cached = _read_cached_page(path)
+    if _is_fresh(cached, ttl):
+        return cached["data"]
+
+    session = session or fetchOHLC.create_http_session(1)
     url = f"{BASE_URL}/coins/markets"
     headers = {"x-cg-pro-api-key": API_KEY}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
     params = {
         "vs_currency": "usd",  # Target currency
         "category": category_id,  # Filter by category
         "order": "market_cap_desc",  # Sort by market cap
-        "per_page": 250,  # Max results per page
-        "page": 1,  # Page number
+        "per_page": PER_PAGE,  # Max results per page
+        "page": page,  # Page number
         "sparkline": False  # Exclude sparkline data
     }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
+    for attempt in range(fetchOHLC.MAX_RETRIES + 1):
+        if limiter and (attempt or not prepaid):
+            limiter.acquire()
+        try:
+            response = session.get(url, headers=headers, params=params, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt < fetchOHLC.MAX_RETRIES:
+                time.sleep(fetchOHLC._retry_delay(None, attempt))
+            continue
+        if response.status_code == 304 and cached:
+            _write_cached_page(path, cached["etag"], cached["data"])
+            return cached["data"]
+        if response.status_code == 429 or response.status_code >= 500:
+            if attempt < fetchOHLC.MAX_RETRIES:
+                time.sleep(fetchOHLC._retry_delay(response, attempt))
+            continue
+        if response.status_code == 200:
+            data = response.json()
+            _write_cached_page(path, response.headers.get("ETag"), data)
+            return data
         return None
+    return None
+
+# A page that ends the category: short, or not fetched at all
+def _is_last_page(coins):
+    return coins is None or len(coins) < PER_PAGE
+
+# Yield the coins of every category page by page, fetching pages concurrently under the rate limit
+def iter_category_pages(category_ids=CATEGORIES, concurrency=CATEGORY_CONCURRENCY, calls_per_minute=fetchOHLC.COINGECKO_CALLS_PER_MINUTE):
+    """Yield lists of coins, each coin once across all pages and categories.
+
+    The page count isn't known up front: page 1 is fetched alone, then pages are submitted one at a
+    time with up to `concurrency` in flight. Each page that needs a request takes its rate-limit token
+    here, in page order, and nothing more is submitted once a short page has come back.
+    """
+    if not API_KEY:
+        print("CoinGecko API key missing. Skipping fetch.")
+        return
+    seen = set()
+    session = fetchOHLC.create_http_session(concurrency)
+    limiter = fetchOHLC.TokenBucket(calls_per_minute, capacity=max(1, min(calls_per_minute, concurrency)))
+    with session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for category_id in category_ids:
+            pending = deque()  # (page number, future) in page order
+            next_page, window, ended = 1, 1, False
+            while True:
+                while not ended and len(pending) < window:
+                    # A page still fresh in the cache makes no request and needs no token
+                    prepaid = not _is_fresh(_read_cached_page(_page_path(category_id, next_page)))
+                    if prepaid:
+                        limiter.acquire()
+                    ended = any(future.done() and _is_last_page(future.result()) for _, future in pending)
+                    if not ended:
+                        pending.append((next_page, pool.submit(get_coins_in_category, category_id, next_page,
+                                                               session, limiter, prepaid=prepaid)))
+                        next_page += 1
+                if not pending:
+                    break
+                number, future = pending.popleft()
+                coins = future.result()
+                if coins is None:
+                    print(f"Could not fetch page {number} of {category_id}. Skipping the rest of the category.")
+                else:
+                    fresh = [coin for coin in coins if coin["id"] not in seen]
+                    seen.update(coin["id"] for coin in fresh)
+                    if fresh:
+                        yield fresh
+                if _is_last_page(coins):
+                    # Pages after the last one that haven't started are dropped
+                    for _, future in pending:
+                        future.cancel()
+                    break
+                window = concurrency
 
 # Check if a token should be excluded based on its name or symbol
 def should_exclude_token(token):
-    # Keywords to exclude
-    exclude_keywords = [
-        "wrapped", "bridged", "restaked", "staked", "weth", "eth", "btc", "bitcoin", "clbtc", "ezeth", "usd", "euro", "eurc"
-    ]
-    
-    # Check if any keyword is in the token's name or symbol (case-insensitive)
-    for keyword in exclude_keywords:
-        if keyword in token["name"].lower() or keyword in token["symbol"].lower():
-            return True
-    return False
-
-# Save filtered tokens to the MySQL database
-def save_filtered_tokens_to_db(tokens):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
+    # Rules come from src/exclusion_rules.json (see src/exclusions.py)
+    return exclusions.default_matcher().match(token) is not None
+
+# Base_tokens columns in CoinGecko /coins/markets field order
+BASE_TOKEN_COLUMNS = [
+    "id", "symbol", "name", "image", "current_price", "market_cap", "market_cap_rank",
+    "fully_diluted_valuation", "total_volume", "high_24h", "low_24h",
+    "price_change_24h", "price_change_percentage_24h", "market_cap_change_24h",
+    "market_cap_change_percentage_24h", "circulating_supply", "total_supply",
+    "max_supply", "ath", "ath_change_percentage", "ath_date", "atl", "atl_change_percentage",
+    "atl_date", "roi", "last_updated"
+]
+
+# Rows per executemany, and per database the hash of every row written last time (unchanged rows are skipped)
+TOKEN_WRITE_CHUNK = int(os.getenv("TOKEN_WRITE_CHUNK", "500"))
+TOKEN_SNAPSHOT_PATH = os.getenv("TOKEN_SNAPSHOT_PATH", "src/token_snapshot.json")
+
+def _token_row(token):
+    # Handle null ROI
+    roi = token.get("roi")
+    roi_json = json.dumps(roi) if roi else None
+    return tuple(roi_json if column == "roi" else token[column] for column in BASE_TOKEN_COLUMNS)
+
+def _row_hash(row):
+    return hashlib.sha1(json.dumps(row, default=str).encode()).hexdigest()[:16]
+
+def _database_key(engine):
+    # Snapshots of different databases (MySQL, a SQLite copy, a restored server) are kept apart
+    return engine.url.render_as_string(hide_password=True)
+
+def _load_token_snapshot(path, database):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        snapshots = json.load(file)
+    snapshot = snapshots.get(database)
+    return snapshot if isinstance(snapshot, dict) else {}
+
+def _save_token_snapshot(path, database, snapshot):
+    snapshots = {}
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            snapshots = {key: value for key, value in json.load(file).items() if isinstance(value, dict)}
+    snapshots[database] = snapshot
+    with open(path + ".tmp", "w") as file:
+        json.dump(snapshots, file)
+    os.replace(path + ".tmp", path)
+
+def _failure_reason(error):
+    # pymysql errors carry (code, message); keep the code so failures group by cause
+    error = getattr(error, "orig", None) or error  # Unwrap SQLAlchemy's DBAPIError
+    if getattr(error, "args", None) and isinstance(error.args[0], int):
+        return f"{type(error).__name__} {error.args[0]}"
+    return type(error).__name__
+
+# Save filtered tokens to the database
+def save_filtered_tokens_to_db(tokens, chunk_size=TOKEN_WRITE_CHUNK, snapshot_path=TOKEN_SNAPSHOT_PATH, force=False):
+    """Upsert tokens into Base_tokens in executemany chunks, skipping rows unchanged since the last run.
+
+    A row is skipped only when every column matches what was last written to this database and the
+    token is still in Base_tokens, so a new or recreated table gets every row again.
+    Returns {"written": n, "skipped": n, "failed": {reason: n}}. A chunk that fails is retried row by
+    row so one bad token only costs itself.
+    """
+    report = {"written": 0, "skipped": 0, "failed": {}}
+    engine = db.get_engine()
+    database = _database_key(engine)
+    snapshot = {} if force else _load_token_snapshot(snapshot_path, database)
+
+    def fail(reason, count=1):
+        report["failed"][reason] = report["failed"].get(reason, 0) + count
+
+    rows = []
+    for token in tokens:
+        try:
+            row = _token_row(token)
+        except KeyError as e:
+            fail(f"missing field {e.args[0]}")
+            continue
+        rows.append((row, _row_hash(row)))
+
+    def as_dict(row):
+        return dict(zip(BASE_TOKEN_COLUMNS, row))
+
+    pending = []
+    done = 0
+    store = storage.get_storage()
+    conn = engine.connect()
     try:
-        for token in tokens:
-            # Handle null ROI
-            roi = token.get("roi")
-            roi_json = json.dumps(roi) if roi else None
-
-            cursor.execute('''
-                INSERT INTO Base_tokens (
-                    id, symbol, name, image, current_price, market_cap, market_cap_rank,
-                    fully_diluted_valuation, total_volume, high_24h, low_24h,
-                    price_change_24h, price_change_percentage_24h, market_cap_change_24h,
-                    market_cap_change_percentage_24h, circulating_supply, total_supply,
-                    max_supply, ath, ath_change_percentage, ath_date, atl, atl_change_percentage,
-                    atl_date, roi, last_updated
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                ON DUPLICATE KEY UPDATE
-                    symbol = VALUES(symbol),
-                    name = VALUES(name),
-                    image = VALUES(image),
-                    current_price = VALUES(current_price),
-                    market_cap = VALUES(market_cap),
-                    market_cap_rank = VALUES(market_cap_rank),
-                    fully_diluted_valuation = VALUES(fully_diluted_valuation),
-                    total_volume = VALUES(total_volume),
-                    high_24h = VALUES(high_24h),
-                    low_24h = VALUES(low_24h),
-                    price_change_24h = VALUES(price_change_24h),
-                    price_change_percentage_24h = VALUES(price_change_percentage_24h),
-                    market_cap_change_24h = VALUES(market_cap_change_24h),
-                    market_cap_change_percentage_24h = VALUES(market_cap_change_percentage_24h),
-                    circulating_supply = VALUES(circulating_supply),
-                    total_supply = VALUES(total_supply),
-                    max_supply = VALUES(max_supply),
-                    ath = VALUES(ath),
-                    ath_change_percentage = VALUES(ath_change_percentage),
-                    ath_date = VALUES(ath_date),
-                    atl = VALUES(atl),
-                    atl_change_percentage = VALUES(atl_change_percentage),
-                    atl_date = VALUES(atl_date),
-                    roi = VALUES(roi),
-                    last_updated = VALUES(last_updated)
-            ''', (
-                token["id"],
-                token["symbol"],
-                token["name"],
-                token["image"],
-                token["current_price"],
-                token["market_cap"],
-                token["market_cap_rank"],
-                token["fully_diluted_valuation"],
-                token["total_volume"],
-                token["high_24h"],
-                token["low_24h"],
-                token["price_change_24h"],
-                token["price_change_percentage_24h"],
-                token["market_cap_change_24h"],
-                token["market_cap_change_percentage_24h"],
-                token["circulating_supply"],
-                token["total_supply"],
-                token["max_supply"],
-                token["ath"],
-                token["ath_change_percentage"],
-                token["ath_date"],
-                token["atl"],
-                token["atl_change_percentage"],
-                token["atl_date"],
-                roi_json,
-                token["last_updated"]
-            ))
-        
-        conn.commit()
+        unchanged = [row[0] for row, row_hash in rows if snapshot.get(row[0]) == row_hash]
+        stored = store.stored_token_ids(conn, unchanged) if unchanged else set()
+        for row, row_hash in rows:
+            if row[0] in stored:
+                report["skipped"] += 1
+            else:
+                pending.append((row, row_hash))
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            try:
+                store.upsert_tokens(conn, [as_dict(row) for row, _ in chunk])
+                conn.commit()
+                written = chunk
+            except Exception:
+                conn.rollback()
+                written = []
+                for row, row_hash in chunk:
+                    try:
+                        store.upsert_tokens(conn, [as_dict(row)])
+                        conn.commit()
+                        written.append((row, row_hash))
+                    except Exception as e:
+                        conn.rollback()
+                        fail(_failure_reason(e))
+            for row, row_hash in written:
+                snapshot[row[0]] = row_hash
+            report["written"] += len(written)
+            done += len(chunk)
     except Exception as e:
-        pass
+        # Lost the connection: every row not yet attempted counts as failed
+        fail(_failure_reason(e), len(rows) - report["skipped"] - done)
     finally:
         conn.close()
+        _save_token_snapshot(snapshot_path, database, snapshot)
+    return report
 
 # Main function
 def main():
-    base_ecosystem_id = "base-ecosystem"
-    coins = get_coins_in_category(base_ecosystem_id)
-    
-    if coins:
-        filtered_tokens = []
-        for token in coins:
-            if not should_exclude_token(token):
-                filtered_tokens.append(token)
-        save_filtered_tokens_to_db(filtered_tokens)
+    # Filter and save each page as it arrives instead of collecting the whole universe first
+    totals = {"written": 0, "skipped": 0, "failed": {}}
+    excluded_by_rule = {}
+    pages = 0
+    matcher = exclusions.default_matcher()
+    for coins in iter_category_pages(CATEGORIES):
+        filtered_tokens, excluded = matcher.filter_page(coins)
+        for token, rule in excluded:
+            excluded_by_rule[rule] = excluded_by_rule.get(rule, 0) + 1
+        report = save_filtered_tokens_to_db(filtered_tokens)
+        totals["written"] += report["written"]
+        totals["skipped"] += report["skipped"]
+        for reason, count in report["failed"].items():
+            totals["failed"][reason] = totals["failed"].get(reason, 0) + count
+        pages += 1
+    if pages:
+        print(f"Base_tokens: {totals['written']} written, {totals['skipped']} unchanged, "
+              f"{sum(totals['failed'].values())} failed {totals['failed'] or ''}".rstrip())
+        print(f"Excluded {sum(excluded_by_rule.values())} tokens: {excluded_by_rule}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
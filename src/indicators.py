@@ -0,0 +1,365 @@
+import numpy as np
+import time
+
+# Indicator kernels on NumPy arrays, so the runtime needs neither TA-Lib nor pandas_ta. A 1-D array is
+# one series; a 2-D array holds one series per row (tokens x time), computed together one time step
+# at a time (a transposed (time x series) view works too and keeps its memory layout). RMA and the
+# DEMA-DMI signal match the pandas/pandas_ta versions bit for bit. EMA, DEMA, RSI and TRANGE match TA-Lib
+# within a relative TALIB_TOLERANCE: TA-Lib wheels may be built with fused multiply-add, which rounds
+# the EMA update once instead of twice, so the last bit can differ depending on the build.
+# tests/test_indicators.py checks both.
+TALIB_TOLERANCE = 1e-12
+
+def _first_valid(valid):
+    """Index of the first True along the last axis (the length of the axis when there is none)"""
+    return np.where(valid.any(axis=-1), valid.argmax(axis=-1), valid.shape[-1])
+
+def _shift(values):
+    """values[..., t - 1] at t, NaN at t = 0"""
+    shifted = np.full(values.shape, np.nan)
+    shifted[..., 1:] = values[..., :-1]
+    return shifted
+
+def _ffill(values):
+    """Carry the last non-NaN value forward along the last axis"""
+    positions = np.where(np.isnan(values), 0, np.arange(values.shape[-1]))
+    np.maximum.accumulate(positions, axis=-1, out=positions)
+    filled = np.take_along_axis(values, positions, axis=-1)
+    return filled
+
+def _align_rows(values, firsts, inverse=False):
+    """Shift each row left by its first valid column so every row starts at column 0 (inverse shifts back)"""
+    rows = np.flatnonzero(firsts)
+    if len(rows) == 0:
+        return values
+    steps = values.shape[1]
+    columns = np.arange(steps)[None, :] + (-firsts[rows, None] if inverse else firsts[rows, None])
+    inside = (columns >= 0) & (columns < steps)
+    aligned = values.copy(order="K")
+    aligned[rows] = np.where(inside, values[rows[:, None], np.clip(columns, 0, steps - 1)], np.nan)
+    return aligned
+
+def _ema_1d(values, period):
+    out = np.full(len(values), np.nan)
+    begin = int(_first_valid(~np.isnan(values)))
+    if len(values) - begin < period:
+        return out
+    k = 2.0 / (period + 1)
+    seed = values[begin:begin + period].tolist()
+    prev = 0.0
+    for x in seed:
+        prev += x
+    prev /= period
+    results = [prev]
+    for x in values[begin + period:].tolist():
+        prev = ((x - prev) * k) + prev
+        results.append(prev)
+    out[begin + period - 1:] = results
+    return out
+
+def _common_start(values):
+    """Column where every row that has data starts, or None when the rows start at different columns"""
+    firsts = _first_valid(~np.isnan(values))
+    firsts = firsts[firsts < values.shape[1]]
+    if len(firsts) == 0:
+        return values.shape[1]
+    return int(firsts[0]) if (firsts == firsts[0]).all() else None
+
+def _ema_2d(values, period):
+    begin = _common_start(values)
+    if begin is None:
+        # Rows start at different columns: compute them aligned, then put them back
+        firsts = _first_valid(~np.isnan(values))
+        return _align_rows(_ema_2d(_align_rows(values, firsts), period), firsts, inverse=True)
+    out = np.full_like(values, np.nan)
+    if values.shape[1] - begin < period:
+        return out
+    k = 2.0 / (period + 1)
+    prev = np.zeros(values.shape[0])
+    for t in range(begin, begin + period):
+        prev += values[:, t]
+    prev /= period
+    out[:, begin + period - 1] = prev
+    for t in range(begin + period, values.shape[1]):
+        prev = ((values[:, t] - prev) * k) + prev
+        out[:, t] = prev
+    return out
+
+def ema(values, period):
+    """TA-Lib EMA: seeded with the mean of the first `period` values, then prev + (x - prev) * k.
+
+    Like the talib wrapper, each series starts at its first non-NaN value.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return _ema_1d(values, period) if values.ndim == 1 else _ema_2d(values, period)
+
+def dema(values, period):
+    """TA-Lib DEMA: 2 * EMA - EMA of the EMA"""
+    first = ema(values, period)
+    return 2.0 * first - ema(first, period)
+
+def true_range(high, low, close):
+    """TA-Lib TRANGE, starting at the first bar where high, low and close are all present"""
+    high, low, close = (np.asarray(values, dtype=np.float64) for values in (high, low, close))
+    prev_close = _shift(close)
+    greatest = high - low
+    with np.errstate(invalid="ignore"):
+        distance = np.abs(prev_close - high)
+        greatest = np.where(distance > greatest, distance, greatest)
+        distance = np.abs(prev_close - low)
+        greatest = np.where(distance > greatest, distance, greatest)
+    begin = _first_valid(~(np.isnan(high) | np.isnan(low) | np.isnan(close)))
+    return np.where(np.arange(high.shape[-1]) > np.expand_dims(begin, -1), greatest, np.nan)
+
+def _rsi_value(gain, loss):
+    # TA-Lib reports 0 whenever the average move is zero (or has gone NaN)
+    total = gain + loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, 100.0 * (gain / total), 0.0)
+
+def _rsi_1d(values, period):
+    out = np.full(len(values), np.nan)
+    begin = int(_first_valid(~np.isnan(values)))
+    if len(values) - begin <= period:
+        return out
+    series = values[begin:].tolist()
+    gain = loss = 0.0
+    for prev, x in zip(series[:period], series[1:period + 1]):
+        diff = x - prev
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+    # The TA-Lib 0.8 wheels multiply by the reciprocal of the period rather than dividing by it
+    scale = 1.0 / period
+    loss *= scale
+    gain *= scale
+    results = [100.0 * (gain / (gain + loss)) if gain + loss > 0 else 0.0]
+    for prev, x in zip(series[period:], series[period + 1:]):
+        diff = x - prev
+        loss *= period - 1
+        gain *= period - 1
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+        loss *= scale
+        gain *= scale
+        results.append(100.0 * (gain / (gain + loss)) if gain + loss > 0 else 0.0)
+    out[begin + period:] = results
+    return out
+
+def _rsi_2d(values, period):
+    begin = _common_start(values)
+    if begin is None:
+        firsts = _first_valid(~np.isnan(values))
+        return _align_rows(_rsi_2d(_align_rows(values, firsts), period), firsts, inverse=True)
+    out = np.full_like(values, np.nan)
+    if values.shape[1] - begin <= period:
+        return out
+    gain = np.zeros(values.shape[0])
+    loss = np.zeros(values.shape[0])
+    for t in range(begin + 1, begin + period + 1):
+        diff = values[:, t] - values[:, t - 1]
+        loss = np.where(diff < 0, loss - diff, loss)
+        gain = np.where(diff < 0, gain, gain + diff)
+    scale = 1.0 / period
+    loss *= scale
+    gain *= scale
+    out[:, begin + period] = _rsi_value(gain, loss)
+    for t in range(begin + period + 1, values.shape[1]):
+        diff = values[:, t] - values[:, t - 1]
+        loss *= period - 1
+        gain *= period - 1
+        loss = np.where(diff < 0, loss - diff, loss)
+        gain = np.where(diff < 0, gain, gain + diff)
+        loss *= scale
+        gain *= scale
+        out[:, t] = _rsi_value(gain, loss)
+    return out
+
+def rsi(values, period=14):
+    """TA-Lib RSI: Wilder smoothing of the average gain and loss, seeded with their plain averages"""
+    values = np.asarray(values, dtype=np.float64)
+    return _rsi_1d(values, period) if values.ndim == 1 else _rsi_2d(values, period)
+
+def _rma_alpha(length):
+    # pandas goes through the center of mass, so derive alpha the same way
+    comass = (1 - 1 / length) / (1 / length)
+    return 1.0 / (1.0 + comass)
+
+def _rma_1d(values, length):
+    alpha = _rma_alpha(length)
+    decay = 1.0 - alpha
+    valid = ~np.isnan(values)
+    begin = int(_first_valid(valid))
+    if valid[begin:].all():
+        # One unbroken run of observations: the weight of the old value is back to 1 before every update
+        out = np.full(len(values), np.nan)
+        if len(values) - begin < length:
+            return out
+        scale = decay + alpha
+        weighted = float(values[begin])
+        results = [weighted]
+        for x in values[begin + 1:].tolist():
+            if weighted != x:
+                weighted = (decay * weighted + alpha * x) / scale
+            results.append(weighted)
+        out[begin + length - 1:] = results[length - 1:]
+        return out
+
+    results = []
+    weighted = float("nan")
+    old_wt = 1.0
+    nobs = 0
+    for x in values.tolist():
+        is_observation = x == x
+        nobs += is_observation
+        if weighted == weighted:
+            old_wt *= decay
+            if is_observation:
+                if weighted != x:
+                    weighted = (old_wt * weighted + alpha * x) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_observation:
+            weighted = x
+        results.append(weighted if nobs >= length else float("nan"))
+    return np.array(results, dtype=np.float64)
+
+def _rma_2d(values, length):
+    n, steps = values.shape
+    alpha = _rma_alpha(length)
+    decay = 1.0 - alpha
+    valid = ~np.isnan(values)
+    firsts = _first_valid(valid)
+    stops = steps - _first_valid(valid[:, ::-1])
+    begin = _common_start(values)
+    if begin is not None and (valid.sum(axis=1) == stops - firsts).all():
+        # Rows are unbroken runs starting together (trailing NaN padding allowed): plain updates, then
+        # carry each row's last value over its padding as pandas does
+        out = np.full_like(values, np.nan)
+        if begin == steps:
+            return out
+        scale = decay + alpha
+        weighted = values[:, begin].copy()
+        out[:, begin] = weighted
+        for t in range(begin + 1, steps):
+            x = values[:, t]
+            weighted = np.where(weighted != x, (decay * weighted + alpha * x) / scale, weighted)
+            out[:, t] = weighted
+        last = out[np.arange(n), np.maximum(stops - 1, 0)]
+        out = np.where(np.arange(steps) >= stops[:, None], last[:, None], out)
+        out[:, :begin + length - 1] = np.nan
+        out[stops - firsts < length] = np.nan
+        return out
+
+    out = np.empty_like(values)
+    weighted = np.full(n, np.nan)
+    old_wt = np.ones(n)
+    nobs = np.zeros(n, dtype=np.int64)
+    for t in range(steps):
+        x = values[:, t]
+        is_observation = ~np.isnan(x)
+        nobs += is_observation
+        started = ~np.isnan(weighted)
+        old_wt = np.where(started, old_wt * decay, old_wt)
+        update = started & is_observation
+        weighted = np.where(update & (weighted != x), (old_wt * weighted + alpha * x) / (old_wt + alpha), weighted)
+        old_wt = np.where(update, 1.0, old_wt)
+        weighted = np.where(~started & is_observation, x, weighted)
+        out[:, t] = np.where(nobs >= length, weighted, np.nan)
+    return out
+
+def rma(values, length):
+    """Wilder's moving average as pandas ewm(alpha=1/length, min_periods=length, adjust=False).mean()"""
+    values = np.asarray(values, dtype=np.float64)
+    return _rma_1d(values, length) if values.ndim == 1 else _rma_2d(values, length)
+
+def dema_dmi(close, high, low, len_dema=5, adx_smoothing_len=3, di_len=5):
+    """DEMA-DMI signal: 1 long, -1 short, forward-filled, NaN before the first signal.
+
+    DEMA of high/low gives the directional moves, smoothed with RMA into +DI/-DI and ADX; long when
+    +DI leads and ADX is rising, short when -DI leads. Takes 1-D arrays or (tokens x time) matrices.
+    """
+    close, high, low = (np.asarray(values, dtype=np.float64) for values in (close, high, low))
+    demah = dema(high, len_dema)
+    demal = dema(low, len_dema)
+    u = demah - _shift(demah)
+    d = -(demal - _shift(demal))
+    p = np.where((u > d) & (u > 0), u, 0.0)
+    m = np.where((d > u) & (d > 0), d, 0.0)
+
+    t = rma(true_range(high, low, close), di_len)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus = np.nan_to_num(100 * rma(p, di_len) / t)
+        minus = np.nan_to_num(100 * rma(m, di_len) / t)
+
+    sum_dm = plus + minus
+    adx = 100 * rma(np.abs(plus - minus) / np.where(sum_dm == 0, 1, sum_dm), adx_smoothing_len)
+    adx_rising = adx > _shift(adx)
+    dmil = (plus > minus) & adx_rising
+    dmis = minus > plus
+    return _ffill(np.where(dmil & ~dmis, 1.0, np.where(dmis, -1.0, np.nan)))
+
+def dema_dmi_batch(close, high, low, offsets, len_dema=5, adx_smoothing_len=3, di_len=5):
+    """dema_dmi for many tokens stored back to back in one array (token t owns offsets[t]:offsets[t + 1]).
+
+    The tokens are laid out as rows of a NaN-padded matrix and computed in one pass over time;
+    padding only follows each token's bars, so it never changes their values.
+    """
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    signal = np.full(len(close), np.nan)
+    if len(lengths) == 0 or lengths.max() == 0:
+        return signal
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(offsets[-1] - offsets[0]) - np.repeat(offsets[:-1] - offsets[0], lengths)
+    matrices = []
+    for values in (close, high, low):
+        matrix = np.full((len(lengths), lengths.max()), np.nan)
+        matrix[rows, columns] = np.asarray(values, dtype=np.float64)[offsets[0]:offsets[-1]]
+        matrices.append(matrix)
+    signal[offsets[0]:offsets[-1]] = dema_dmi(*matrices, len_dema, adx_smoothing_len, di_len)[rows, columns]
+    return signal
+
+def benchmark_imports(repeat=5):
+    """Startup time and peak RSS of `import main`, then with TA-Lib and pandas_ta imported as before"""
+    import subprocess
+    import sys
+    probe = ("import resource, time; start = time.perf_counter(); {imports}; "
+             "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    for label, imports in (("main", "import main"), ("main + talib + pandas_ta", "import main, talib, pandas_ta")):
+        try:
+            runs = [subprocess.run([sys.executable, "-c", probe.format(imports=imports)], capture_output=True,
+                                   text=True, check=True).stdout.split() for _ in range(repeat)]
+        except subprocess.CalledProcessError:
+            print(f"import {label}: not installed")
+            continue
+        seconds = min(float(run[0]) for run in runs)
+        rss_mb = min(int(run[1]) for run in runs) / 1024
+        print(f"import {label}: {seconds * 1000:.0f} ms, peak RSS {rss_mb:.0f} MB")
+
+def benchmark(n_tokens=300, length=730, repeat=3):
+    """Time the 1-D kernel per token and the batched kernel on random-walk bars"""
+    rng = np.random.default_rng(1)
+    close = np.exp(np.cumsum(rng.normal(0, 0.05, (n_tokens, length)), axis=1))
+    high = close * (1 + rng.uniform(0, 0.05, close.shape))
+    low = close * (1 - rng.uniform(0, 0.05, close.shape))
+    offsets = np.arange(n_tokens + 1) * length
+
+    def best_of(function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    kernel_ms = best_of(lambda: [dema_dmi(close[t], high[t], low[t]) for t in range(n_tokens)])
+    batch_ms = best_of(lambda: dema_dmi_batch(close.ravel(), high.ravel(), low.ravel(), offsets))
+    print(f"dema_dmi on {n_tokens} tokens x {length} bars: 1-D kernel {kernel_ms:.0f} ms, batched {batch_ms:.0f} ms")
+
+if __name__ == "__main__":
+    # python -m src.indicators (parity with TA-Lib is checked by tests/test_indicators.py)
+    benchmark()
+    benchmark_imports()
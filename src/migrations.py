@@ -0,0 +1,344 @@
+from sqlalchemy import text, bindparam
+from datetime import datetime, timezone
+import sys
+import src.db as db
+
+# Versioned schema. Each migration is (version, description, steps); a step is a SQL statement or a
+# function taking the connection. Applied versions are recorded in schema_migrations.
+SCHEMA_TABLE = "schema_migrations"
+
+# Price tables written by fetchOHLC (daily and hourly candles, epoch-second timestamps)
+PRICE_TABLES = ["Historical_Prices", "Historical_Prices_1h"]
+
+def _create_price_table(table):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            token_id VARCHAR(100) NOT NULL,
+            timestamp BIGINT NOT NULL,
+            open DOUBLE,
+            high DOUBLE,
+            low DOUBLE,
+            close DOUBLE,
+            PRIMARY KEY (token_id, timestamp)
+        )
+    '''
+
+CREATE_BASE_TOKENS = '''
+    CREATE TABLE IF NOT EXISTS Base_tokens (
+        id VARCHAR(100) NOT NULL PRIMARY KEY,
+        symbol VARCHAR(50),
+        name VARCHAR(255),
+        image VARCHAR(512),
+        current_price DOUBLE,
+        market_cap DOUBLE,
+        market_cap_rank INT,
+        fully_diluted_valuation DOUBLE,
+        total_volume DOUBLE,
+        high_24h DOUBLE,
+        low_24h DOUBLE,
+        price_change_24h DOUBLE,
+        price_change_percentage_24h DOUBLE,
+        market_cap_change_24h DOUBLE,
+        market_cap_change_percentage_24h DOUBLE,
+        circulating_supply DOUBLE,
+        total_supply DOUBLE,
+        max_supply DOUBLE,
+        ath DOUBLE,
+        ath_change_percentage DOUBLE,
+        ath_date VARCHAR(40),
+        atl DOUBLE,
+        atl_change_percentage DOUBLE,
+        atl_date VARCHAR(40),
+        roi TEXT,
+        last_updated VARCHAR(40)
+    )
+'''
+
+CREATE_TRADES = '''
+    CREATE TABLE IF NOT EXISTS Trades (
+        trade_id INT AUTO_INCREMENT PRIMARY KEY,
+        token_id VARCHAR(100) NOT NULL,
+        entry_date DATETIME,
+        entry_price DOUBLE,
+        exit_date DATETIME NULL,
+        exit_price DOUBLE NULL,
+        profit_loss DOUBLE NULL,
+        position_type VARCHAR(10),
+        status VARCHAR(10) NOT NULL,
+        units DOUBLE,
+        KEY idx_trades_status_token (status, token_id)
+    )
+'''
+
+CREATE_PORTFOLIO = '''
+    CREATE TABLE IF NOT EXISTS Portfolio (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        date DATETIME,
+        equity DOUBLE,
+        cash DOUBLE,
+        positions_value DOUBLE
+    )
+'''
+
+CREATE_BITCOIN_PH = '''
+    CREATE TABLE IF NOT EXISTS Bitcoin_PH (
+        btc_id VARCHAR(50) NOT NULL,
+        timestamp BIGINT NOT NULL,
+        close DOUBLE,
+        PRIMARY KEY (btc_id, timestamp)
+    )
+'''
+
+def _key_columns(conn, table):
+    """{index name: [columns in order]} plus the set of unique index names"""
+    rows = conn.execute(text('''
+        SELECT index_name, column_name, non_unique
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = :table
+        ORDER BY index_name, seq_in_index
+    '''), {"table": table}).all()
+    keys, unique = {}, set()
+    for index_name, column_name, non_unique in rows:
+        keys.setdefault(index_name, []).append(column_name)
+        if not non_unique:
+            unique.add(index_name)
+    return keys, unique
+
+def _column_names(conn, table):
+    return {row[0] for row in conn.execute(text('''
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = :table
+    '''), {"table": table})}
+
+def _ensure_unique_key(conn, table, columns):
+    """Make `columns` the primary key, or add a unique key when the table already has another primary key"""
+    keys, unique = _key_columns(conn, table)
+    if not keys and not _column_names(conn, table):
+        return  # Table doesn't exist
+    if any(keys[name] == columns for name in unique):
+        return
+    if "PRIMARY" not in keys:
+        conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(columns)})"))
+    else:
+        print(f"{table}: primary key is ({', '.join(keys['PRIMARY'])}); adding a unique key on ({', '.join(columns)})")
+        conn.execute(text(f"ALTER TABLE {table} ADD UNIQUE KEY uq_{table.lower()}_{'_'.join(columns)} ({', '.join(columns)})"))
+
+def _ensure_index(conn, table, name, columns):
+    """Add an index unless one already starts with `columns`"""
+    keys, _ = _key_columns(conn, table)
+    if not keys and not _column_names(conn, table):
+        return
+    if any(key_columns[:len(columns)] == columns for key_columns in keys.values()):
+        return
+    conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+def _ensure_portfolio_id(conn):
+    # Older databases were told to run this by hand (readme setup step 3)
+    if "id" not in _column_names(conn, "Portfolio"):
+        conn.execute(text("ALTER TABLE Portfolio ADD COLUMN id INT AUTO_INCREMENT PRIMARY KEY"))
+
+MIGRATIONS = [
+    (1, "create tables", [CREATE_BASE_TOKENS] + [_create_price_table(table) for table in PRICE_TABLES]
+        + [CREATE_TRADES, CREATE_PORTFOLIO, CREATE_BITCOIN_PH]),
+    (2, "keys on tables created before migrations", [
+        lambda conn: _ensure_unique_key(conn, "Base_tokens", ["id"]),
+        lambda conn: _ensure_unique_key(conn, "Historical_Prices", ["token_id", "timestamp"]),
+        lambda conn: _ensure_unique_key(conn, "Historical_Prices_1h", ["token_id", "timestamp"]),
+        lambda conn: _ensure_index(conn, "Trades", "idx_trades_status_token", ["status", "token_id"]),
+        _ensure_portfolio_id,
+    ]),
+]
+
+def applied_versions(conn):
+    conn.execute(text(f'''
+        CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at DATETIME
+        )
+    '''))
+    return {row[0] for row in conn.execute(text(f"SELECT version FROM {SCHEMA_TABLE}"))}
+
+def migrate(engine=None, migrations=MIGRATIONS):
+    """Apply every migration not yet recorded, in version order; returns the versions applied"""
+    engine = engine or db.get_engine()
+    applied = []
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+        for version, description, steps in sorted(migrations, key=lambda migration: migration[0]):
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {description}")
+            # MySQL commits DDL implicitly, so each migration is recorded right after its steps run
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text(f"INSERT INTO {SCHEMA_TABLE} (version, description, applied_at) VALUES (:version, :description, NOW())"),
+                         {"version": version, "description": description})
+            conn.commit()
+            applied.append(version)
+    return applied
+
+# Optional monthly RANGE partitioning of a price table on its epoch timestamp
+def _month_starts(first, last):
+    """UTC month starts from the month of `first` through the month after `last` (datetimes)"""
+    month = datetime(first.year, first.month, 1, tzinfo=timezone.utc)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=timezone.utc)
+    months.append(month)
+    return months
+
+def _partition_definitions(months):
+    """One partition per month (pYYYYMM holds timestamps before the next month starts), plus pmax"""
+    definitions = [f"PARTITION p{month:%Y%m} VALUES LESS THAN ({int(next_month.timestamp())})"
+                   for month, next_month in zip(months, months[1:])]
+    return definitions + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]
+
+def partition_by_month(engine=None, table="Historical_Prices", months_ahead=3):
+    """Partition `table` by month of timestamp, or add the missing months to an already partitioned table.
+
+    Run it again from time to time (or from cron) so future months get their own partition instead of pmax.
+    """
+    engine = engine or db.get_engine()
+    with engine.connect() as conn:
+        keys, _ = _key_columns(conn, table)
+        if "timestamp" not in keys.get("PRIMARY", []):
+            raise ValueError(f"{table}: the primary key must include timestamp to partition on it (run the migrations first)")
+        existing = [row[0] for row in conn.execute(text('''
+            SELECT partition_name FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        '''), {"table": table})]
+        now = datetime.now(timezone.utc)
+        last = datetime(now.year + (now.month + months_ahead - 1) // 12, (now.month + months_ahead - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+
+        if not existing:
+            first_timestamp = conn.execute(text(f"SELECT MIN(timestamp) FROM {table}")).scalar()
+            first = datetime.fromtimestamp(first_timestamp, timezone.utc) if first_timestamp is not None else now
+            definitions = _partition_definitions(_month_starts(first, last))
+            conn.execute(text(f"ALTER TABLE {table} PARTITION BY RANGE (timestamp) ({', '.join(definitions)})"))
+        else:
+            # pmax is split into the months that don't have a partition yet
+            newest = max(datetime.strptime(name[1:], "%Y%m").replace(tzinfo=timezone.utc) for name in existing if name != "pmax")
+            months = _month_starts(newest, last)[1:]
+            if len(months) < 2:
+                print(f"{table}: partitions already cover {last:%Y-%m}")
+                return []
+            definitions = _partition_definitions(months)
+            conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})"))
+        conn.commit()
+    print(f"{table}: {len(definitions) - 1} monthly partitions added")
+    return definitions
+
+# The queries the daily run and the ingestion repeat, as they are issued in main.py, RelativeStrength.py
+# (directly and through price_cache) and fetchOHLC.py (through watermarks). scans_ok names tables that
+# are read in full by design.
+HOT_QUERIES = [
+    {"name": "open trades", "source": "main.initialize_portfolio",
+     "sql": "SELECT * FROM Trades WHERE status = 'OPEN'"},
+    {"name": "market snapshot", "source": "main.load_market_snapshot",
+     "sql": '''
+        SELECT token_id, timestamp, open, close, NULL AS name
+        FROM Historical_Prices
+        WHERE token_id IN :token_ids AND timestamp >= :day_start AND timestamp < :day_end
+        UNION ALL
+        SELECT id, NULL, NULL, NULL, name
+        FROM Base_tokens
+        WHERE id IN :token_ids
+     '''},
+    {"name": "close trade", "source": "main.record_run",
+     "sql": "UPDATE Trades SET exit_date = NOW(), exit_price = 0, profit_loss = 0, status = 'CLOSED' WHERE trade_id = :trade_id"},
+    {"name": "token history", "source": "RelativeStrength.fetch_historical_prices",
+     "sql": "SELECT timestamp, close FROM Historical_Prices WHERE token_id = :token_id ORDER BY timestamp"},
+    {"name": "universe closes", "source": "RelativeStrength.fetch_all_closes",
+     "sql": '''
+        SELECT token_id, timestamp, close
+        FROM Historical_Prices
+        WHERE token_id IN (SELECT id FROM Base_tokens)
+        ORDER BY token_id, timestamp
+     ''', "scans_ok": {"Base_tokens"}},
+    {"name": "price range", "source": "RelativeStrength.load_prices -> price_cache._load_from_db",
+     "sql": '''
+        SELECT token_id, timestamp, open, high, low, close
+        FROM Historical_Prices
+        WHERE token_id IN :token_ids AND timestamp >= :day_start
+        ORDER BY token_id, timestamp
+     '''},
+    {"name": "price delta", "source": "RelativeStrength.load_prices -> price_cache._fetch_delta",
+     "sql": '''
+        SELECT token_id, timestamp, open, high, low, close
+        FROM Historical_Prices
+        WHERE (token_id IN :token_ids AND timestamp >= :day_start)
+     '''},
+    {"name": "ingestion watermarks", "source": "fetchOHLC.ingest_ohlc -> watermarks.IngestionWatermarks.load",
+     "sql": '''
+        SELECT b.id AS token_id, MAX(h.timestamp) AS latest_timestamp
+        FROM Base_tokens b
+        LEFT JOIN Historical_Prices h ON h.token_id = b.id
+        GROUP BY b.id
+     ''', "scans_ok": {"b"}},
+]
+
+# Keys the upserts depend on: fetchOHLC's ON DUPLICATE KEY needs (token_id, timestamp), fetch_data's needs id
+REQUIRED_UNIQUE_KEYS = {
+    "Historical_Prices": ["token_id", "timestamp"],
+    "Historical_Prices_1h": ["token_id", "timestamp"],
+    "Base_tokens": ["id"],
+}
+
+def _plan_problems(plan, scans_ok=()):
+    """Table accesses in EXPLAIN rows that read a whole table without an index"""
+    problems = []
+    for row in plan:
+        table = row.get("table")
+        if table is None or table.startswith("<") or table in scans_ok:
+            continue  # No table (constant result) or a derived/union result
+        if row.get("type") == "ALL":
+            problems.append(f"full scan of {table}")
+        elif row.get("type") not in ("const", "system", None) and row.get("key") is None:
+            problems.append(f"no index used on {table}")
+    return problems
+
+def check_query_plans(engine=None, queries=HOT_QUERIES):
+    """EXPLAIN every hot query and report the ones that don't use an index; returns True when all do.
+
+    Run it against a populated database: on near-empty tables MySQL may prefer a scan regardless.
+    """
+    engine = engine or db.get_engine()
+    ok = True
+    with engine.connect() as conn:
+        for table, columns in REQUIRED_UNIQUE_KEYS.items():
+            keys, unique = _key_columns(conn, table)
+            if keys or _column_names(conn, table):
+                if not any(keys[name] == columns for name in unique):
+                    print(f"FAIL  {table}: no unique key on ({', '.join(columns)}) for the upsert")
+                    ok = False
+
+        sample_ids = [row[0] for row in conn.execute(text("SELECT id FROM Base_tokens ORDER BY id LIMIT 3"))] or ["bitcoin"]
+        day_start = int(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+        params = {"token_ids": sample_ids, "token_id": sample_ids[0], "day_start": day_start,
+                  "day_end": day_start + 86400, "trade_id": 1}
+        for query in queries:
+            statement = text("EXPLAIN " + query["sql"])
+            if ":token_ids" in query["sql"]:
+                statement = statement.bindparams(bindparam("token_ids", expanding=True))
+            plan = [dict(row) for row in conn.execute(statement, params).mappings()]
+            problems = _plan_problems(plan, query.get("scans_ok", ()))
+            keys = ", ".join(f"{row['table']}:{row.get('key') or row.get('type')}" for row in plan if row.get("table"))
+            print(f"{'FAIL' if problems else 'ok  '}  {query['name']} ({query['source']}): {'; '.join(problems) or keys}")
+            ok = ok and not problems
+    return ok
+
+if __name__ == "__main__":
+    # python -m src.migrations [--partition-by-month] [--check-plans]
+    applied = migrate()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    if "--partition-by-month" in sys.argv:
+        partition_by_month()
+    if "--check-plans" in sys.argv:
+        sys.exit(0 if check_query_plans() else 1)
@@ -0,0 +1,130 @@
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import queue
+import time
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Bot API endpoint (overridable for a local mock server), Telegram's message size limit,
+# request timeout, retries, how long to wait for more messages before sending a batch,
+# and how long shutdown waits for the queue to drain (seconds)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_MAX_LENGTH = 4096
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+TELEGRAM_MAX_RETRIES = 5
+TELEGRAM_LINGER = float(os.getenv("TELEGRAM_LINGER", "0.5"))
+TELEGRAM_FLUSH_TIMEOUT = float(os.getenv("TELEGRAM_FLUSH_TIMEOUT", "15"))
+
+_STOP = object()
+
+def split_message(message, limit=TELEGRAM_MAX_LENGTH):
+    """Cut a message into pieces of at most `limit` characters, preferring line breaks"""
+    pieces = []
+    while len(message) > limit:
+        cut = message.rfind("\n", 0, limit)
+        cut = cut + 1 if cut > 0 else limit
+        pieces.append(message[:cut])
+        message = message[cut:]
+    if message:
+        pieces.append(message)
+    return pieces
+
+def coalesce(messages, limit=TELEGRAM_MAX_LENGTH):
+    """Join consecutive messages (one per line) into as few texts of at most `limit` characters as possible"""
+    batches = []
+    current = ""
+    for message in messages:
+        for piece in split_message(message, limit):
+            if current and len(current) + 1 + len(piece) <= limit:
+                current += "\n" + piece
+            else:
+                if current:
+                    batches.append(current)
+                current = piece
+    if current:
+        batches.append(current)
+    return batches
+
+class TelegramNotifier:
+    """Queue Telegram messages and deliver them from a background thread.
+
+    send() returns immediately. The worker coalesces queued messages into batches of up to 4096
+    characters and posts them over one pooled session, retrying connection errors and 5xx with
+    backoff and waiting out 429 responses for the retry_after the Bot API asks for. close() flushes
+    what is queued, waiting at most `flush_timeout` seconds so an outage can't hold up the run.
+    """
+
+    def __init__(self, bot_token, chat_id, api_url=TELEGRAM_API_URL, timeout=TELEGRAM_TIMEOUT,
+                 max_retries=TELEGRAM_MAX_RETRIES, linger=TELEGRAM_LINGER):
+        self.url = f"{api_url}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.linger = linger
+        self.queue = queue.Queue()
+        self.stats = {"queued": 0, "messages": 0, "batches": 0, "failed_batches": 0}
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+        self.thread.start()
+
+    def send(self, message):
+        self.stats["queued"] += 1
+        self.queue.put(message)
+
+    def close(self, flush_timeout=TELEGRAM_FLUSH_TIMEOUT):
+        """Deliver what is still queued (up to flush_timeout seconds), then stop the worker"""
+        self.queue.put(_STOP)
+        self.thread.join(flush_timeout)
+        if self.thread.is_alive():
+            print(f"Telegram: gave up flushing after {flush_timeout:.0f}s; {self.stats['queued'] - self.stats['messages']} messages not sent")
+        self.session.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            messages = [self.queue.get()]
+            # Gather whatever else arrives within the linger window into the same batches (close() ends it early)
+            deadline = time.monotonic() + self.linger
+            while messages[-1] is not _STOP:
+                try:
+                    messages.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if _STOP in messages:
+                stopping = True
+                messages = [message for message in messages if message is not _STOP]
+            for batch in coalesce(messages):
+                self._post(batch)
+            self.stats["messages"] += len(messages)
+
+    def _post(self, text):
+        """POST one batch; returns True once Telegram accepted it"""
+        for attempt in range(self.max_retries + 1):
+            delay = 2 ** attempt
+            try:
+                response = self.session.post(self.url, json={"chat_id": self.chat_id, "text": text}, timeout=self.timeout)
+                if response.status_code == 429:
+                    # The Bot API says how long to wait in parameters.retry_after
+                    try:
+                        delay = float(response.json().get("parameters", {}).get("retry_after", delay))
+                    except ValueError:
+                        pass
+                elif response.status_code < 500:
+                    response.raise_for_status()
+                    self.stats["batches"] += 1
+                    return True
+            except (requests.ConnectionError, requests.Timeout):
+                pass
+            except Exception as e:
+                print(f"Failed to send Telegram message: {e}")
+                break
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        self.stats["failed_batches"] += 1
+        return False
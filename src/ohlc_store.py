@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+
+class OHLCStore:
+    """OHLC bars sorted once by (token_id, timestamp), with one contiguous slice per token.
+
+    Token lookup is a dict access and time windows are found with searchsorted, so `window()`
+    returns numpy views into the shared arrays instead of filtering the whole table.
+    """
+
+    def __init__(self, historical_data):
+        data = historical_data.sort_values(["token_id", "timestamp"], kind="stable")
+        token_ids = data["token_id"].to_numpy()
+        self.timestamps = data["timestamp"].to_numpy()
+        self.columns = {column: data[column].to_numpy(dtype=np.float64) for column in OHLC_COLUMNS}
+        self.columns["timestamp"] = self.timestamps
+
+        # [start, stop) row range of every token
+        starts = np.flatnonzero(np.r_[True, token_ids[1:] != token_ids[:-1]]) if len(token_ids) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(token_ids)]
+        self.slices = {token_ids[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+    @classmethod
+    def from_arrays(cls, timestamps, columns, slices):
+        """Wrap arrays already sorted by (token_id, timestamp), e.g. views of shared memory, without copying"""
+        store = cls.__new__(cls)
+        store.timestamps = timestamps
+        store.columns = {**columns, "timestamp": timestamps}
+        store.slices = dict(slices)
+        return store
+
+    def __contains__(self, token_id):
+        return token_id in self.slices
+
+    def tokens(self):
+        return list(self.slices)
+
+    def _key(self, value):
+        return np.datetime64(value) if self.timestamps.dtype.kind == "M" else value
+
+    def _range(self, token_id, start=None, end=None):
+        """Row range of the token's bars with start <= timestamp <= end"""
+        if token_id not in self.slices:
+            return 0, 0
+        first, last = self.slices[token_id]
+        timestamps = self.timestamps[first:last]
+        if start is not None:
+            first += int(np.searchsorted(timestamps, self._key(start), side="left"))
+        if end is not None:
+            last = self.slices[token_id][0] + int(np.searchsorted(timestamps, self._key(end), side="right"))
+        return first, max(first, last)
+
+    def count(self, token_id, start=None, end=None):
+        first, last = self._range(token_id, start, end)
+        return last - first
+
+    def window(self, token_id, start=None, end=None):
+        """Views of the token's timestamp/open/high/low/close arrays inside the window (no copy)"""
+        first, last = self._range(token_id, start, end)
+        return {column: values[first:last] for column, values in self.columns.items()}
+
+    def frame(self, token_id, start=None, end=None):
+        """The token's bars inside the window as a DataFrame with a fresh RangeIndex"""
+        bars = self.window(token_id, start, end)
+        return pd.DataFrame({
+            "token_id": token_id,
+            "timestamp": bars["timestamp"],
+            **{column: bars[column] for column in OHLC_COLUMNS},
+        })
+
+    def closes(self, token_id, end=None):
+        """The token's closes up to `end` as a Series indexed by timestamp"""
+        bars = self.window(token_id, end=end)
+        return pd.Series(bars["close"], index=pd.Index(bars["timestamp"], name="timestamp"), name="close")
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam
+from dotenv import load_dotenv
+import json
+import os
+import src.db as db
+import src.storage as storage
+from src.watermarks import IngestionWatermarks
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # Without pyarrow every load goes straight to the database
+    pa = None
+
+# Load environment variables
+load_dotenv()
+
+# Local columnar mirror of Historical_Prices: one Arrow IPC file per calendar month
+PRICE_CACHE_DIR = os.getenv("PRICE_CACHE_DIR", "src/price_cache")
+COLUMNS = ["token_id", "timestamp", "open", "high", "low", "close"]
+
+def available():
+    return pa is not None
+
+def _partition_path(month, cache_dir):
+    return os.path.join(cache_dir, f"month={month}.arrow")
+
+def _partition_months(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return []
+    return sorted(name[len("month="):-len(".arrow")] for name in os.listdir(cache_dir)
+                  if name.startswith("month=") and name.endswith(".arrow"))
+
+def _month_of(timestamps):
+    return np.asarray(timestamps, dtype="datetime64[s]").astype("datetime64[M]").astype(str)
+
+def _read_manifest(cache_dir):
+    """Latest cached timestamp per token"""
+    path = os.path.join(cache_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, "manifest.json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(path + ".tmp", path)
+
+def _read_partition(path):
+    # Memory-mapped: column buffers point straight into the file
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def _write_partition(path, df):
+    table = pa.Table.from_pandas(df[COLUMNS], preserve_index=False)
+    with pa.OSFile(path + ".tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + ".tmp", path)
+
+# Rows that changed in the database since each token's cached watermark
+def _fetch_delta(stale):
+    conditions = []
+    params = {}
+    bindparams = []
+    for k, (since, token_ids) in enumerate(stale.items()):
+        conditions.append(f"(token_id IN :tokens_{k} AND timestamp >= :since_{k})")
+        params[f"tokens_{k}"] = token_ids
+        params[f"since_{k}"] = since
+        bindparams.append(bindparam(f"tokens_{k}", expanding=True))
+    query = text(f'''
+        SELECT token_id, timestamp, open, high, low, close
+        FROM Historical_Prices
+        WHERE {" OR ".join(conditions)}
+    ''').bindparams(*bindparams)
+    with db.get_engine().connect() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+def _is_stale(manifest, watermarks, cache_dir):
+    """True when the cache has bars newer than the database's, or lost a partition the manifest points to"""
+    months = set(_partition_months(cache_dir))
+    for token_id, cached_timestamp in manifest.items():
+        if token_id in watermarks.latest and (watermarks.latest[token_id] or 0) < cached_timestamp:
+            return True  # Rows were deleted or the database was replaced
+        if _month_of([cached_timestamp])[0] not in months:
+            return True
+    return False
+
+def _clear(cache_dir):
+    for month in _partition_months(cache_dir):
+        os.remove(_partition_path(month, cache_dir))
+    if os.path.exists(os.path.join(cache_dir, "manifest.json")):
+        os.remove(os.path.join(cache_dir, "manifest.json"))
+
+def refresh(cache_dir=PRICE_CACHE_DIR):
+    """Bring the cache up to date with the database; returns the database watermarks"""
+    watermarks = IngestionWatermarks(db.get_engine()).load()
+    if pa is None:
+        return watermarks
+
+    # A cache that no longer matches the database is rebuilt from scratch
+    manifest = _read_manifest(cache_dir)
+    if manifest and _is_stale(manifest, watermarks, cache_dir):
+        print(f"Price cache in {cache_dir} is out of sync with the database; rebuilding it")
+        _clear(cache_dir)
+        manifest = {}
+
+    # Each cached token is re-read from its last cached bar, which may have been revised since
+    stale = {}
+    for token_id, latest_timestamp in watermarks.as_dict().items():
+        since = manifest.get(token_id, 0)
+        if latest_timestamp >= since:
+            stale.setdefault(since, []).append(token_id)
+    if not stale:
+        return watermarks
+    delta = _fetch_delta(stale)
+    if delta.empty:
+        return watermarks
+
+    # Merge the delta into the monthly partitions it touches
+    os.makedirs(cache_dir, exist_ok=True)
+    delta = delta.astype({"token_id": str, "timestamp": np.int64, "open": np.float64,
+                          "high": np.float64, "low": np.float64, "close": np.float64})
+    delta["month"] = _month_of(delta["timestamp"].to_numpy())
+    for month, rows in delta.groupby("month"):
+        path = _partition_path(month, cache_dir)
+        if os.path.exists(path):
+            rows = pd.concat([_read_partition(path).to_pandas(), rows[COLUMNS]], ignore_index=True)
+        rows = rows.drop_duplicates(["token_id", "timestamp"], keep="last").sort_values(["token_id", "timestamp"])
+        _write_partition(path, rows)
+
+    for token_id, latest_timestamp in delta.groupby("token_id")["timestamp"].max().items():
+        manifest[token_id] = max(int(latest_timestamp), manifest.get(token_id, 0))
+    _write_manifest(cache_dir, manifest)
+    return watermarks
+
+def _load_from_db(columns, token_ids, start, end, table="Historical_Prices"):
+    return storage.get_storage().load_prices(columns, token_ids, start, end, table)
+
+def load(columns=None, token_ids=None, start=None, end=None, parse_dates=False, cache_dir=PRICE_CACHE_DIR):
+    """Load Historical_Prices rows ordered by token and time.
+
+    `columns` selects columns, `token_ids` a token subset and `start`/`end` an inclusive window
+    in epoch seconds. With parse_dates the timestamp column comes back as datetimes.
+    """
+    columns = list(columns or COLUMNS)
+    if token_ids is not None and len(token_ids) == 0:
+        return pd.DataFrame(columns=columns)
+    if pa is None:
+        df = _load_from_db(columns, token_ids, start, end)
+        if parse_dates and "timestamp" in df:
+            df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
+        return df
+
+    # Only open the monthly partitions that overlap the window
+    months = _partition_months(cache_dir)
+    if start is not None:
+        months = [month for month in months if month >= _month_of([start])[0]]
+    if end is not None:
+        months = [month for month in months if month <= _month_of([end])[0]]
+
+    read_columns = list(dict.fromkeys(columns + ["token_id", "timestamp"]))
+    tables = []
+    for month in months:
+        table = _read_partition(_partition_path(month, cache_dir)).select(read_columns)
+        mask = None
+        if token_ids is not None:
+            mask = pc.is_in(table["token_id"], value_set=pa.array(list(token_ids), type=pa.string()))
+        if start is not None:
+            in_window = pc.greater_equal(table["timestamp"], start)
+            mask = in_window if mask is None else pc.and_(mask, in_window)
+        if end is not None:
+            in_window = pc.less_equal(table["timestamp"], end)
+            mask = in_window if mask is None else pc.and_(mask, in_window)
+        tables.append(table.filter(mask) if mask is not None else table)
+    if not tables:
+        return pd.DataFrame(columns=columns)
+
+    table = pa.concat_tables(tables).sort_by([("token_id", "ascending"), ("timestamp", "ascending")])
+    if parse_dates:
+        table = table.set_column(table.schema.get_field_index("timestamp"), "timestamp",
+                                 pc.cast(table["timestamp"], pa.timestamp("s")))
+    return table.select(columns).to_pandas()
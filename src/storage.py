@@ -0,0 +1,258 @@
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+import os
+import sys
+import time
+import src.db as db
+from src.watermarks import IngestionWatermarks
+
+# Columns of a price table, in the order every loader returns them
+PRICE_COLUMNS = ["token_id", "timestamp", "open", "high", "low", "close"]
+
+class SQLStorage(ABC):
+    """Reads and writes of the bot's tables through one SQLAlchemy engine.
+
+    Everything is portable SQL except the upsert syntax and the schema setup, which each backend
+    provides. Upserts run on a connection the caller holds, so it decides when to commit.
+    """
+
+    name = None
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @abstractmethod
+    def upsert_sql(self, table, columns, key_columns):
+        """INSERT statement for `columns` that updates the non-key columns of an existing row"""
+
+    @abstractmethod
+    def create_schema(self):
+        """Create the tables and indexes (idempotent)"""
+
+    def _upsert(self, conn, table, rows, key_columns):
+        if not rows:
+            return 0
+        columns = list(rows[0])
+        conn.execute(text(self.upsert_sql(table, columns, key_columns)), rows)
+        return len(rows)
+
+    def upsert_tokens(self, conn, rows):
+        """Insert or update Base_tokens rows (dicts keyed by column) in one executemany"""
+        return self._upsert(conn, "Base_tokens", rows, ["id"])
+
+    def stored_token_ids(self, conn, token_ids):
+        """The subset of token_ids present in Base_tokens"""
+        query = text("SELECT id FROM Base_tokens WHERE id IN :token_ids").bindparams(bindparam("token_ids", expanding=True))
+        return set(conn.execute(query, {"token_ids": list(token_ids)}).scalars())
+
+    def upsert_ohlc(self, conn, rows, table="Historical_Prices"):
+        """Insert or update (token_id, timestamp, open, high, low, close) rows in one executemany"""
+        return self._upsert(conn, table, rows, ["token_id", "timestamp"])
+
+    def latest_timestamps(self, table="Historical_Prices"):
+        """Every Base_tokens id with its latest stored timestamp (None without bars)"""
+        return IngestionWatermarks(self.engine, table).load().latest
+
+    def load_prices(self, columns=None, token_ids=None, start=None, end=None, table="Historical_Prices"):
+        """Price rows ordered by token and time, optionally limited to tokens and an inclusive timestamp range"""
+        conditions = ["1 = 1"]
+        params = {}
+        bindparams = []
+        if token_ids is not None:
+            conditions.append("token_id IN :token_ids")
+            params["token_ids"] = list(token_ids)
+            bindparams.append(bindparam("token_ids", expanding=True))
+        if start is not None:
+            conditions.append("timestamp >= :start")
+            params["start"] = start
+        if end is not None:
+            conditions.append("timestamp <= :end")
+            params["end"] = end
+        query = text(f'''
+            SELECT {", ".join(columns or PRICE_COLUMNS)}
+            FROM {table}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY token_id, timestamp
+        ''').bindparams(*bindparams)
+        with self.engine.connect() as conn:
+            return pd.read_sql(query, conn, params=params)
+
+    def open_trades(self):
+        with self.engine.connect() as conn:
+            return pd.read_sql(text("SELECT * FROM Trades WHERE status = 'OPEN'"), conn)
+
+    def record_trades(self, closed_trades=(), opened_trades=(), portfolio_rows=()):
+        """Close trades, open trades and append portfolio rows in one transaction"""
+        with self.engine.begin() as conn:
+            if closed_trades:
+                conn.execute(
+                    text("""
+                        UPDATE Trades
+                        SET exit_date = :exit_date, exit_price = :exit_price,
+                            profit_loss = :profit_loss, status = 'CLOSED'
+                        WHERE trade_id = :trade_id
+                    """),
+                    list(closed_trades)
+                )
+            if opened_trades:
+                conn.execute(
+                    text("""
+                        INSERT INTO Trades (token_id, entry_date, entry_price, position_type, status, units)
+                        VALUES (:token_id, :entry_date, :entry_price, :position_type, :status, :units)
+                    """),
+                    list(opened_trades)
+                )
+            if portfolio_rows:
+                conn.execute(
+                    text("INSERT INTO Portfolio (date, equity, cash, positions_value) VALUES (:date, :equity, :cash, :positions_value)"),
+                    list(portfolio_rows)
+                )
+
+class MySQLStorage(SQLStorage):
+    name = "mysql"
+
+    def upsert_sql(self, table, columns, key_columns):
+        updates = [column for column in columns if column not in key_columns]
+        return f'''
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES ({", ".join(f":{column}" for column in columns)})
+            ON DUPLICATE KEY UPDATE
+                {", ".join(f"{column} = VALUES({column})" for column in updates)}
+        '''
+
+    def create_schema(self):
+        # The versioned migrations own the MySQL schema
+        import src.migrations as migrations
+        migrations.migrate(self.engine)
+
+# SQLite versions of the tables in src/migrations.py (same columns and keys)
+SQLITE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS Base_tokens (
+        id TEXT PRIMARY KEY, symbol TEXT, name TEXT, image TEXT, current_price REAL, market_cap REAL,
+        market_cap_rank INTEGER, fully_diluted_valuation REAL, total_volume REAL, high_24h REAL, low_24h REAL,
+        price_change_24h REAL, price_change_percentage_24h REAL, market_cap_change_24h REAL,
+        market_cap_change_percentage_24h REAL, circulating_supply REAL, total_supply REAL, max_supply REAL,
+        ath REAL, ath_change_percentage REAL, ath_date TEXT, atl REAL, atl_change_percentage REAL,
+        atl_date TEXT, roi TEXT, last_updated TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Historical_Prices (
+        token_id TEXT NOT NULL, timestamp INTEGER NOT NULL, open REAL, high REAL, low REAL, close REAL,
+        PRIMARY KEY (token_id, timestamp)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS Historical_Prices_1h (
+        token_id TEXT NOT NULL, timestamp INTEGER NOT NULL, open REAL, high REAL, low REAL, close REAL,
+        PRIMARY KEY (token_id, timestamp)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS Trades (
+        trade_id INTEGER PRIMARY KEY AUTOINCREMENT, token_id TEXT NOT NULL, entry_date TEXT, entry_price REAL,
+        exit_date TEXT, exit_price REAL, profit_loss REAL, position_type TEXT, status TEXT NOT NULL, units REAL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_trades_status_token ON Trades (status, token_id)",
+    '''CREATE TABLE IF NOT EXISTS Portfolio (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, equity REAL, cash REAL, positions_value REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Bitcoin_PH (
+        btc_id TEXT NOT NULL, timestamp INTEGER NOT NULL, close REAL, PRIMARY KEY (btc_id, timestamp)
+    )''',
+]
+
+class SQLiteStorage(SQLStorage):
+    name = "sqlite"
+
+    def upsert_sql(self, table, columns, key_columns):
+        updates = [column for column in columns if column not in key_columns]
+        return f'''
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES ({", ".join(f":{column}" for column in columns)})
+            ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET
+                {", ".join(f"{column} = excluded.{column}" for column in updates)}
+        '''
+
+    def create_schema(self):
+        with self.engine.begin() as conn:
+            for statement in SQLITE_SCHEMA:
+                conn.execute(text(statement))
+
+BACKENDS = {"mysql": MySQLStorage, "sqlite": SQLiteStorage}
+
+def for_engine(engine):
+    """Storage for an engine, picked by its dialect"""
+    return BACKENDS[engine.dialect.name](engine)
+
+_storage = None
+
+def get_storage():
+    """Storage for the configured DB_BACKEND, on the shared engine (SQLite tables are created on first use)"""
+    global _storage
+    if _storage is None:
+        storage = for_engine(db.get_engine())
+        if storage.name == "sqlite":
+            storage.create_schema()
+        _storage = storage
+    return _storage
+
+# Copy the MySQL tables into the SQLite file so backtests and the bot can run offline
+def copy_to_sqlite(source=None, target=None, chunk_size=50000):
+    source = source or MySQLStorage(db.get_engine())
+    if target is None:
+        target = SQLiteStorage(create_engine(db.database_url("sqlite")))
+    target.create_schema()
+    with source.engine.connect() as source_conn, target.engine.begin() as target_conn:
+        for table, key_columns in [("Base_tokens", ["id"]), ("Historical_Prices", ["token_id", "timestamp"]),
+                                   ("Historical_Prices_1h", ["token_id", "timestamp"]), ("Bitcoin_PH", ["btc_id", "timestamp"]),
+                                   ("Trades", ["trade_id"]), ("Portfolio", ["id"])]:
+            copied = 0
+            try:
+                result = source_conn.execution_options(stream_results=True).execute(text(f"SELECT * FROM {table}"))
+            except Exception as e:
+                print(f"Skipping {table}: {e}")
+                source_conn.rollback()
+                continue
+            columns = list(result.keys())
+            for rows in result.partitions(chunk_size):
+                copied += target._upsert(target_conn, table, [dict(zip(columns, row)) for row in rows], key_columns)
+            print(f"{table}: {copied} rows")
+    return target
+
+# Time the full-history bulk price load on each backend
+def benchmark(storages, repeat=3):
+    for storage in storages:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            prices = storage.load_prices()
+            timings.append(time.perf_counter() - start)
+        print(f"{storage.name}: {len(prices)} rows in {min(timings):.2f}s "
+              f"({len(prices) / max(min(timings), 1e-9):.0f} rows/s)")
+
+def _synthetic_sqlite(path, n_tokens=300, n_days=730):
+    """SQLite file filled with random-walk daily bars, for benchmarking without a MySQL copy"""
+    storage = SQLiteStorage(create_engine(f"sqlite:///{path}"))
+    storage.create_schema()
+    rng = np.random.default_rng(0)
+    with storage.engine.begin() as conn:
+        for token in range(n_tokens):
+            closes = np.exp(np.cumsum(rng.normal(0, 0.05, n_days)))
+            storage.upsert_ohlc(conn, [{"token_id": f"token-{token:04d}", "timestamp": 1600000000 + 86400 * day,
+                                        "open": float(close), "high": float(close * 1.02), "low": float(close * 0.98), "close": float(close)}
+                                       for day, close in enumerate(closes)])
+    return storage
+
+if __name__ == "__main__":
+    # python -m src.storage --copy-to-sqlite | --benchmark
+    if "--copy-to-sqlite" in sys.argv:
+        copy_to_sqlite()
+    if "--benchmark" in sys.argv:
+        storages = []
+        if db.DB_CONFIG["user"]:
+            storages.append(MySQLStorage(create_engine(db.database_url("mysql"))))
+        if os.path.exists(db.SQLITE_PATH):
+            storages.append(SQLiteStorage(create_engine(db.database_url("sqlite"))))
+        if not storages:
+            import tempfile
+            scratch = tempfile.mkdtemp()
+            print("No MySQL configuration or SQLite copy found; benchmarking a synthetic SQLite database")
+            storages.append(_synthetic_sqlite(os.path.join(scratch, "synthetic.sqlite")))
+        benchmark(storages)
@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import math
+import os
+
+# Per-token indicator state kept between runs of the daily job
+SIGNAL_STATE_DIR = os.getenv("SIGNAL_STATE_DIR", "src/signal_state")
+
+NAN = float("nan")
+
+class _TalibEMA:
+    """TA-Lib EMA: seeded with the mean of the first `period` values, then prev + (x - prev) * k"""
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        if self.count < self.period:
+            self.total += x
+            self.count += 1
+            if self.count == self.period:
+                self.value = self.total / self.period
+            return self.value
+        self.value = ((x - self.value) * self.k) + self.value
+        return self.value
+
+class _TalibDEMA:
+    """TA-Lib DEMA (2 * EMA - EMA of EMA), starting at the first non-NaN input like the talib wrapper"""
+
+    def __init__(self, period):
+        self.started = False
+        self.ema = _TalibEMA(period)
+        self.ema_of_ema = _TalibEMA(period)
+
+    def update(self, x):
+        if not self.started:
+            if math.isnan(x):
+                return NAN
+            self.started = True
+        ema = self.ema.update(x)
+        if self.ema.count < self.ema.period:
+            return NAN
+        ema_of_ema = self.ema_of_ema.update(ema)
+        if self.ema_of_ema.count < self.ema_of_ema.period:
+            return NAN
+        return 2.0 * ema - ema_of_ema
+
+class _TalibTrueRange:
+    """TA-Lib TRANGE, starting at the first bar where high, low and close are all present"""
+
+    def __init__(self):
+        self.started = False
+        self.prev_close = NAN
+
+    def update(self, high, low, close):
+        if not self.started:
+            if math.isnan(high) or math.isnan(low) or math.isnan(close):
+                return NAN
+            self.started = True
+            self.prev_close = close
+            return NAN
+        greatest = high - low
+        val2 = abs(self.prev_close - high)
+        if val2 > greatest:
+            greatest = val2
+        val3 = abs(self.prev_close - low)
+        if val3 > greatest:
+            greatest = val3
+        self.prev_close = close
+        return greatest
+
+class _RMA:
+    """pandas ewm(alpha=1/length, min_periods=length, adjust=False).mean(), one value at a time"""
+
+    def __init__(self, length):
+        self.min_periods = length
+        # pandas goes through the center of mass, so derive alpha the same way
+        comass = (1 - 1 / length) / (1 / length)
+        self.alpha = 1.0 / (1.0 + comass)
+        self.weighted = NAN
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, x):
+        is_observation = not math.isnan(x)
+        self.nobs += is_observation
+        if not math.isnan(self.weighted):
+            self.old_wt *= 1.0 - self.alpha
+            if is_observation:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif is_observation:
+            self.weighted = x
+        return self.weighted if self.nobs >= self.min_periods else NAN
+
+class StreamingDemaDmi:
+    """Bar-by-bar indicators.dema_dmi: DEMA of high/low, RMA-smoothed +DI/-DI and ADX"""
+
+    def __init__(self, len_dema=5, adx_smoothing_len=3, di_len=5):
+        self.demah = _TalibDEMA(len_dema)
+        self.demal = _TalibDEMA(len_dema)
+        self.true_range = _TalibTrueRange()
+        self.rma_tr = _RMA(di_len)
+        self.rma_plus = _RMA(di_len)
+        self.rma_minus = _RMA(di_len)
+        self.rma_adx = _RMA(adx_smoothing_len)
+        self.prev_demah = NAN
+        self.prev_demal = NAN
+        self.prev_adx = NAN
+        self.signal = NAN
+
+    def update(self, high, low, close):
+        """Add one bar and return the forward-filled signal (1 long, -1 short, NaN before the first)"""
+        demah = self.demah.update(high)
+        demal = self.demal.update(low)
+        u = demah - self.prev_demah
+        d = -(demal - self.prev_demal)
+        self.prev_demah, self.prev_demal = demah, demal
+        p = u if (u > d) and (u > 0) else 0.0
+        m = d if (d > u) and (d > 0) else 0.0
+
+        t = self.rma_tr.update(self.true_range.update(high, low, close))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            plus = float(np.nan_to_num(100 * np.float64(self.rma_plus.update(p)) / t))
+            minus = float(np.nan_to_num(100 * np.float64(self.rma_minus.update(m)) / t))
+
+        sum_dm = plus + minus
+        adx = 100 * self.rma_adx.update(abs(plus - minus) / (1 if sum_dm == 0 else sum_dm))
+        adx_rising = adx > self.prev_adx
+        self.prev_adx = adx
+
+        dmil = (plus > minus) and adx_rising
+        dmis = minus > plus
+        if dmil and not dmis:
+            self.signal = 1.0
+        elif dmis:
+            self.signal = -1.0
+        return self.signal
+
+class StreamingCHOCH:
+    """Bar-by-bar swing_highs_lows + bos_choch, keeping only the previous bar and the last three swing points"""
+
+    def __init__(self):
+        self.prev_high = NAN
+        self.prev_low = NAN
+        self.swings = []  # [(HighLow, Level)] of the last three swing points, oldest first
+
+    def update(self, high, low):
+        """Add one bar and return its (CHOCH, Level); both NaN when the bar has no CHOCH"""
+        if high > self.prev_high:
+            swing = (1.0, high)
+        elif low < self.prev_low:
+            swing = (-1.0, low)
+        else:
+            swing = None
+        self.prev_high, self.prev_low = high, low
+        if swing is None:
+            return NAN, NAN
+
+        self.swings = (self.swings + [swing])[-3:]
+        choch, level = 0.0, 0.0
+        if len(self.swings) >= 2:
+            (hl_1, level_1), (hl_2, level_2) = self.swings[-2:]
+            if hl_1 == 1 and hl_2 == -1 and level_2 < level_1:
+                choch, level = -1.0, level_1
+        if len(self.swings) == 3:
+            (hl_0, level_0), (hl_1, level_1), (hl_2, level_2) = self.swings
+            if hl_0 == 1 and hl_1 == -1 and hl_2 == 1 and level_1 < level_0 and level_2 > level_0:
+                choch, level = 1.0, level_1
+        return (choch if choch != 0 else NAN), (level if level != 0 else NAN)
+
+def _epoch(timestamp):
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    return int(pd.Timestamp(timestamp).timestamp())
+
+def _epochs(timestamps):
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == "M":
+        return timestamps.astype("datetime64[s]").astype(np.int64)
+    return timestamps.astype(np.int64)
+
+def _history_hash(epochs, highs, lows, closes):
+    """Hash of every bar's timestamp, high, low and close, so a revision anywhere in the history shows"""
+    bars = np.column_stack([np.asarray(epochs, dtype=np.float64), highs, lows, closes])
+    return hashlib.sha1(np.ascontiguousarray(bars).tobytes()).hexdigest()
+
+class TokenSignalState:
+    """DEMA-DMI and CHOCH state for one token, plus the values main.py reads from the last two bars"""
+
+    def __init__(self, len_dema=5, adx_smoothing_len=3, di_len=5):
+        self.params = [len_dema, adx_smoothing_len, di_len]
+        self.dema_dmi = StreamingDemaDmi(len_dema, adx_smoothing_len, di_len)
+        self.choch = StreamingCHOCH()
+        self.bars = 0
+        self.last_timestamp = None
+        self.history_hash = None  # set by update_frame once the state covers all of a frame's bars
+        self.signal = NAN
+        self.previous_signal = NAN
+        self.latest_choch = NAN
+
+    def update(self, timestamp, high, low, close):
+        """Add one bar (O(1)) and return (signal, CHOCH) for it"""
+        self.previous_signal = self.signal
+        self.signal = self.dema_dmi.update(high, low, close)
+        self.latest_choch, _ = self.choch.update(high, low)
+        self.bars += 1
+        self.last_timestamp = _epoch(timestamp)
+        self.history_hash = None
+        return self.signal, self.latest_choch
+
+    def update_frame(self, token_data):
+        """Feed the rows of `token_data` that are newer than the last processed bar"""
+        timestamps = _epochs(token_data["timestamp"].to_numpy())
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(np.searchsorted(timestamps, self.last_timestamp, side="right"))
+        highs = token_data["high"].to_numpy(dtype=np.float64)
+        lows = token_data["low"].to_numpy(dtype=np.float64)
+        closes = token_data["close"].to_numpy(dtype=np.float64)
+        for i in range(start, len(timestamps)):
+            self.update(int(timestamps[i]), float(highs[i]), float(lows[i]), float(closes[i]))
+        if self.bars == len(timestamps):
+            self.history_hash = _history_hash(timestamps, highs, lows, closes)
+        return self
+
+    def matches(self, token_data):
+        """True if `token_data` starts with exactly the bars already processed (none was revised)"""
+        if self.last_timestamp is None:
+            return True
+        if self.history_hash is None or len(token_data) < self.bars:
+            return False
+        seen = token_data.iloc[:self.bars]
+        epochs = _epochs(seen["timestamp"].to_numpy())
+        if int(epochs[-1]) != self.last_timestamp:
+            return False
+        return _history_hash(epochs, *(seen[column].to_numpy(dtype=np.float64) for column in ("high", "low", "close"))) == self.history_hash
+
+    def snapshot(self):
+        """Plain-dict copy of the state that json can store"""
+        def fields(obj):
+            return {name: (fields(value) if hasattr(value, "__dict__") else value)
+                    for name, value in vars(obj).items()}
+        return fields(self)
+
+    @classmethod
+    def restore(cls, snapshot):
+        """Rebuild a state from snapshot()"""
+        state = cls(*snapshot["params"])
+
+        def assign(obj, values):
+            for name, value in values.items():
+                if isinstance(value, dict):
+                    assign(getattr(obj, name), value)
+                else:
+                    setattr(obj, name, [tuple(swing) for swing in value] if name == "swings" else value)
+
+        assign(state, snapshot)
+        return state
+
+class SignalStateStore:
+    """TokenSignalState per token of one timeframe, saved as one json file between runs"""
+
+    def __init__(self, path=None, timeframe="1d", **params):
+        # Each timeframe has its own file, so 4h signals never advance the daily state
+        name = "signal_state.json" if timeframe == "1d" else f"signal_state_{timeframe}.json"
+        self.path = path or os.path.join(SIGNAL_STATE_DIR, name)
+        self.params = params
+        self.states = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                self.states = {token_id: TokenSignalState.restore(snapshot)
+                               for token_id, snapshot in json.load(file).items()}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as file:
+            json.dump({token_id: state.snapshot() for token_id, state in self.states.items()}, file)
+        os.replace(self.path + ".tmp", self.path)
+
+    def advance(self, token_id, token_data):
+        """Bring the token's state up to the last row of `token_data` (sorted by timestamp).
+
+        Only new bars are processed; the state is replayed from scratch when the token is new,
+        the parameters changed or a bar it already saw was revised. The stored state stops before
+        the last row, which is the candle ingestion rewrites until it closes: that row is fed to
+        the returned copy on every run instead of being saved.
+        """
+        closed = token_data.iloc[:-1]
+        state = self.states.get(token_id)
+        if state is None or state.params != TokenSignalState(**self.params).params or not state.matches(closed):
+            state = TokenSignalState(**self.params)
+        self.states[token_id] = state.update_frame(closed)
+        return TokenSignalState.restore(state.snapshot()).update_frame(token_data)
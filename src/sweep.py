@@ -0,0 +1,225 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from datetime import datetime, timedelta
+import itertools
+import json
+import os
+import sys
+import src.RelativeStrength as RelativeStrength
+import src.backtest as backtest
+from src.ohlc_store import OHLCStore, OHLC_COLUMNS
+
+# Parameter grid swept by default; RSI/EMA come first so consecutive runs can reuse relative strength
+PARAM_GRID = {
+    "rsi_period": [10, 14, 21],
+    "ema_period": [3, 5],
+    "len_dema": [5, 8],
+    "adx_smoothing_len": [3, 5],
+    "di_len": [5, 8],
+    "max_positions": [2, 3, 5],
+}
+SWEEP_RESULTS_PATH = os.getenv("SWEEP_RESULTS_PATH", "src/sweep_results.csv")
+
+# Columns filled by compute_metrics (NaN for a run that failed)
+METRIC_COLUMNS = ["final_equity", "total_return_pct", "max_drawdown_pct", "sharpe", "trades"]
+
+def expand_grid(grid):
+    """Every combination of the grid as a list of parameter dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def _run_key(params):
+    return json.dumps(params, sort_keys=True)
+
+# Equity-curve metrics for one run
+def compute_metrics(final_equity, equity_curve, trades, initial_balance=1000):
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    max_drawdown = 0.0
+    sharpe = 0.0
+    if len(equity) > 1:
+        max_drawdown = float(((equity / np.maximum.accumulate(equity)) - 1).min() * 100)
+        returns = np.diff(equity) / equity[:-1]
+        if returns.std() > 0:
+            sharpe = float(returns.mean() / returns.std() * np.sqrt(365))  # Daily candles, crypto trades every day
+    return {
+        "final_equity": float(final_equity),
+        "total_return_pct": float((final_equity / initial_balance - 1) * 100),
+        "max_drawdown_pct": max_drawdown,
+        "sharpe": sharpe,
+        "trades": len(trades),
+    }
+
+# Copy the store's arrays into shared memory blocks that worker processes map without copying
+def _publish(store):
+    blocks = []
+    specs = {}
+    for column in ["timestamp"] + OHLC_COLUMNS:
+        values = np.ascontiguousarray(store.columns[column])
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        blocks.append(block)
+        specs[column] = (block.name, values.shape, values.dtype.str)
+    return blocks, specs
+
+# Worker state: the shared store plus a relative strength cache for the current RSI/EMA settings
+_worker = {}
+
+def _init_worker(specs, slices, tokens, backtest_dates, final_timestamp, initial_balance):
+    arrays = {}
+    blocks = []
+    for column, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[column] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    timestamps = arrays.pop("timestamp")
+    # The sweep already runs one backtest per process; relative strength must not start a pool of its own
+    RelativeStrength.RS_WORKERS = 1
+    _worker.update(
+        blocks=blocks,
+        store=OHLCStore.from_arrays(timestamps, arrays, slices),
+        tokens=tokens,
+        backtest_dates=backtest_dates,
+        final_timestamp=final_timestamp,
+        initial_balance=initial_balance,
+        rs_params=None,
+        rs_cache={},
+    )
+
+def _run_params(params):
+    rs_params = (params["rsi_period"], params["ema_period"])
+    if rs_params != _worker["rs_params"]:
+        _worker["rs_params"] = rs_params
+        _worker["rs_cache"] = {}
+    store = _worker["store"]
+    market = backtest.WalkForwardMarket(store, _worker["tokens"], params, _worker["rs_cache"])
+    balance, portfolio, equity_curve, timestamps, trades = backtest.simulate(
+        market, _worker["backtest_dates"], _worker["initial_balance"], params["max_positions"], verbose=False)
+
+    # Value open positions at the last price, as run_backtest does
+    final_equity = balance
+    for token_id in portfolio:
+        final_price = market.last_price(token_id, _worker["final_timestamp"])
+        if final_price is not None:
+            final_equity += portfolio[token_id]["shares"] * final_price
+    return params, compute_metrics(final_equity, equity_curve, trades, _worker["initial_balance"])
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_csv(path)
+
+def _append_checkpoint(path, row):
+    columns = list(row)
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            columns = file.readline().rstrip("\n").split(",")
+        if set(columns) != set(row):
+            # A checkpoint written with other columns (e.g. before the error column) is rewritten once
+            pd.concat([_load_checkpoint(path), pd.DataFrame([row])], ignore_index=True).to_csv(path, index=False)
+            return
+    pd.DataFrame([row])[columns].to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+def _completed_keys(done):
+    """Run keys with a successful row in the checkpoint (failed runs are tried again)"""
+    if "run_key" not in done:
+        return set()
+    if "error" in done:
+        done = done[done["error"].isna() | (done["error"] == "")]
+    return set(done["run_key"])
+
+def run_sweep(grid=None, workers=None, checkpoint_path=SWEEP_RESULTS_PATH, start_date=None, end_date=None, initial_balance=1000,
+              historical_data=None, tokens=None):
+    """Backtest every combination of `grid` in a process pool and return the results table.
+
+    Each finished run is appended to the checkpoint CSV right away, and runs already in it are
+    skipped, so an interrupted sweep resumes where it stopped. A run that raises is recorded with
+    its error (and NaN metrics) instead of stopping the sweep, and is tried again on the next one.
+    """
+    runs = expand_grid(grid or PARAM_GRID)
+    for params in runs:
+        for name, value in backtest.DEFAULT_PARAMS.items():
+            params.setdefault(name, value)
+        params.setdefault("max_positions", 3)
+
+    done = _load_checkpoint(checkpoint_path)
+    done_keys = _completed_keys(done)
+    pending = [params for params in runs if _run_key(params) not in done_keys]
+    print(f"Sweep: {len(runs)} runs, {len(runs) - len(pending)} already in {checkpoint_path}")
+
+    if pending:
+        end_date = end_date or datetime(2025, 3, 22)
+        start_date = start_date or end_date - timedelta(days=180)
+        if historical_data is None:
+            historical_data = backtest.load_historical_data()
+        store = OHLCStore(historical_data)
+        backtest_dates = backtest.get_backtest_dates(historical_data, start_date, end_date)
+        tokens = tokens if tokens is not None else RelativeStrength.fetch_all_tokens()
+        final_timestamp = historical_data["timestamp"].max()
+
+        blocks, specs = _publish(store)
+        try:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                     initargs=(specs, store.slices, tokens, backtest_dates, final_timestamp, initial_balance)) as pool:
+                futures = {pool.submit(_run_params, params): params for params in pending}
+                for completed, future in enumerate(as_completed(futures), 1):
+                    params = futures[future]
+                    try:
+                        _, metrics = future.result()
+                        error = ""
+                        print(f"[{completed}/{len(pending)}] {params} -> equity ${metrics['final_equity']:.2f}")
+                    except Exception as e:
+                        metrics = dict.fromkeys(METRIC_COLUMNS, np.nan)
+                        error = f"{type(e).__name__}: {e}"
+                        print(f"[{completed}/{len(pending)}] {params} -> failed: {error}")
+                    _append_checkpoint(checkpoint_path, {**params, **metrics, "error": error, "run_key": _run_key(params)})
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # The latest row of each run counts (a failed run may have succeeded on a later sweep)
+    results = _load_checkpoint(checkpoint_path)
+    results = results[results["run_key"].isin({_run_key(params) for params in runs})].drop_duplicates("run_key", keep="last")
+    if "error" in results:
+        results["error"] = results["error"].fillna("")
+    return results.drop(columns="run_key").sort_values("final_equity", ascending=False).reset_index(drop=True)
+
+# Sweep throughput on synthetic random-walk prices with 1, 2, 4 and 8 worker processes
+def benchmark_workers(worker_counts=(1, 2, 4, 8), n_tokens=30, n_days=240, backtest_days=60):
+    import tempfile
+    import time
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2024-01-01", periods=n_days, freq="D")
+    close = np.exp(np.cumsum(rng.normal(0, 0.05, (n_tokens, n_days)), axis=1))
+    tokens = [f"token-{token:03d}" for token in range(n_tokens)]
+    historical_data = pd.DataFrame({
+        "token_id": np.repeat(tokens, n_days),
+        "timestamp": np.tile(days, n_tokens),
+        "open": close.ravel(),
+        "high": (close * (1 + rng.uniform(0, 0.03, close.shape))).ravel(),
+        "low": (close * (1 - rng.uniform(0, 0.03, close.shape))).ravel(),
+        "close": close.ravel(),
+    })
+    grid = {"len_dema": [5, 8], "di_len": [5, 8], "max_positions": [2, 3, 5], "adx_smoothing_len": [3, 5]}
+    runs = len(expand_grid(grid))
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            run_sweep(grid, workers, os.path.join(directory, "sweep.csv"), days[-backtest_days].to_pydatetime(),
+                      days[-1].to_pydatetime(), historical_data=historical_data, tokens=tokens)
+            seconds = time.perf_counter() - start
+        if workers == worker_counts[0]:
+            serial_seconds = seconds
+        print(f"{runs} runs, {workers} workers: {seconds:.1f} s, {runs / seconds:.1f} runs/s "
+              f"({serial_seconds / seconds:.1f}x the {worker_counts[0]}-worker sweep)")
+    print(f"({os.cpu_count()} CPU cores available)")
+
+if __name__ == "__main__":
+    # python -m src.sweep [--workers=N] [--benchmark-workers]
+    if "--benchmark-workers" in sys.argv:
+        benchmark_workers()
+        sys.exit()
+    workers = next((int(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--workers=")), None)
+    print(run_sweep(workers=workers).head(20).to_string(index=False))
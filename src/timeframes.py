@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import src.price_cache as price_cache
+
+# Candle length in seconds of every supported timeframe
+TIMEFRAMES = {"1h": 3600, "4h": 4 * 3600, "1d": 86400}
+
+# Timeframes stored in the database; the others are resampled from the lowest stored one
+PRICE_TABLES = {"1d": "Historical_Prices", "1h": "Historical_Prices_1h"}
+BASE_TIMEFRAME = "1h"
+
+def stored_timeframe(timeframe):
+    """The stored timeframe whose bars make up `timeframe` (itself, or the base one it is resampled from)"""
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe {timeframe!r}; supported timeframes are {list(TIMEFRAMES)}")
+    return timeframe if timeframe in PRICE_TABLES else BASE_TIMEFRAME
+
+def price_table(timeframe):
+    if timeframe not in PRICE_TABLES:
+        raise ValueError(f"No price table for timeframe {timeframe!r}; stored timeframes are {list(PRICE_TABLES)}")
+    return PRICE_TABLES[timeframe]
+
+def resample_ohlc(bars, timeframe, base=BASE_TIMEFRAME, drop_incomplete=True):
+    """Aggregate (token_id, timestamp, open, high, low, close) bars into `timeframe` candles.
+
+    Timestamps are candle close times in epoch seconds (CoinGecko's convention), so a base bar
+    belongs to the candle containing its open time and resampled candles are labelled with their
+    close time too. With drop_incomplete each token's last candle is dropped until its final base
+    bar has arrived, so signals never see a candle that is still forming.
+    """
+    seconds, base_seconds = TIMEFRAMES[timeframe], TIMEFRAMES[base]
+    if seconds % base_seconds:
+        raise ValueError(f"Cannot build {timeframe} candles from {base} bars")
+    bars = bars.sort_values(["token_id", "timestamp"], kind="stable")
+    if bars.empty:
+        return bars[["token_id", "timestamp", "open", "high", "low", "close"]].reset_index(drop=True)
+
+    token_ids = bars["token_id"].to_numpy()
+    timestamps = bars["timestamp"].to_numpy(dtype=np.int64)
+    buckets = (timestamps - base_seconds) // seconds
+
+    # One contiguous run of rows per (token, candle), since rows are sorted
+    new_candle = np.r_[True, (token_ids[1:] != token_ids[:-1]) | (buckets[1:] != buckets[:-1])]
+    starts = np.flatnonzero(new_candle)
+    stops = np.r_[starts[1:], len(timestamps)]
+    candles = pd.DataFrame({
+        "token_id": token_ids[starts],
+        "timestamp": (buckets[starts] + 1) * seconds,
+        "open": bars["open"].to_numpy(dtype=np.float64)[starts],
+        "high": np.fmax.reduceat(bars["high"].to_numpy(dtype=np.float64), starts),
+        "low": np.fmin.reduceat(bars["low"].to_numpy(dtype=np.float64), starts),
+        "close": bars["close"].to_numpy(dtype=np.float64)[stops - 1],
+    })
+
+    if drop_incomplete:
+        last_of_token = np.r_[token_ids[starts][1:] != token_ids[starts][:-1], True]
+        forming = last_of_token & (timestamps[stops - 1] < candles["timestamp"].to_numpy())
+        candles = candles[~forming].reset_index(drop=True)
+    return candles
+
+def load_ohlc(timeframe="1d", columns=None, token_ids=None, start=None, end=None, parse_dates=False):
+    """Load bars of any timeframe, ordered by token and time (same arguments as price_cache.load)"""
+    columns = list(columns or price_cache.COLUMNS)
+    if timeframe == "1d":
+        return price_cache.load(columns=columns, token_ids=token_ids, start=start, end=end, parse_dates=parse_dates)
+
+    if timeframe in PRICE_TABLES:
+        bars = price_cache._load_from_db(columns, token_ids, start, end, table=price_table(timeframe))
+    else:
+        # Every candle closing at or after `start` is made of base bars closing after start - seconds
+        base_start = None if start is None else start - TIMEFRAMES[timeframe]
+        base = price_cache._load_from_db(price_cache.COLUMNS, token_ids, base_start, end, table=price_table(BASE_TIMEFRAME))
+        bars = resample_ohlc(base, timeframe)
+        if start is not None:
+            bars = bars[bars["timestamp"] >= start]
+        bars = bars[columns].reset_index(drop=True)
+    if parse_dates and "timestamp" in bars:
+        bars["timestamp"] = pd.to_datetime(bars["timestamp"], unit="s")
+    return bars
@@ -0,0 +1,68 @@
+from sqlalchemy import text
+from datetime import datetime
+import threading
+
+# Seconds between daily candles
+DAILY_INTERVAL = 86400
+
+class IngestionWatermarks:
+    """Latest stored timestamp per token in one price table, loaded in one query and kept current for the run"""
+
+    def __init__(self, engine, table="Historical_Prices"):
+        self.engine = engine
+        self.table = table
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        """Load every Base_tokens id with its MAX(timestamp) (None if it has no bars yet)"""
+        query = text(f'''
+            SELECT b.id AS token_id, MAX(h.timestamp) AS latest_timestamp
+            FROM Base_tokens b
+            LEFT JOIN {self.table} h ON h.token_id = b.id
+            GROUP BY b.id
+        ''')
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+        with self.lock:
+            self.latest = {row[0]: int(row[1]) if row[1] is not None else None for row in rows}
+            self.loaded = True
+        return self
+
+    def get(self, token_id):
+        if not self.loaded:
+            self.load()
+        return self.latest.get(token_id)
+
+    def as_dict(self):
+        """Tokens that have bars, mapped to their latest timestamp"""
+        if not self.loaded:
+            self.load()
+        return {token_id: ts for token_id, ts in self.latest.items() if ts is not None}
+
+    def advance(self, token_id, timestamp):
+        """Record that bars up to `timestamp` were saved for the token"""
+        with self.lock:
+            current = self.latest.get(token_id)
+            if current is None or timestamp > current:
+                self.latest[token_id] = timestamp
+
+    def plan(self, default_from, now=None, interval=DAILY_INTERVAL):
+        """Return [(token_id, from_timestamp)] for the tokens that need a request.
+
+        CoinGecko stamps each candle with its close time. A token is requested from default_from when it
+        has no bars, and from its latest bar when that candle is still open (stamped after `now`, so it
+        is refreshed until it closes) or when at least one newer candle has closed since. A token whose
+        latest candle is closed and whose next one is not is up to date and gets no request.
+        """
+        if not self.loaded:
+            self.load()
+        now = int((now or datetime.now()).timestamp())
+        requests_to_make = []
+        for token_id, latest_timestamp in self.latest.items():
+            if latest_timestamp is None:
+                requests_to_make.append((token_id, default_from))
+            elif latest_timestamp > now or latest_timestamp + interval <= now:
+                requests_to_make.append((token_id, latest_timestamp))
+        return requests_to_make
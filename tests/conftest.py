@@ -0,0 +1,114 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import src.db as db
+import src.storage as storage
+
+def use_sqlite(monkeypatch, path):
+    """Point the shared engine and storage at a SQLite file (created on first use)"""
+    db.dispose()
+    monkeypatch.setattr(db, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(db, "SQLITE_PATH", str(path))
+    monkeypatch.setattr(storage, "_storage", None)
+    return storage.get_storage()
+
+@pytest.fixture
+def sqlite_storage(tmp_path, monkeypatch):
+    """A fresh SQLite database behind db.get_engine() and storage.get_storage()"""
+    yield use_sqlite(monkeypatch, tmp_path / "test.sqlite")
+    db.dispose()
+
+def random_ohlc(rng, length, leading_nans=0):
+    """Random-walk (close, high, low) arrays with flat stretches and optional leading NaNs"""
+    close = np.exp(np.cumsum(rng.normal(0, 0.05, length)))
+    high = close * (1 + rng.uniform(0, 0.05, length))
+    low = close * (1 - rng.uniform(0, 0.05, length))
+    # Flat stretches exercise the ties in the comparisons
+    flat = rng.random(length) < 0.05
+    high[flat], low[flat], close[flat] = 1.0, 1.0, 1.0
+    for values in (close, high, low):
+        values[:leading_nans] = np.nan
+    return close, high, low
+
+def synthetic_history(n_tokens=12, n_days=200, seed=0):
+    """Random-walk daily OHLC bars in the Historical_Prices layout; later tokens list later"""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2024-06-01", periods=n_days, freq="D")
+    frames = []
+    for token in range(n_tokens):
+        start = int(rng.integers(0, n_days // 3)) if token % 3 == 0 else 0
+        trend = rng.normal(0, 0.01)
+        close = np.exp(np.cumsum(rng.normal(trend, 0.05, n_days - start)))
+        open_ = close * np.exp(rng.normal(0, 0.01, len(close)))
+        frames.append(pd.DataFrame({
+            "token_id": f"token-{token:02d}",
+            "timestamp": days[start:],
+            "open": open_,
+            "high": np.maximum(open_, close) * (1 + rng.uniform(0, 0.03, len(close))),
+            "low": np.minimum(open_, close) * (1 - rng.uniform(0, 0.03, len(close))),
+            "close": close,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+class FakeServer:
+    """Local HTTP server that answers with respond(method, path, body) -> (status, headers, JSON payload)
+    and records (monotonic time, method, path, body) of every request"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with server.lock:
+                    server.requests.append((time.monotonic(), self.command, self.path, body))
+                status, headers, payload = server.respond(self.command, self.path, body)
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def paths(self):
+        with self.lock:
+            return [path for _, _, path, _ in self.requests]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def fake_server():
+    """Factory for FakeServer instances, shut down after the test"""
+    servers = []
+
+    def start(respond):
+        servers.append(FakeServer(respond))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
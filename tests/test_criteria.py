@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: the heavy libraries are imported first so the timing covers criteria itself
+IMPORT_PROBE = '''
+import builtins, json, time
+import numpy, pandas, sqlalchemy, dotenv
+
+engines, opened = [], []
+create_engine = sqlalchemy.create_engine
+def recording_create_engine(*args, **kwargs):
+    engines.append(str(args[0]) if args else "")
+    return create_engine(*args, **kwargs)
+sqlalchemy.create_engine = recording_create_engine
+builtin_open = builtins.open
+def recording_open(file, *args, **kwargs):
+    opened.append(str(file))
+    return builtin_open(file, *args, **kwargs)
+builtins.open = recording_open
+
+start = time.perf_counter()
+import src.criteria
+seconds = time.perf_counter() - start
+builtins.open = builtin_open
+
+import src.db as db
+print(json.dumps({"seconds": seconds, "engines": engines, "engine": db._engine is not None,
+                  "connections": db.metrics["connections_opened"], "opened": opened}))
+'''
+
+# Generous for a slow CI machine; the old import loaded the whole price table and ran a backtest
+IMPORT_SECONDS_LIMIT = 0.25
+
+def test_import_has_no_side_effects_and_is_fast():
+    result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    assert probe["engines"] == []
+    assert not probe["engine"]
+    assert probe["connections"] == 0
+    assert not any("top_tokens" in path for path in probe["opened"])
+    assert probe["seconds"] < IMPORT_SECONDS_LIMIT, f"import src.criteria took {probe['seconds']:.3f}s"
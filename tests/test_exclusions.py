@@ -0,0 +1,39 @@
+import random
+import string
+from src.exclusions import ExclusionMatcher
+
+def coin(coin_id, name, symbol):
+    return {"id": coin_id, "name": name, "symbol": symbol}
+
+def test_pattern_does_not_cross_name_and_symbol():
+    matcher = ExclusionMatcher(patterns=[r"foo\s+bar", r"^bar$"])
+    coins = [coin("a", "Foo", "BAR2"), coin("b", "Foo Bar", "FB"), coin("c", "Bar", "B")]
+    assert matcher.reasons(coins) == [None, r"regex:foo\s+bar", "regex:^bar$"]
+
+def test_pattern_does_not_cross_coins():
+    matcher = ExclusionMatcher(patterns=[r"x[^z]*y"])
+    coins = [coin("a", "Alpha", "AX"), coin("b", "Yield", "YLD"), coin("c", "Xenon Yacht", "XY")]
+    assert matcher.reasons(coins) == [None, None, "regex:x[^z]*y"]
+
+def test_cross_coin_pattern_does_not_hide_a_keyword():
+    # On the joined page text the pattern matches from "skyusd" into the next coin, before the keyword
+    matcher = ExclusionMatcher(keywords=["usd"], patterns=[r"y[a-z]*\nbeta"])
+    coins = [coin("sky", "Sky", "SKYUSD"), coin("beta", "Beta", "BETA")]
+    assert matcher.reasons(coins) == ["keyword:usd", None]
+
+def test_allow_and_deny_ids():
+    matcher = ExclusionMatcher(keywords=["wrapped"], deny_ids=["scam"], allow_ids=["wrapped-ok"])
+    coins = [coin("wrapped-ok", "Wrapped OK", "WOK"), coin("scam", "Fine", "FINE"), coin("w", "Wrapped X", "WX")]
+    assert matcher.reasons(coins) == [None, "deny_id:scam", "keyword:wrapped"]
+
+def test_keywords_match_the_substring_scan():
+    rng = random.Random(0)
+    keywords = ["wrapped", "staked", "restaked", "eth", "weth", "usd", "btc"]
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1, 6)))
+
+    coins = [coin(str(i), " ".join(word() for _ in range(rng.randint(1, 3))) + rng.choice(["", " Staked", "USD"]),
+                  word().upper()) for i in range(2000)]
+    expected = [any(k in c["name"].lower() or k in c["symbol"].lower() for k in keywords) for c in coins]
+    assert [reason is not None for reason in ExclusionMatcher(keywords).reasons(coins)] == expected
@@ -0,0 +1,170 @@
+import json
+import pytest
+import requests
+from sqlalchemy import text
+import src.db as db
+import src.fetch_data as fetch_data
+import src.fetchOHLC as fetchOHLC
+from conftest import use_sqlite
+
+def make_token(token_id, name=None, price=1.0):
+    token = {column: None for column in fetch_data.BASE_TOKEN_COLUMNS}
+    token.update(id=token_id, symbol=token_id[:3], name=name or token_id.title(), current_price=price,
+                 last_updated="2025-01-01T00:00:00Z")
+    return token
+
+def stored_names():
+    with db.get_engine().connect() as conn:
+        return dict(conn.execute(text("SELECT id, name FROM Base_tokens")).all())
+
+def test_unchanged_tokens_are_skipped(sqlite_storage, tmp_path):
+    snapshot = str(tmp_path / "snapshot.json")
+    tokens = [make_token(f"token-{i}") for i in range(5)]
+    assert fetch_data.save_filtered_tokens_to_db(tokens, chunk_size=2, snapshot_path=snapshot)["written"] == 5
+
+    # Any changed column rewrites the row, market data included
+    tokens = [make_token(token["id"], price=2.0 if i == 1 else 1.0, name="Renamed" if i == 0 else None)
+              for i, token in enumerate(tokens)]
+    report = fetch_data.save_filtered_tokens_to_db(tokens, snapshot_path=snapshot)
+    assert report == {"written": 2, "skipped": 3, "failed": {}}
+    assert stored_names()["token-0"] == "Renamed"
+    with db.get_engine().connect() as conn:
+        prices = dict(conn.execute(text("SELECT id, current_price FROM Base_tokens")).all())
+    assert prices["token-1"] == 2.0 and prices["token-2"] == 1.0
+
+def test_fresh_database_with_existing_snapshot(sqlite_storage, tmp_path, monkeypatch):
+    snapshot = str(tmp_path / "snapshot.json")
+    tokens = [make_token(f"token-{i}") for i in range(3)]
+    fetch_data.save_filtered_tokens_to_db(tokens, snapshot_path=snapshot)
+
+    # Another database (e.g. after switching DB_BACKEND) has its own snapshot
+    use_sqlite(monkeypatch, tmp_path / "other.sqlite")
+    assert fetch_data.save_filtered_tokens_to_db(tokens, snapshot_path=snapshot)["written"] == 3
+    assert set(stored_names()) == {"token-0", "token-1", "token-2"}
+
+    # The same database with Base_tokens recreated gets every row again
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM Base_tokens"))
+    report = fetch_data.save_filtered_tokens_to_db(tokens, snapshot_path=snapshot)
+    assert report == {"written": 3, "skipped": 0, "failed": {}}
+    assert set(stored_names()) == {"token-0", "token-1", "token-2"}
+
+    # And the first database's snapshot is still there
+    use_sqlite(monkeypatch, tmp_path / "test.sqlite")
+    assert fetch_data.save_filtered_tokens_to_db(tokens, snapshot_path=snapshot)["skipped"] == 3
+
+def test_missing_fields_are_reported(sqlite_storage, tmp_path):
+    token = make_token("broken")
+    del token["name"]
+    report = fetch_data.save_filtered_tokens_to_db([token, make_token("fine")], snapshot_path=str(tmp_path / "s.json"))
+    assert report == {"written": 1, "skipped": 0, "failed": {"missing field name": 1}}
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+class FakeSession:
+    """Replays `responses` in order (an exception instance is raised) and records each request's headers"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.requests.append(dict(headers or {}))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+@pytest.fixture
+def page_fetch(monkeypatch, tmp_path):
+    """Call get_coins_in_category with a fake session and a temporary cache; returns (page, session)"""
+    sleeps = []
+    monkeypatch.setattr(fetch_data, "API_KEY", "test-key")
+    monkeypatch.setattr(fetchOHLC, "MAX_RETRIES", 2)
+    monkeypatch.setattr(fetchOHLC, "BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(fetch_data.time, "sleep", sleeps.append)
+
+    def fetch(responses, ttl=300):
+        session = FakeSession(responses)
+        page = fetch_data.get_coins_in_category("base", 1, session, ttl=ttl, cache_dir=str(tmp_path))
+        return page, session
+
+    fetch.sleeps = sleeps
+    fetch.cache_path = tmp_path / "base-1.json"
+    return fetch
+
+def test_page_cache_ttl_and_etag(page_fetch):
+    coins = [{"id": "a"}, {"id": "b"}]
+    page, session = page_fetch([FakeResponse(200, coins, {"ETag": '"v1"'})])
+    assert page == coins and "If-None-Match" not in session.requests[0]
+    assert json.loads(page_fetch.cache_path.read_text())["etag"] == '"v1"'
+
+    # Within the TTL the cached page is served without a request
+    page, session = page_fetch([])
+    assert page == coins and session.requests == []
+
+    # After the TTL the page is revalidated; 304 serves the cached body and restarts the TTL
+    cache = json.loads(page_fetch.cache_path.read_text())
+    cache["fetched_at"] -= 3600
+    page_fetch.cache_path.write_text(json.dumps(cache))
+    page, session = page_fetch([FakeResponse(304)])
+    assert page == coins and session.requests[0]["If-None-Match"] == '"v1"'
+    assert json.loads(page_fetch.cache_path.read_text())["fetched_at"] > cache["fetched_at"] + 3000
+
+    # A changed page replaces the cached body and ETag
+    page, session = page_fetch([FakeResponse(200, coins[:1], {"ETag": '"v2"'})], ttl=0)
+    assert page == coins[:1] and session.requests[0]["If-None-Match"] == '"v1"'
+    assert json.loads(page_fetch.cache_path.read_text())["etag"] == '"v2"'
+
+def test_page_retries_without_sleeping_after_the_last_attempt(page_fetch):
+    coins = [{"id": "a"}]
+    page, session = page_fetch([FakeResponse(429, headers={"Retry-After": "2"}), requests.ConnectionError(),
+                                FakeResponse(200, coins)])
+    assert page == coins and len(session.requests) == 3
+    assert page_fetch.sleeps == [2.0, 0.02]
+
+    page_fetch.sleeps.clear()
+    page, session = page_fetch([FakeResponse(503), FakeResponse(502), requests.Timeout()], ttl=0)
+    assert page is None and len(session.requests) == fetchOHLC.MAX_RETRIES + 1
+    assert page_fetch.sleeps == [0.01, 0.02]
+
+@pytest.fixture
+def category_pages(monkeypatch, tmp_path):
+    """Serve categories of `sizes` coins through iter_category_pages and record every page request"""
+    monkeypatch.chdir(tmp_path)  # No page cache
+    monkeypatch.setattr(fetch_data, "API_KEY", "test-key")
+    monkeypatch.setattr(fetch_data, "PER_PAGE", 2)
+    requested = []
+
+    def pages(sizes, concurrency=4, calls_per_minute=600):
+        def get_coins_in_category(category_id, page, session, limiter, prepaid=False):
+            requested.append((category_id, page))
+            first = (page - 1) * fetch_data.PER_PAGE
+            return [{"id": f"{category_id}-{n}"} for n in range(first, min(first + fetch_data.PER_PAGE, sizes[category_id]))]
+
+        monkeypatch.setattr(fetch_data, "get_coins_in_category", get_coins_in_category)
+        requested.clear()
+        yielded = list(fetch_data.iter_category_pages(list(sizes), concurrency, calls_per_minute))
+        return [coin["id"] for coins in yielded for coin in coins]
+
+    pages.requested = requested
+    return pages
+
+def test_category_ending_mid_wave_requests_no_pages_past_the_end(category_pages):
+    # 11 coins: five full pages and a short sixth; pages 2-5 go out together and the sixth ends the category
+    coins = category_pages({"base": 11})
+    assert coins == [f"base-{n}" for n in range(11)]
+    # At 10 calls/s after the burst, page 6 is back before page 7 would get its token
+    assert category_pages.requested == [("base", page) for page in range(1, 7)]
+
+def test_category_pages_stop_at_a_short_first_page(category_pages):
+    assert category_pages({"small": 1, "base": 4}) == ["small-0", "base-0", "base-1", "base-2", "base-3"]
+    # A full last page needs the empty page after it to end the category
+    assert category_pages.requested == [("small", 1), ("base", 1), ("base", 2), ("base", 3)]
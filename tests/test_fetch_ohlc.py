@@ -0,0 +1,121 @@
+from urllib.parse import parse_qs, urlparse
+import threading
+import time
+import pytest
+import src.db as db
+import src.fetchOHLC as fetchOHLC
+
+DAY = 86400
+
+def candles(from_timestamp, to_timestamp):
+    return [[t * 1000, 1.0, 2.0, 0.5, 1.5] for t in range(from_timestamp - from_timestamp % DAY + DAY, to_timestamp, DAY)]
+
+@pytest.fixture
+def coingecko(fake_server, monkeypatch):
+    """Fake /coins/{id}/ohlc/range: `failures[token]` lists the statuses returned before the candles"""
+    failures = {}
+    lock = threading.Lock()
+
+    def respond(method, path, body):
+        url = urlparse(path)
+        token_id = url.path.split("/")[2]
+        with lock:
+            pending = failures.get(token_id)
+            status = pending.pop(0) if pending else 200
+        if status != 200:
+            return status, {"Retry-After": "0.05"} if status == 429 else {}, {"error": status}
+        query = parse_qs(url.query)
+        return 200, {}, candles(int(query["from"][0]), int(query["to"][0]))
+
+    server = fake_server(respond)
+    monkeypatch.setattr(fetchOHLC, "COINGECKO_API_URL_PRO", server.url)
+    monkeypatch.setattr(fetchOHLC, "API_KEY", "test-key")
+    monkeypatch.setattr(fetchOHLC, "BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(fetchOHLC, "MAX_RETRIES", 3)
+    server.failures = failures
+    return server
+
+def requests_for(server, token_id):
+    return [path for path in server.paths() if f"/coins/{token_id}/" in path]
+
+def test_retries_429_and_5xx(coingecko):
+    now = int(time.time())
+    coingecko.failures.update({"limited": [429, 429], "flaky": [502, 503], "down": [500] * 10})
+    rows = {}
+
+    def write_rows(batch):
+        for row in batch:
+            rows.setdefault(row["token_id"], []).append(row)
+        return len(batch)
+
+    plan = [(token_id, now - 10 * DAY) for token_id in ["limited", "flaky", "down", "fine"]]
+    written = fetchOHLC.ingest_ohlc(plan, write_rows, concurrency=4, calls_per_minute=6000, batch_size=7)
+    assert written == sum(len(batch) for batch in rows.values()) == 30
+    assert set(rows) == {"limited", "flaky", "fine"}
+    assert len(requests_for(coingecko, "limited")) == 3
+    assert len(requests_for(coingecko, "flaky")) == 3
+    # Gives up after MAX_RETRIES retries
+    assert len(requests_for(coingecko, "down")) == fetchOHLC.MAX_RETRIES + 1
+    assert len(requests_for(coingecko, "fine")) == 1
+
+def test_retry_after_is_respected(coingecko):
+    coingecko.failures["limited"] = [429]
+    started = time.monotonic()
+    assert fetchOHLC.fetch_coingecko_ohlc("limited", int(time.time()) - 3 * DAY)
+    times = [at for at, _, path, _ in coingecko.requests]
+    assert len(times) == 2
+    assert times[1] - times[0] >= 0.05
+    assert time.monotonic() - started < 1
+
+def test_failed_writes_are_not_counted(coingecko):
+    now = int(time.time())
+    batches = []
+
+    def write_rows(batch):
+        batches.append(len(batch))
+        return 0 if len(batches) == 1 else len(batch)
+
+    plan = [(f"token-{i}", now - 10 * DAY) for i in range(4)]
+    written = fetchOHLC.ingest_ohlc(plan, write_rows, concurrency=2, calls_per_minute=6000, batch_size=10)
+    assert sum(batches) == 40
+    assert written == 40 - batches[0]
+
+def test_token_bucket_limits_the_request_rate(coingecko):
+    now = int(time.time())
+    # 600 calls/minute = 10/s with bursts of 4 (the concurrency)
+    plan = [(f"token-{i}", now - 2 * DAY) for i in range(12)]
+    fetchOHLC.ingest_ohlc(plan, lambda batch: len(batch), concurrency=4, calls_per_minute=600)
+    times = sorted(at for at, _, _, _ in coingecko.requests)
+    assert len(times) == 12
+    # After the burst, each further request waits for a refill of 0.1 s
+    for k in range(4, 12):
+        assert times[k] - times[0] >= (k - 3) * 0.1 - 0.02
+
+def test_token_bucket_burst_then_rate():
+    bucket = fetchOHLC.TokenBucket(1200, capacity=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.02
+    for _ in range(6):
+        bucket.acquire()
+    # 6 more calls at 20/s
+    assert time.monotonic() - started >= 0.3 - 0.02
+
+def test_up_to_date_refresh_makes_no_requests(coingecko, sqlite_storage):
+    # Today's 00:00 candle (closed at midnight) is the latest one of every token but "behind"
+    today = int(time.time()) // DAY * DAY
+    with db.get_engine().begin() as conn:
+        sqlite_storage.upsert_tokens(conn, [{"id": token_id, "symbol": token_id[:3], "name": token_id}
+                                            for token_id in ["fresh", "also-fresh", "behind"]])
+        sqlite_storage.upsert_ohlc(conn, [{"token_id": token_id, "timestamp": timestamp, "open": 1.0, "high": 2.0,
+                                           "low": 0.5, "close": 1.0}
+                                          for token_id in ["fresh", "also-fresh", "behind"]
+                                          for timestamp in (today - DAY, today) if token_id != "behind" or timestamp < today])
+    watermarks = fetchOHLC.main()
+    assert [path.split("/")[2] for path in coingecko.paths()] == ["behind"]
+    assert watermarks.get("behind") == today
+
+    # Everything is current now, so the next refresh makes no API calls
+    assert fetchOHLC.main() is None
+    assert len(coingecko.paths()) == 1
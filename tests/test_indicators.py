@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+import src.indicators as indicators
+from conftest import random_ohlc
+
+def random_series(n_series, seed, max_length=800):
+    # Every other series starts with missing bars, so the batches mix shared and ragged starts
+    rng = np.random.default_rng(seed)
+    return [random_ohlc(rng, int(rng.integers(2, max_length)), int(rng.integers(1, 3)) * (i % 2))
+            for i in range(n_series)]
+
+def dema_dmi_reference(close, high, low, dema, true_range, len_dema=5, adx_smoothing_len=3, di_len=5):
+    """The pandas DEMA-DMI that indicators.dema_dmi replaced, with the DEMA and true range it was built on"""
+    def ta_rma(series, length):
+        return series.ewm(alpha=1 / length, min_periods=length, adjust=False).mean()
+
+    demah = dema(high, len_dema)
+    demal = dema(low, len_dema)
+    u = np.diff(demah, prepend=np.nan)
+    d = -np.diff(demal, prepend=np.nan)
+    p = pd.Series(np.where((u > d) & (u > 0), u, 0), index=close.index)
+    m = pd.Series(np.where((d > u) & (d > 0), d, 0), index=close.index)
+    t = ta_rma(true_range(high, low, close), di_len)
+    plus = pd.Series(np.nan_to_num(100 * ta_rma(p, di_len) / t), index=close.index)
+    minus = pd.Series(np.nan_to_num(100 * ta_rma(m, di_len) / t), index=close.index)
+    sum_dm = plus + minus
+    adx = 100 * ta_rma(pd.Series(np.abs(plus - minus) / np.where(sum_dm == 0, 1, sum_dm), index=close.index), adx_smoothing_len)
+    dmil = (plus > minus) & (adx > adx.shift(1))
+    dmis = minus > plus
+    return pd.Series(np.where(dmil & ~dmis, 1, np.where(dmis, -1, np.nan)), index=close.index).ffill()
+
+def check_dema_dmi(dema, true_range):
+    series = random_series(200, seed=0)
+    expected = [dema_dmi_reference(pd.Series(close), pd.Series(high), pd.Series(low), dema, true_range).to_numpy()
+                for close, high, low in series]
+    for s, e in zip(series, expected):
+        np.testing.assert_array_equal(indicators.dema_dmi(*s), e)
+    # Batched over every other series and over all of them
+    for group in (range(0, len(series), 2), range(len(series))):
+        offsets = np.r_[0, np.cumsum([len(series[i][0]) for i in group])]
+        batched = indicators.dema_dmi_batch(*(np.concatenate([series[i][k] for i in group]) for k in range(3)), offsets)
+        for j, i in enumerate(group):
+            np.testing.assert_array_equal(batched[offsets[j]:offsets[j + 1]], expected[i])
+
+def test_dema_dmi_matches_talib():
+    # pandas_ta computes DEMA and true range with TA-Lib when it is installed, so this is the original
+    # criteria.py version; TA-Lib is a test dependency (readme, Setup step 8), pandas_ta is not
+    talib = pytest.importorskip("talib")
+    check_dema_dmi(lambda series, length: pd.Series(talib.DEMA(series.to_numpy(), length), index=series.index),
+                   lambda high, low, close: pd.Series(talib.TRANGE(high.to_numpy(), low.to_numpy(), close.to_numpy()),
+                                                      index=close.index))
+
+def test_dema_dmi_matches_pandas_ta():
+    ta = pytest.importorskip("pandas_ta")
+    check_dema_dmi(lambda series, length: ta.dema(series, length=length), ta.true_range)
+
+def with_gaps(series, seed):
+    # A few bars missing in the middle of each series (leading NaNs are covered by random_series)
+    rng = np.random.default_rng(seed)
+    gapped = []
+    for close, high, low in series:
+        close, high, low = close.copy(), high.copy(), low.copy()
+        if len(close) > 10:
+            gap = int(rng.integers(5, len(close) - 3))
+            for values in (close, high, low):
+                values[gap:gap + int(rng.integers(1, 4))] = np.nan
+        gapped.append((close, high, low))
+    return gapped
+
+def talib_checks(talib):
+    # name: (kernel, reference, tolerance); RMA is compared with pandas and must match exactly
+    return {
+        "ema": (lambda close, high, low: indicators.ema(close, 10), lambda close, high, low: talib.EMA(close, 10),
+                indicators.TALIB_TOLERANCE),
+        "dema": (lambda close, high, low: indicators.dema(close, 5), lambda close, high, low: talib.DEMA(close, 5),
+                 indicators.TALIB_TOLERANCE),
+        "rsi": (lambda close, high, low: indicators.rsi(close, 14), lambda close, high, low: talib.RSI(close, 14),
+                indicators.TALIB_TOLERANCE),
+        "true_range": (lambda close, high, low: indicators.true_range(high, low, close),
+                       lambda close, high, low: talib.TRANGE(high, low, close), indicators.TALIB_TOLERANCE),
+        "rma": (lambda close, high, low: indicators.rma(close, 5),
+                lambda close, high, low: pd.Series(close).ewm(alpha=1 / 5, min_periods=5, adjust=False).mean().to_numpy(), 0.0),
+    }
+
+@pytest.mark.parametrize("gaps", [False, True], ids=["contiguous", "nan-gaps"])
+@pytest.mark.parametrize("name", ["ema", "dema", "rsi", "true_range", "rma"])
+def test_kernels_match_talib(name, gaps):
+    talib = pytest.importorskip("talib")
+    kernel, reference, tolerance = talib_checks(talib)[name]
+    series = random_series(200, seed=1)
+    if gaps:
+        series = with_gaps(series, seed=2)
+    for s in series:
+        np.testing.assert_allclose(kernel(*s), reference(*s), rtol=tolerance, atol=0)
+
+@pytest.mark.parametrize("gaps", [False, True], ids=["contiguous", "nan-gaps"])
+@pytest.mark.parametrize("name", ["ema", "dema", "rsi", "true_range", "rma"])
+def test_batched_kernels_match_talib(name, gaps):
+    talib = pytest.importorskip("talib")
+    kernel, reference, tolerance = talib_checks(talib)[name]
+    # Equal-length series, one per row, with different numbers of leading NaNs
+    rng = np.random.default_rng(3)
+    rows = [random_ohlc(rng, 400, int(rng.integers(0, 30))) for _ in range(50)]
+    if gaps:
+        rows = with_gaps(rows, seed=4)
+    batched = kernel(*(np.vstack([row[k] for row in rows]) for k in range(3)))
+    for i, row in enumerate(rows):
+        np.testing.assert_allclose(batched[i], reference(*row), rtol=tolerance, atol=0)
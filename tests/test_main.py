@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import main
+import src.db as db
+
+DAY = 86400
+
+def test_day_bounds_follow_the_utc_date():
+    # 01:30 in UTC+5 is still the previous day in UTC, 23:30 in UTC-5 is already the next one
+    ahead = datetime(2025, 1, 2, 1, 30, tzinfo=timezone(timedelta(hours=5)))
+    behind = datetime(2025, 1, 1, 23, 30, tzinfo=timezone(timedelta(hours=-5)))
+    jan_1 = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+    assert main.utc_day_bounds(ahead) == (jan_1, jan_1 + DAY)
+    assert main.utc_day_bounds(behind) == (jan_1 + DAY, jan_1 + 2 * DAY)
+
+def test_market_snapshot(sqlite_storage):
+    day_start = 1_735_689_600  # 2025-01-01 UTC
+    with db.get_engine().begin() as conn:
+        sqlite_storage.upsert_tokens(conn, [{"id": "alpha", "symbol": "alp", "name": "Alpha"},
+                                            {"id": "beta", "symbol": "bet", "name": "Beta"}])
+        bars = [("alpha", day_start - 3600, 0.5), ("alpha", day_start + 3600, 1.0), ("alpha", day_start + 7200, 2.0),
+                ("beta", day_start + DAY, 3.0)]
+        sqlite_storage.upsert_ohlc(conn, [{"token_id": token_id, "timestamp": timestamp, "open": close - 0.1, "high": close,
+                                           "low": close, "close": close} for token_id, timestamp, close in bars],
+                                   table="Historical_Prices_1h")
+    snapshot = main.load_market_snapshot(["alpha", "beta", "gone"], day_start, day_start + DAY, "Historical_Prices_1h")
+    # The last bar inside the day; beta's only bar is tomorrow's and "gone" is not a Base token
+    assert snapshot == {"alpha": {"name": "Alpha", "open": 1.9, "close": 2.0},
+                        "beta": {"name": "Beta", "open": None, "close": None},
+                        "gone": {"name": "gone", "open": None, "close": None}}
+
+def test_failed_run_writes_no_trades(sqlite_storage):
+    trade = {"token_id": "alpha", "entry_date": "2025-01-01 00:00:00", "entry_price": 1.0, "position_type": "LONG",
+             "status": "OPEN", "units": 10}
+    assert main.record_run([], [trade], [])
+    trade_id = int(sqlite_storage.open_trades()["trade_id"].iloc[0])
+
+    closed = [{"token_id": "alpha", "exit_date": "2025-01-02 00:00:00", "exit_price": 2.0, "profit_loss": 10.0,
+               "trade_id": trade_id}]
+    # The second new trade has no status (NOT NULL), so the insert fails after the close ran
+    opened = [{**trade, "token_id": "beta"}, {**trade, "token_id": "gamma", "status": None}]
+    portfolio = [{"date": "2025-01-02 00:00:00", "equity": 1000.0, "cash": 990.0, "positions_value": 10.0}]
+    assert not main.record_run(closed, opened, portfolio)
+
+    with db.get_engine().connect() as conn:
+        trades = pd.read_sql("SELECT token_id, status FROM Trades", conn)
+        portfolio_rows = pd.read_sql("SELECT * FROM Portfolio", conn)
+    assert trades.to_dict("records") == [{"token_id": "alpha", "status": "OPEN"}]
+    assert portfolio_rows.empty
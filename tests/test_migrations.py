@@ -0,0 +1,138 @@
+import os
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import create_engine, event, text
+import src.migrations as migrations
+
+TABLES = ["Base_tokens", "Historical_Prices", "Historical_Prices_1h", "Trades", "Portfolio", "Bitcoin_PH",
+          migrations.SCHEMA_TABLE]
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """SQLite with a NOW() function, enough to run migrate() on migrations made of portable steps"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.sqlite'}")
+
+    @event.listens_for(engine, "connect")
+    def add_now(connection, _):
+        connection.create_function("NOW", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def mysql_engine():
+    """A scratch database in STORAGE_CHECK_MYSQL_URL with none of the tables (they get dropped)"""
+    url = os.getenv("STORAGE_CHECK_MYSQL_URL")
+    if not url:
+        pytest.skip("STORAGE_CHECK_MYSQL_URL is not set")
+    engine = create_engine(url)
+    try:
+        engine.connect().close()
+    except Exception as e:
+        pytest.skip(f"MySQL is not reachable: {e}")
+    with engine.begin() as conn:
+        for table in TABLES:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    yield engine
+    # Leave the price table unpartitioned for test_storage
+    with engine.begin() as conn:
+        if conn.execute(text('''
+            SELECT COUNT(*) FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = 'Historical_Prices_1h' AND partition_name IS NOT NULL
+        ''')).scalar():
+            conn.execute(text("ALTER TABLE Historical_Prices_1h REMOVE PARTITIONING"))
+    engine.dispose()
+
+def test_versions_are_unique_and_in_order():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    # New migrations are appended with the next version; an applied version is never reused
+    assert versions == list(range(1, len(versions) + 1))
+    assert all(description and steps for _, description, steps in migrations.MIGRATIONS)
+
+def test_first_migration_creates_every_table():
+    statements = " ".join(step for step in migrations.MIGRATIONS[0][2])
+    for table in TABLES[:-1]:
+        assert f"CREATE TABLE IF NOT EXISTS {table} " in statements
+    for table in migrations.REQUIRED_UNIQUE_KEYS:
+        assert table in TABLES
+
+def test_migrate_applies_in_version_order_once(sqlite_engine):
+    calls = []
+    steps = [
+        (2, "second", [lambda conn: calls.append(2)]),
+        (1, "first", ["CREATE TABLE IF NOT EXISTS t (id INT)", lambda conn: calls.append(1)]),
+    ]
+    assert migrations.migrate(sqlite_engine, steps) == [1, 2]
+    assert calls == [1, 2]
+    # Running again is a no-op, and only a new version is applied later
+    assert migrations.migrate(sqlite_engine, steps) == []
+    assert migrations.migrate(sqlite_engine, steps + [(3, "third", [lambda conn: calls.append(3)])]) == [3]
+    assert calls == [1, 2, 3]
+    with sqlite_engine.connect() as conn:
+        recorded = conn.execute(text(f"SELECT version, description FROM {migrations.SCHEMA_TABLE} ORDER BY version")).all()
+    assert [tuple(row) for row in recorded] == [(1, "first"), (2, "second"), (3, "third")]
+
+def test_failed_migration_is_not_recorded(sqlite_engine):
+    def fail(conn):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        migrations.migrate(sqlite_engine, [(1, "first", ["SELECT 1"]), (2, "broken", [fail])])
+    assert migrations.migrate(sqlite_engine, [(1, "first", ["SELECT 1"]), (2, "fixed", ["SELECT 1"])]) == [2]
+
+def test_month_partitions():
+    first = datetime(2024, 11, 15, tzinfo=timezone.utc)
+    last = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    months = migrations._month_starts(first, last)
+    assert [f"{month:%Y-%m}" for month in months] == ["2024-11", "2024-12", "2025-01", "2025-02"]
+    definitions = migrations._partition_definitions(months)
+    assert definitions[0] == f"PARTITION p202411 VALUES LESS THAN ({int(months[1].timestamp())})"
+    assert definitions[-2].startswith("PARTITION p202501 ")
+    assert definitions[-1] == "PARTITION pmax VALUES LESS THAN MAXVALUE"
+
+def test_plan_problems():
+    plan = [{"table": "Trades", "type": "ref", "key": "idx_trades_status_token"},
+            {"table": "Historical_Prices", "type": "ALL", "key": None},
+            {"table": "Base_tokens", "type": "index_merge", "key": None},
+            {"table": "<union1,2>", "type": "ALL", "key": None},
+            {"table": "b", "type": "ALL", "key": None},
+            {"table": None, "type": None}]
+    assert migrations._plan_problems(plan, scans_ok={"b"}) == ["full scan of Historical_Prices", "no index used on Base_tokens"]
+
+def test_mysql_migrations_are_idempotent(mysql_engine, capsys):
+    # A price table from before the migrations, without its primary key
+    with mysql_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE Historical_Prices (token_id VARCHAR(100) NOT NULL, timestamp BIGINT NOT NULL, "
+                          "open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE)"))
+    assert migrations.migrate(mysql_engine) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.migrate(mysql_engine) == []
+    # Re-running the steps of an applied schema changes nothing either
+    assert migrations.migrate(mysql_engine, [(100, "steps again", [step for _, _, steps in migrations.MIGRATIONS
+                                                                   for step in steps])]) == [100]
+    with mysql_engine.connect() as conn:
+        for table, columns in migrations.REQUIRED_UNIQUE_KEYS.items():
+            keys, _ = migrations._key_columns(conn, table)
+            assert keys["PRIMARY"] == columns
+
+    capsys.readouterr()
+    migrations.check_query_plans(mysql_engine)
+    assert "no unique key" not in capsys.readouterr().out
+
+def test_mysql_partition_by_month(mysql_engine):
+    migrations.migrate(mysql_engine)
+    with mysql_engine.begin() as conn:
+        conn.execute(text("INSERT INTO Historical_Prices_1h (token_id, timestamp, close) VALUES ('alpha', :timestamp, 1.0)"),
+                     {"timestamp": int(datetime(2024, 11, 15, tzinfo=timezone.utc).timestamp())})
+    definitions = migrations.partition_by_month(mysql_engine, "Historical_Prices_1h", months_ahead=1)
+    assert definitions[0].startswith("PARTITION p202411 ") and definitions[-1].endswith("MAXVALUE")
+    # Already covered: nothing to add
+    assert migrations.partition_by_month(mysql_engine, "Historical_Prices_1h", months_ahead=1) == []
+    with mysql_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM Historical_Prices_1h")).scalar() == 1
+
+def test_mysql_partition_needs_timestamp_in_primary_key(mysql_engine):
+    with mysql_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE Historical_Prices (token_id VARCHAR(100) NOT NULL, timestamp BIGINT NOT NULL, "
+                          "close DOUBLE, PRIMARY KEY (token_id))"))
+    with pytest.raises(ValueError):
+        migrations.partition_by_month(mysql_engine)
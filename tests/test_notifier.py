@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from src.notifier import TelegramNotifier, TELEGRAM_MAX_LENGTH
+
+def bot_api(fake_server, statuses=(), delay=0.0):
+    """Mock Bot API: answers sendMessage with the given statuses first, then 200"""
+    pending = list(statuses)
+    lock = threading.Lock()
+
+    def respond(method, path, body):
+        time.sleep(delay)
+        with lock:
+            status = pending.pop(0) if pending else 200
+        if status == 429:
+            return 429, {}, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.05}}
+        return status, {}, {"ok": status == 200}
+
+    return fake_server(respond)
+
+def sent_texts(server):
+    return [json.loads(body)["text"] for _, method, path, body in server.requests if path.endswith("/sendMessage")]
+
+def test_messages_are_batched(fake_server):
+    server = bot_api(fake_server)
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0.2)
+    messages = [f"message {i}" for i in range(50)]
+    for message in messages:
+        notifier.send(message)
+    notifier.close()
+    texts = sent_texts(server)
+    assert len(texts) == 1
+    assert texts[0] == "\n".join(messages)
+    assert server.requests[0][2] == "/bottoken/sendMessage"
+    assert json.loads(server.requests[0][3])["chat_id"] == "chat"
+
+def test_batches_respect_the_length_limit(fake_server):
+    server = bot_api(fake_server)
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0.2)
+    messages = [f"{i:04d} " + "x" * 995 for i in range(10)] + ["y" * 5000]
+    for message in messages:
+        notifier.send(message)
+    notifier.close()
+    texts = sent_texts(server)
+    assert all(len(text) <= TELEGRAM_MAX_LENGTH for text in texts)
+    assert len(texts) == 5
+    assert "".join(texts).replace("\n", "") == "".join(messages)
+    assert notifier.stats == {"queued": 11, "messages": 11, "batches": 5, "failed_batches": 0}
+
+def test_close_flushes_pending_messages(fake_server):
+    server = bot_api(fake_server)
+    # A long linger would hold the batch open; close() must send it right away
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=10)
+    notifier.send("first")
+    notifier.send("second")
+    started = time.monotonic()
+    notifier.close()
+    assert time.monotonic() - started < 2
+    assert sent_texts(server) == ["first\nsecond"]
+
+def test_close_gives_up_after_the_flush_timeout(fake_server):
+    server = bot_api(fake_server, delay=2.0)
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0, timeout=5)
+    notifier.send("slow")
+    started = time.monotonic()
+    notifier.close(flush_timeout=0.3)
+    assert time.monotonic() - started < 1.0
+
+def test_send_does_not_wait_for_telegram(fake_server):
+    server = bot_api(fake_server, delay=0.5)
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0)
+    started = time.monotonic()
+    for i in range(20):
+        notifier.send(f"message {i}")
+    assert time.monotonic() - started < 0.1
+    notifier.close()
+    assert "\n".join(sent_texts(server)).split("\n") == [f"message {i}" for i in range(20)]
+
+def test_failed_sends_are_retried(fake_server):
+    server = bot_api(fake_server, statuses=[500, 429])
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0)
+    notifier.send("important")
+    notifier.close()
+    # 500 backs off (1 s), 429 waits the retry_after from the response, then the third try succeeds
+    assert sent_texts(server) == ["important"] * 3
+    assert notifier.stats["batches"] == 1
+    assert notifier.stats["failed_batches"] == 0
+
+def test_gives_up_after_max_retries(fake_server):
+    server = bot_api(fake_server, statuses=[429] * 10)
+    notifier = TelegramNotifier("token", "chat", api_url=server.url, linger=0, max_retries=2)
+    notifier.send("dropped")
+    notifier.close()
+    assert len(sent_texts(server)) == 3
+    assert notifier.stats["failed_batches"] == 1
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+import src.db as db
+import src.price_cache as price_cache
+from src.ohlc_store import OHLCStore, OHLC_COLUMNS
+from conftest import synthetic_history
+
+@pytest.fixture(scope="module")
+def historical_data():
+    # Shuffled so the store has to do the sorting
+    return synthetic_history(n_tokens=4, n_days=60, seed=2).sample(frac=1, random_state=0)
+
+def expected_rows(historical_data, token_id, start=None, end=None):
+    rows = historical_data[historical_data["token_id"] == token_id].sort_values("timestamp")
+    if start is not None:
+        rows = rows[rows["timestamp"] >= start]
+    if end is not None:
+        rows = rows[rows["timestamp"] <= end]
+    return rows.reset_index(drop=True)
+
+def test_window_matches_a_filter(historical_data):
+    store = OHLCStore(historical_data)
+    assert store.tokens() == [f"token-{token:02d}" for token in range(4)]
+    first_day = historical_data["timestamp"].min()
+    windows = [(None, None), ("2024-06-10", "2024-06-20"), ("2024-06-10 12:00", "2024-06-20 12:00"),
+               (None, "2024-06-05"), ("2024-07-20", None), ("2024-05-01", "2024-05-31"), ("2024-09-01", None),
+               ("2024-06-20", "2024-06-10"), (first_day, first_day)]
+    for token_id in store.tokens():
+        for start, end in windows:
+            start, end = (None if value is None else pd.Timestamp(value) for value in (start, end))
+            expected = expected_rows(historical_data, token_id, start, end)
+            # Both bounds are inclusive; an empty or inverted window has no rows
+            assert store.count(token_id, start, end) == len(expected)
+            pd.testing.assert_frame_equal(store.frame(token_id, start, end), expected[["token_id", "timestamp"] + OHLC_COLUMNS])
+
+def test_late_listing_and_unknown_token(historical_data):
+    store = OHLCStore(historical_data)
+    # token-00 lists late, so a window before its first bar is empty
+    listing = expected_rows(historical_data, "token-00")["timestamp"].iloc[0]
+    assert listing > pd.Timestamp("2024-06-01")
+    assert store.count("token-00", end=listing - pd.Timedelta(days=1)) == 0
+    assert store.count("token-00", end=listing) == 1
+    assert "missing" not in store and store.count("missing") == 0
+    assert all(len(values) == 0 for values in store.window("missing").values())
+
+def test_window_returns_views(historical_data):
+    store = OHLCStore(historical_data)
+    bars = store.window("token-01", pd.Timestamp("2024-06-10"), pd.Timestamp("2024-06-20"))
+    assert len(bars["close"]) == 11
+    for column, values in bars.items():
+        assert np.shares_memory(values, store.columns[column])
+
+    closes = store.closes("token-01", end=pd.Timestamp("2024-06-03"))
+    assert list(closes.index) == list(pd.date_range("2024-06-01", "2024-06-03"))
+    np.testing.assert_array_equal(closes.to_numpy(), expected_rows(historical_data, "token-01")["close"].iloc[:3])
+
+def test_from_arrays_shares_the_arrays(historical_data):
+    store = OHLCStore(historical_data)
+    columns = {column: store.columns[column] for column in OHLC_COLUMNS}
+    wrapped = OHLCStore.from_arrays(store.timestamps, columns, store.slices)
+    for token_id in store.tokens():
+        pd.testing.assert_frame_equal(wrapped.frame(token_id, end=pd.Timestamp("2024-07-01")),
+                                      store.frame(token_id, end=pd.Timestamp("2024-07-01")))
+    assert np.shares_memory(wrapped.window("token-02")["close"], store.columns["close"])
+
+@pytest.mark.skipif(not price_cache.available(), reason="pyarrow is not installed")
+def test_store_from_the_price_cache(sqlite_storage, historical_data, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    rows = historical_data.assign(timestamp=(historical_data["timestamp"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+    with db.get_engine().begin() as conn:
+        sqlite_storage.upsert_tokens(conn, [{"id": token_id, "symbol": token_id[-3:], "name": token_id}
+                                            for token_id in rows["token_id"].unique()])
+        sqlite_storage.upsert_ohlc(conn, rows.to_dict("records"))
+    price_cache.refresh(cache_dir)
+
+    # The daily run loads through the cache; with the rows gone from the database it is served from the cache alone
+    with db.get_engine().begin() as conn:
+        conn.exec_driver_sql("DELETE FROM Historical_Prices")
+    top_tokens = ["token-00", "token-03"]
+    cached = price_cache.load(token_ids=top_tokens, parse_dates=True, cache_dir=cache_dir)
+    store = OHLCStore(cached)
+    assert store.tokens() == top_tokens
+    start, end = pd.Timestamp("2024-07-01"), pd.Timestamp("2024-07-15")
+    for token_id in top_tokens:
+        expected = expected_rows(historical_data, token_id, start, end)
+        actual = store.frame(token_id, start, end)
+        np.testing.assert_array_equal(actual["timestamp"].to_numpy(dtype="datetime64[s]"),
+                                      expected["timestamp"].to_numpy(dtype="datetime64[s]"))
+        np.testing.assert_array_equal(actual[OHLC_COLUMNS].to_numpy(), expected[OHLC_COLUMNS].to_numpy())
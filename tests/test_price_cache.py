@@ -0,0 +1,91 @@
+import os
+import pandas as pd
+import pytest
+import src.db as db
+import src.price_cache as price_cache
+from conftest import synthetic_history
+
+pytestmark = pytest.mark.skipif(not price_cache.available(), reason="pyarrow is not installed")
+
+def epoch(value):
+    return int(pd.Timestamp(value, tz="UTC").timestamp())
+
+def store_history(store, history):
+    rows = history.assign(timestamp=(history["timestamp"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+    with db.get_engine().begin() as conn:
+        store.upsert_tokens(conn, [{"id": token_id, "symbol": token_id[-3:], "name": token_id}
+                                   for token_id in rows["token_id"].unique()])
+        store.upsert_ohlc(conn, rows.to_dict("records"))
+
+@pytest.fixture
+def cache_dir(sqlite_storage, tmp_path):
+    # Three months of bars for six tokens; token-00 and token-03 list late
+    store_history(sqlite_storage, synthetic_history(n_tokens=6, n_days=90, seed=4))
+    path = str(tmp_path / "cache")
+    price_cache.refresh(path)
+    return path
+
+def assert_cache_matches_db(cache_dir, **filters):
+    cached = price_cache.load(cache_dir=cache_dir, **filters)
+    expected = price_cache._load_from_db(filters.get("columns") or price_cache.COLUMNS, filters.get("token_ids"),
+                                         filters.get("start"), filters.get("end"))
+    pd.testing.assert_frame_equal(cached, expected, check_dtype=False)
+
+def test_partitions_are_monthly(cache_dir):
+    assert price_cache._partition_months(cache_dir) == ["2024-06", "2024-07", "2024-08"]
+
+def test_token_and_date_filters(cache_dir):
+    july = (epoch("2024-07-01"), epoch("2024-07-31"))
+    assert_cache_matches_db(cache_dir)
+    assert_cache_matches_db(cache_dir, token_ids=["token-04", "token-00"])
+    # Bounds are inclusive and may fall inside a partition or between bars
+    assert_cache_matches_db(cache_dir, start=july[0], end=july[1])
+    assert_cache_matches_db(cache_dir, start=july[0] + 3600, end=july[1] - 3600)
+    assert_cache_matches_db(cache_dir, token_ids=["token-03"], start=epoch("2024-06-20"), end=epoch("2024-08-02"),
+                            columns=["close", "timestamp"])
+    assert_cache_matches_db(cache_dir, start=epoch("2024-08-15"))
+    assert_cache_matches_db(cache_dir, end=epoch("2024-06-03"))
+
+    one_day = price_cache.load(["token_id", "timestamp", "close"], token_ids=["token-01"], start=july[0], end=july[0],
+                               parse_dates=True, cache_dir=cache_dir)
+    assert list(one_day["timestamp"]) == [pd.Timestamp("2024-07-01")]
+    assert list(one_day.columns) == ["token_id", "timestamp", "close"]
+
+def test_empty_selections(cache_dir):
+    assert price_cache.load(token_ids=[], cache_dir=cache_dir).empty
+    assert price_cache.load(token_ids=["unknown"], cache_dir=cache_dir).empty
+    assert list(price_cache.load(start=epoch("2025-01-01"), cache_dir=cache_dir).columns) == price_cache.COLUMNS
+
+def test_refresh_adds_new_bars_and_tokens(sqlite_storage, cache_dir):
+    # A revised last bar and five more days for everyone (into a new month), and a new token
+    newer = synthetic_history(n_tokens=7, n_days=95, seed=5)
+    newer = newer[(newer["timestamp"] >= "2024-08-29") | (newer["token_id"] == "token-06")]
+    store_history(sqlite_storage, newer)
+    price_cache.refresh(cache_dir)
+    assert price_cache._partition_months(cache_dir) == ["2024-06", "2024-07", "2024-08", "2024-09"]
+    assert_cache_matches_db(cache_dir)
+    assert price_cache._read_manifest(cache_dir)["token-06"] == epoch("2024-09-03")
+
+def test_cache_ahead_of_the_database_is_rebuilt(sqlite_storage, cache_dir):
+    # The last week was deleted (or the database restored from an older copy)
+    with db.get_engine().begin() as conn:
+        conn.exec_driver_sql(f"DELETE FROM Historical_Prices WHERE timestamp >= {epoch('2024-08-23')}")
+    price_cache.refresh(cache_dir)
+    assert_cache_matches_db(cache_dir)
+    assert max(price_cache._read_manifest(cache_dir).values()) == epoch("2024-08-22")
+
+def test_missing_partition_is_rebuilt(cache_dir):
+    os.remove(price_cache._partition_path("2024-08", cache_dir))
+    price_cache.refresh(cache_dir)
+    assert price_cache._partition_months(cache_dir) == ["2024-06", "2024-07", "2024-08"]
+    assert_cache_matches_db(cache_dir)
+
+def test_up_to_date_cache_is_kept(cache_dir):
+    before = {month: os.path.getmtime(price_cache._partition_path(month, cache_dir))
+              for month in price_cache._partition_months(cache_dir)}
+    price_cache.refresh(cache_dir)
+    # Only the month holding the last cached bars is rewritten (that bar may still be revised)
+    after = {month: os.path.getmtime(price_cache._partition_path(month, cache_dir)) for month in before}
+    assert [month for month in before if after[month] != before[month]] in ([], ["2024-08"])
+    assert before["2024-06"] == after["2024-06"] and before["2024-07"] == after["2024-07"]
+    assert_cache_matches_db(cache_dir)
@@ -0,0 +1,204 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import types
+import numpy as np
+import pandas as pd
+import pytest
+import src.RelativeStrength as RelativeStrength
+
+def random_prices(n_tokens, n_bars, seed, gaps=False):
+    rng = np.random.default_rng(seed)
+    prices = np.exp(np.cumsum(rng.normal(0, 0.05, (n_bars, n_tokens)), axis=0))
+    for token in range(n_tokens):
+        prices[:rng.integers(0, n_bars // 2), token] = np.nan
+    if gaps:
+        prices[rng.random(prices.shape) < 0.01] = np.nan
+    return pd.DataFrame(prices, columns=[f"token-{token:02d}" for token in range(n_tokens)])
+
+def talib_relative_strength(prices_df, talib):
+    """The original per-pair computation: TA-Lib RSI(14) and EMA(3) of every price ratio"""
+    prices = prices_df.to_numpy()
+    n_tokens = prices.shape[1]
+    wins = np.zeros(prices.shape)
+    scored = np.zeros(prices.shape, dtype=bool)
+    for i in range(n_tokens):
+        for j in range(i + 1, n_tokens):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rsi_ema = talib.EMA(talib.RSI(prices[:, i] / prices[:, j], 14), 3)
+            score = np.where(rsi_ema > 50, 1.0, np.where(rsi_ema < 50, 0.0, np.nan))
+            has_score = ~np.isnan(score)
+            wins[:, i] += np.where(has_score, score, 0)
+            wins[:, j] += np.where(has_score, 1 - score, 0)
+            scored[:, i] |= has_score
+            scored[:, j] |= has_score
+    keep = scored.any(axis=1)
+    wins[~scored] = np.nan
+    strength = pd.DataFrame(wins[keep], index=prices_df.index[keep], columns=prices_df.columns)
+    return ((strength / n_tokens) * 100).fillna(0).astype(int)
+
+@pytest.mark.parametrize("gaps", [False, True], ids=["contiguous", "nan-gaps"])
+def test_all_pairs_match_talib(gaps):
+    talib = pytest.importorskip("talib")
+    for seed in range(5):
+        prices_df = random_prices(20, 300, seed, gaps)
+        expected = talib_relative_strength(prices_df, talib)
+        pd.testing.assert_frame_equal(RelativeStrength.relative_strength_from_prices(prices_df), expected)
+
+def test_single_pair_trend_matches_talib():
+    talib = pytest.importorskip("talib")
+    for close in random_prices(30, 300, seed=7, gaps=True).T.to_numpy():
+        rsi_ema = talib.EMA(talib.RSI(close, 14), 3)
+        expected = np.where(rsi_ema > 50, 1, np.where(rsi_ema < 50, 0, np.nan)).astype(np.float32)
+        np.testing.assert_array_equal(RelativeStrength.calculate_rsi_ema_trend(close), expected)
+
+@pytest.fixture
+def pair_state(monkeypatch, tmp_path):
+    """Run the incremental computation with its state in tmp_path; `advanced` counts the bars it processed"""
+    monkeypatch.setattr(RelativeStrength, "RS_STATE_DIR", str(tmp_path))
+    advance = RelativeStrength._advance_pair_state
+    calls = []
+
+    def counting(state, ratios, *args):
+        calls.append(1)
+        return advance(state, ratios, *args)
+
+    monkeypatch.setattr(RelativeStrength, "_advance_pair_state", counting)
+
+    def run(prices_df):
+        calls.clear()
+        today = RelativeStrength.calculate_todays_relative_strength(prices_df)
+        run.advanced = len(calls)
+        return today
+
+    return run
+
+def full_last_row(prices_df):
+    return RelativeStrength.relative_strength_from_prices(prices_df).iloc[-1]
+
+def test_incremental_run_matches_full_recompute(pair_state):
+    prices_df = random_prices(8, 120, seed=1, gaps=True)
+    for end in (40, 41, 60, 120):
+        today = pair_state(prices_df.iloc[:end])
+        expected = full_last_row(prices_df.iloc[:end])
+        pd.testing.assert_series_equal(today, expected)
+        assert today.name == expected.name
+
+def test_unchanged_history_reuses_the_state(pair_state):
+    prices_df = random_prices(8, 120, seed=2)
+    pair_state(prices_df.iloc[:100])
+    assert pair_state.advanced == 100
+
+    # The same bars again, then the open candle refreshed with a new close: only that bar is recomputed
+    pair_state(prices_df.iloc[:100])
+    assert pair_state.advanced == 1
+    refreshed = prices_df.iloc[:100].copy()
+    refreshed.iloc[-1] *= 1.2
+    pd.testing.assert_series_equal(pair_state(refreshed), full_last_row(refreshed))
+    assert pair_state.advanced == 1
+
+    # A new day closes the refreshed candle and adds one more
+    pd.testing.assert_series_equal(pair_state(prices_df.iloc[:101]), full_last_row(prices_df.iloc[:101]))
+    assert pair_state.advanced == 2
+
+def test_revised_earlier_bar_invalidates_the_state(pair_state):
+    prices_df = random_prices(8, 120, seed=3)
+    pair_state(prices_df.iloc[:100])
+    revised = prices_df.iloc[:101].copy()
+    revised.iloc[80, 2] *= 1.5
+    pd.testing.assert_series_equal(pair_state(revised), full_last_row(revised))
+    assert pair_state.advanced == 101
+
+@pytest.mark.parametrize("tile_pairs", [1, 2, 7, 44, 45, 1000])
+def test_tiled_run_matches_untiled(tile_pairs):
+    # 10 tokens make 45 pairs: one pair per tile, uneven tiles, a tile one pair short and a single tile
+    prices_df = random_prices(10, 150, seed=4, gaps=True)
+    untiled = RelativeStrength.relative_strength_from_prices(prices_df, tile_pairs=45)
+    pd.testing.assert_frame_equal(RelativeStrength.relative_strength_from_prices(prices_df, tile_pairs=tile_pairs), untiled)
+
+def test_tile_size_setting_is_used(monkeypatch):
+    prices_df = random_prices(6, 100, seed=5)
+    expected = RelativeStrength.relative_strength_from_prices(prices_df, tile_pairs=15)
+    tiles = []
+    accumulate = RelativeStrength._accumulate_tile
+    monkeypatch.setattr(RelativeStrength, "_accumulate_tile",
+                        lambda prices, pair_i, *args: tiles.append(len(pair_i)) or accumulate(prices, pair_i, *args))
+    monkeypatch.setattr(RelativeStrength, "RS_TILE_PAIRS", 4)
+    pd.testing.assert_frame_equal(RelativeStrength.relative_strength_from_prices(prices_df), expected)
+    assert tiles == [4, 4, 4, 3]
+
+def test_worker_processes_match_one_process():
+    prices_df = random_prices(12, 120, seed=6, gaps=True)
+    expected = RelativeStrength.relative_strength_from_prices(prices_df, tile_pairs=5, workers=1)
+    for workers in (2, 3, 2):
+        result = RelativeStrength.relative_strength_from_prices(prices_df, tile_pairs=5, workers=workers)
+        pd.testing.assert_frame_equal(result, expected)
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="workers inherit the patched module only with fork")
+def test_shared_memory_is_unlinked_when_a_worker_fails(monkeypatch):
+    names = []
+
+    def tracked(*args, **kwargs):
+        block = shared_memory.SharedMemory(*args, **kwargs)
+        names.append(block.name)
+        return block
+
+    def failing(*args):
+        raise RuntimeError("tile failed")
+
+    monkeypatch.setattr(RelativeStrength, "shared_memory", types.SimpleNamespace(SharedMemory=tracked))
+    # Forked workers see the patched scorer, so every task raises inside a worker process
+    monkeypatch.setattr(RelativeStrength, "_pair_range_wins", failing)
+    with pytest.raises(RuntimeError, match="tile failed"):
+        RelativeStrength.relative_strength_from_prices(random_prices(12, 60, seed=7), tile_pairs=5, workers=2)
+    assert len(names) == 1
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=names[0])
+
+def long_closes(bars):
+    """(token_ids, timestamps, closes) arrays from (token_id, timestamp, close) tuples"""
+    token_ids, timestamps, closes = zip(*bars)
+    return np.array(token_ids, dtype=object), np.array(timestamps, dtype=np.int64), np.array(closes, dtype=np.float64)
+
+def column_by_column(tokens, bars, latest_timestamps, min_bars):
+    """The original load_prices loop: one column per token, assigned into a growing frame"""
+    prices_df = pd.DataFrame()
+    for token in tokens:
+        df = pd.DataFrame([bar[1:] for bar in bars if bar[0] == token], columns=["timestamp", "close"])
+        if not df.empty and len(df) >= min_bars:
+            df.set_index("timestamp", inplace=True)
+            if latest_timestamps.get(token):
+                df = df[df.index <= latest_timestamps[token]]
+            prices_df[token] = df["close"]
+    return prices_df
+
+def test_pivot_aligns_missing_bars_to_the_first_token():
+    rng = np.random.default_rng(6)
+    days = list(range(1, 31))
+    bars = [("b", day, 10.0 + day) for day in days]
+    # "a" misses days 5 and 6, "c" starts late and has a day the first kept token doesn't, "d" is too short
+    bars += [("a", day, rng.random()) for day in days if day not in (5, 6)]
+    bars += [("c", day, rng.random()) for day in list(range(10, 31)) + [31]]
+    bars += [("d", day, 1.0) for day in days[:5]] + [("unknown", day, 1.0) for day in days]
+    tokens, latest_timestamps = ["b", "d", "a", "c"], {"c": 28}
+    prices = RelativeStrength.pivot_closes(tokens, *long_closes(bars), latest_timestamps, min_bars=14)
+
+    # Columns follow `tokens`, not the order of the rows, and the index is b's timestamps
+    assert list(prices.columns) == ["b", "a", "c"]
+    assert list(prices.index) == days
+    assert prices["a"].loc[[5, 6]].isna().all() and prices["c"].loc[:9].isna().all()
+    assert prices["c"].loc[29:].isna().all()  # After c's latest timestamp
+    pd.testing.assert_frame_equal(prices, column_by_column(tokens, bars, latest_timestamps, 14),
+                                  check_names=False, check_index_type=False)
+
+def test_pivot_keeps_the_last_duplicate_bar():
+    # A revised bar appended after the stream, out of time order
+    bars = [("a", day, float(day)) for day in range(1, 15)] + [("a", 7, 70.0)]
+    bars += [("b", day, float(day)) for day in range(1, 14)] + [("b", 13, 130.0)]
+    prices = RelativeStrength.pivot_closes(["a", "b"], *long_closes(bars), min_bars=14)
+    # "a" has one close per day, the later row for day 7 wins; "b" has 13 distinct bars, too few
+    assert list(prices.columns) == ["a"]
+    assert list(prices.index) == list(range(1, 15))
+    assert prices.loc[7, "a"] == 70.0 and prices["a"].drop(7).tolist() == [float(day) for day in range(1, 15) if day != 7]
+
+def test_pivot_with_no_token_long_enough():
+    assert RelativeStrength.pivot_closes(["a"], *long_closes([("a", 1, 1.0)])).empty
@@ -0,0 +1,92 @@
+import os
+import pytest
+from sqlalchemy import create_engine, text
+import src.storage as storage
+
+TABLES = ["Base_tokens", "Historical_Prices", "Trades", "Portfolio"]
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def store(request, tmp_path):
+    """An empty database of each backend; MySQL needs a scratch database in STORAGE_CHECK_MYSQL_URL (it gets wiped)"""
+    if request.param == "sqlite":
+        engine = create_engine(f"sqlite:///{tmp_path / 'storage.sqlite'}")
+        backend = storage.SQLiteStorage(engine)
+    else:
+        url = os.getenv("STORAGE_CHECK_MYSQL_URL")
+        if not url:
+            pytest.skip("STORAGE_CHECK_MYSQL_URL is not set")
+        engine = create_engine(url)
+        try:
+            engine.connect().close()
+        except Exception as e:
+            pytest.skip(f"MySQL is not reachable: {e}")
+        backend = storage.MySQLStorage(engine)
+    backend.create_schema()
+    with engine.begin() as conn:
+        for table in TABLES:
+            conn.execute(text(f"DELETE FROM {table}"))
+    yield backend
+    engine.dispose()
+
+def add_tokens_and_bars(store):
+    with store.engine.begin() as conn:
+        tokens = [{"id": token_id, "symbol": token_id[:3], "name": token_id.title()} for token_id in ["alpha", "beta", "gamma"]]
+        assert store.upsert_tokens(conn, tokens) == 3
+        rows = [{"token_id": token_id, "timestamp": 86400 * day, "open": day, "high": day + 1, "low": day - 1, "close": day + 0.5}
+                for token_id in ["alpha", "beta"] for day in range(1, 6)]
+        assert store.upsert_ohlc(conn, rows) == 10
+    return rows
+
+def open_trade(token_id, day):
+    return {"token_id": token_id, "entry_date": f"2025-01-0{day} 00:00:00", "entry_price": 1.0,
+            "position_type": "LONG", "status": "OPEN", "units": 10.0}
+
+def portfolio_row(day, equity=1000.0):
+    return {"date": f"2025-01-0{day} 00:00:00", "equity": equity, "cash": equity - 20.0, "positions_value": 20.0}
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        storage.SQLStorage(None)
+
+def test_upserts_update_existing_rows(store):
+    rows = add_tokens_and_bars(store)
+    with store.engine.begin() as conn:
+        store.upsert_tokens(conn, [{"id": "beta", "symbol": "bet", "name": "Beta v2"}])
+        store.upsert_ohlc(conn, [{**rows[0], "close": 99.0}])
+    with store.engine.connect() as conn:
+        names = dict(conn.execute(text("SELECT id, name FROM Base_tokens")).all())
+        assert names == {"alpha": "Alpha", "beta": "Beta v2", "gamma": "Gamma"}
+        assert store.stored_token_ids(conn, ["alpha", "delta"]) == {"alpha"}
+    prices = store.load_prices()
+    assert len(prices) == 10
+    assert prices["close"].iloc[0] == 99.0
+
+def test_watermarks_and_price_loads(store):
+    add_tokens_and_bars(store)
+    assert store.latest_timestamps() == {"alpha": 5 * 86400, "beta": 5 * 86400, "gamma": None}
+    prices = store.load_prices()
+    assert list(prices.columns) == storage.PRICE_COLUMNS
+    assert list(prices["token_id"]) == ["alpha"] * 5 + ["beta"] * 5
+    window = store.load_prices(["token_id", "close"], token_ids=["beta"], start=2 * 86400, end=3 * 86400)
+    assert list(window["close"]) == [2.5, 3.5]
+
+def test_trades_open_close_and_portfolio(store):
+    store.record_trades(opened_trades=[open_trade("alpha", 1), open_trade("beta", 1)], portfolio_rows=[portfolio_row(1)])
+    trades = store.open_trades()
+    assert sorted(trades["token_id"]) == ["alpha", "beta"]
+    alpha = trades[trades["token_id"] == "alpha"].iloc[0]
+    store.record_trades(
+        closed_trades=[{"trade_id": int(alpha["trade_id"]), "exit_date": "2025-01-02 00:00:00", "exit_price": 2.0, "profit_loss": 10.0}],
+        portfolio_rows=[portfolio_row(2, 1010.0)])
+    assert list(store.open_trades()["token_id"]) == ["beta"]
+    with store.engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM Portfolio")).scalar() == 2
+
+def test_failed_run_leaves_nothing_behind(store):
+    store.record_trades(opened_trades=[open_trade("beta", 1)])
+    # The portfolio row is missing its columns, so the whole transaction must roll back
+    with pytest.raises(Exception):
+        store.record_trades(opened_trades=[open_trade("gamma", 3)], portfolio_rows=[{"date": "2025-01-03 00:00:00"}])
+    assert list(store.open_trades()["token_id"]) == ["beta"]
+    with store.engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM Portfolio")).scalar() == 0
@@ -0,0 +1,101 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import src.indicators as indicators
+from src.BOSCHOCH import MarketStructure
+from src.streaming_signals import SignalStateStore, TokenSignalState
+from conftest import random_ohlc, synthetic_history
+
+@pytest.fixture
+def token_data():
+    # token-01 has a bar on every one of the 120 days
+    history = synthetic_history(n_tokens=2, n_days=120, seed=3)
+    return history[history["token_id"] == "token-01"].drop(columns="token_id").reset_index(drop=True)
+
+def replayed(token_data):
+    return TokenSignalState().update_frame(token_data)
+
+def test_revised_earlier_bar_replays_the_token(token_data, tmp_path):
+    store = SignalStateStore(str(tmp_path / "state.json"))
+    store.advance("token", token_data.iloc[:100])
+    assert store.states["token"].matches(token_data)
+
+    # A bar long before the last one is revised, then a new bar arrives
+    revised = token_data.copy()
+    revised.loc[40, "high"] *= 1.5
+    assert not store.states["token"].matches(revised)
+    state = store.advance("token", revised.iloc[:101])
+    assert state.snapshot() == replayed(revised.iloc[:101]).snapshot()
+
+def test_dropped_bar_replays_the_token(token_data):
+    state = replayed(token_data.iloc[:100])
+    assert not state.matches(token_data.drop(index=50).reset_index(drop=True))
+    assert not state.matches(token_data.iloc[:99])
+
+def streamed(close, high, low):
+    state = TokenSignalState()
+    outputs = [state.update(t, h, l, c) for t, (c, h, l) in enumerate(zip(close, high, low))]
+    return np.array([signal for signal, _ in outputs]), np.array([choch for _, choch in outputs])
+
+def batch(close, high, low):
+    ohlc = pd.DataFrame({"high": high, "low": low})
+    choch = MarketStructure.bos_choch(ohlc, MarketStructure.swing_highs_lows(ohlc))["CHOCH"].to_numpy()
+    return indicators.dema_dmi(close, high, low), choch
+
+@pytest.mark.parametrize("seed", range(40))
+def test_streaming_matches_batch(seed):
+    rng = np.random.default_rng(seed)
+    close, high, low = random_ohlc(rng, int(rng.integers(2, 400)), leading_nans=int(rng.integers(0, 3)))
+    for streaming, expected in zip(streamed(close, high, low), batch(close, high, low)):
+        np.testing.assert_array_equal(streaming, expected)
+
+def test_snapshot_resume_matches_replay(token_data, tmp_path):
+    path = str(tmp_path / "state.json")
+    for end in (30, 31, 75, len(token_data)):
+        # Each daily run loads the saved states, adds the new bars and saves them again
+        store = SignalStateStore(path).load()
+        # The saved state resumes where the last run stopped instead of replaying the token
+        assert "token" not in store.states or store.states["token"].matches(token_data.iloc[:end])
+        state = store.advance("token", token_data.iloc[:end])
+        store.save()
+        full = replayed(token_data.iloc[:end])
+        assert state.bars == end
+        assert json.loads(json.dumps(state.snapshot())) == json.loads(json.dumps(full.snapshot()))
+        np.testing.assert_array_equal([state.previous_signal, state.signal, state.latest_choch],
+                                      [full.previous_signal, full.signal, full.latest_choch])
+
+def test_restore_continues_bar_by_bar(token_data):
+    state = replayed(token_data.iloc[:60])
+    resumed = TokenSignalState.restore(json.loads(json.dumps(state.snapshot())))
+    rest = token_data.iloc[60:]
+    for row in rest.itertuples():
+        np.testing.assert_array_equal(resumed.update(row.timestamp, row.high, row.low, row.close),
+                                      state.update(row.timestamp, row.high, row.low, row.close))
+    assert resumed.snapshot() == state.snapshot()
+
+def test_refreshed_open_candle_is_not_replayed(token_data, tmp_path, monkeypatch):
+    bars_fed = []
+    update = TokenSignalState.update
+    monkeypatch.setattr(TokenSignalState, "update", lambda self, *bar: bars_fed.append(bar) or update(self, *bar))
+    path = str(tmp_path / "state.json")
+    store = SignalStateStore(path)
+    store.advance("token", token_data.iloc[:100])
+    store.save()
+
+    # The next run sees the same candles with the still-open last one at a new close
+    refreshed = token_data.iloc[:100].copy()
+    refreshed.loc[99, "close"] *= 1.1
+    refreshed.loc[99, "high"] = max(refreshed.loc[99, "high"], refreshed.loc[99, "close"])
+    bars_fed.clear()
+    store = SignalStateStore(path).load()
+    state = store.advance("token", refreshed)
+    assert len(bars_fed) == 1
+    full = replayed(refreshed)
+    np.testing.assert_array_equal([state.previous_signal, state.signal, state.latest_choch],
+                                  [full.previous_signal, full.signal, full.latest_choch])
+
+    # And a new candle after it feeds the closed one plus the new open one
+    bars_fed.clear()
+    store.advance("token", token_data.iloc[:101])
+    assert len(bars_fed) == 2
@@ -0,0 +1,44 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import src.sweep as sweep
+from conftest import synthetic_history
+
+GRID = {"len_dema": [5, 8], "max_positions": [2, 3]}
+
+@pytest.fixture(scope="module")
+def historical_data():
+    return synthetic_history(n_tokens=8, n_days=120, seed=0)
+
+def run(historical_data, path, grid=GRID, workers=1):
+    return sweep.run_sweep(grid, workers, str(path), datetime(2024, 8, 30), datetime(2024, 9, 28),
+                           historical_data=historical_data, tokens=sorted(historical_data["token_id"].unique()))
+
+def by_params(results):
+    return results.sort_values(list(GRID)).reset_index(drop=True)
+
+def test_resumed_sweep_skips_completed_runs(historical_data, tmp_path):
+    serial = run(historical_data, tmp_path / "serial.csv")
+    assert len(serial) == 4 and (serial["error"] == "").all() and (serial["trades"] > 0).all()
+
+    # An interrupted sweep that finished half the grid, resumed with two workers
+    path = tmp_path / "resumed.csv"
+    run(historical_data, path, {"len_dema": [5], "max_positions": [2, 3]}, workers=2)
+    resumed = run(historical_data, path, workers=2)
+    checkpoint = pd.read_csv(path)
+    assert len(checkpoint) == 4 and checkpoint["run_key"].is_unique
+    pd.testing.assert_frame_equal(by_params(resumed), by_params(serial))
+
+def test_failing_run_is_recorded_and_retried(historical_data, tmp_path):
+    path = tmp_path / "sweep.csv"
+    # di_len=0 divides by zero inside the indicator
+    results = run(historical_data, path, {"di_len": [0, 5], "max_positions": [3]}, workers=2)
+    failed = results[results["di_len"] == 0].iloc[0]
+    assert failed["error"].startswith("ZeroDivisionError") and pd.isna(failed["final_equity"])
+    assert results[results["di_len"] == 5].iloc[0]["error"] == ""
+
+    # The failed run is tried again on the next sweep and the completed one is not
+    results = run(historical_data, path, {"di_len": [0, 5], "max_positions": [3]}, workers=2)
+    checkpoint = pd.read_csv(path)
+    assert list(checkpoint["di_len"]).count(0) == 2 and list(checkpoint["di_len"]).count(5) == 1
+    assert len(results) == 2
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+import src.db as db
+import src.streaming_signals as streaming_signals
+import src.timeframes as timeframes
+from src.streaming_signals import SignalStateStore, TokenSignalState
+
+HOUR = 3600
+
+def hourly_bars(token_id, closes_at, seed=0):
+    """Hourly bars of one token closing at the given epoch seconds"""
+    rng = np.random.default_rng(seed)
+    close = np.exp(np.cumsum(rng.normal(0, 0.01, len(closes_at))))
+    return pd.DataFrame({"token_id": token_id, "timestamp": np.asarray(closes_at, dtype=np.int64),
+                         "open": close * (1 + rng.normal(0, 0.002, len(close))),
+                         "high": close * 1.01, "low": close * 0.99, "close": close})
+
+def test_hourly_bars_bucket_into_4h_candles():
+    bars = hourly_bars("a", [HOUR * h for h in range(1, 9)])
+    candles = timeframes.resample_ohlc(bars, "4h")
+    # Bars closing at 1h..4h make the candle closing at 4h, 5h..8h the one closing at 8h
+    assert list(candles["timestamp"]) == [4 * HOUR, 8 * HOUR]
+    first, second = bars.iloc[:4], bars.iloc[4:]
+    for candle, group in zip(candles.itertuples(), (first, second)):
+        assert candle.open == group["open"].iloc[0] and candle.close == group["close"].iloc[-1]
+        assert candle.high == group["high"].max() and candle.low == group["low"].min()
+
+def test_partial_last_bucket_is_dropped_until_complete():
+    bars = hourly_bars("a", [HOUR * h for h in range(1, 7)])
+    assert list(timeframes.resample_ohlc(bars, "4h")["timestamp"]) == [4 * HOUR]
+    forming = timeframes.resample_ohlc(bars, "4h", drop_incomplete=False)
+    assert list(forming["timestamp"]) == [4 * HOUR, 8 * HOUR]
+    assert forming["close"].iloc[-1] == bars["close"].iloc[-1]
+
+def test_gaps_and_tokens_stay_apart():
+    # "a" misses two hours inside its first candle and the whole second candle; "b" ends where "a" starts again
+    a = hourly_bars("a", [HOUR, 4 * HOUR] + [HOUR * h for h in range(9, 13)], seed=1)
+    b = hourly_bars("b", [HOUR * h for h in range(1, 5)], seed=2)
+    candles = timeframes.resample_ohlc(pd.concat([b, a]), "4h")
+    assert list(zip(candles["token_id"], candles["timestamp"])) == [("a", 4 * HOUR), ("a", 12 * HOUR), ("b", 4 * HOUR)]
+    assert candles["open"].iloc[0] == a["open"].iloc[0] and candles["close"].iloc[0] == a["close"].iloc[1]
+
+def test_resample_matches_pandas():
+    rng = np.random.default_rng(3)
+    hours = np.sort(rng.choice(np.arange(1, 24 * 20), size=300, replace=False)) * HOUR
+    bars = hourly_bars("a", hours, seed=4)
+    candles = timeframes.resample_ohlc(bars, "1d", drop_incomplete=False)
+    # Right-closed, right-labelled days are the close-time convention
+    indexed = bars.set_index(pd.to_datetime(bars["timestamp"], unit="s"))
+    expected = indexed.resample("1D", closed="right", label="right").agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last"}).dropna()
+    np.testing.assert_array_equal(candles["timestamp"], (expected.index - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+    np.testing.assert_array_equal(candles[["open", "high", "low", "close"]].to_numpy(), expected.to_numpy())
+
+def test_signal_state_is_kept_per_timeframe(sqlite_storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming_signals, "SIGNAL_STATE_DIR", str(tmp_path))
+    bars = hourly_bars("a", [HOUR * h for h in range(1, 24 * 30 + 1)], seed=5)
+    with db.get_engine().begin() as conn:
+        sqlite_storage.upsert_ohlc(conn, bars.to_dict("records"), table="Historical_Prices_1h")
+
+    four_hour = timeframes.load_ohlc("4h", token_ids=["a"], parse_dates=True).drop(columns="token_id")
+    assert len(four_hour) == 180
+    store = SignalStateStore(timeframe="4h")
+    state = store.advance("a", four_hour)
+    store.save()
+    expected = TokenSignalState().update_frame(four_hour)
+    assert state.bars == 180
+    np.testing.assert_array_equal([state.previous_signal, state.latest_choch],
+                                  [expected.previous_signal, expected.latest_choch])
+
+    # The 4h state has its own file and the daily store does not see it
+    assert store.path == str(tmp_path / "signal_state_4h.json")
+    assert SignalStateStore(timeframe="4h").load().states["a"].bars == 179
+    assert SignalStateStore().load().states == {}
+
+def test_stored_timeframe():
+    assert [timeframes.stored_timeframe(tf) for tf in ("1d", "4h", "1h")] == ["1d", "1h", "1h"]
+    with pytest.raises(ValueError):
+        timeframes.stored_timeframe("15m")
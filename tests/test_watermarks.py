@@ -0,0 +1,60 @@
+from datetime import datetime
+import pytest
+import src.db as db
+import src.price_cache as price_cache
+from src.watermarks import IngestionWatermarks
+
+DAY = 86400
+
+def add_bars(store, token_id, timestamps, close=1.0):
+    with db.get_engine().begin() as conn:
+        store.upsert_ohlc(conn, [{"token_id": token_id, "timestamp": t, "open": 1.0, "high": 2.0, "low": 0.5, "close": close}
+                                 for t in timestamps])
+
+@pytest.fixture
+def tokens(sqlite_storage):
+    with db.get_engine().begin() as conn:
+        sqlite_storage.upsert_tokens(conn, [{"id": token_id, "symbol": token_id[:3], "name": token_id.title()}
+                                            for token_id in ["closed", "open", "new"]])
+    return sqlite_storage
+
+def test_plan_requests_only_tokens_that_are_behind(tokens):
+    # Candles are stamped with their close time; it is midday, so today's 00:00 candle is the last closed one
+    today = 1_700_006_400 - 1_700_006_400 % DAY
+    now = datetime.fromtimestamp(today + DAY // 2)
+    add_bars(tokens, "closed", [today - DAY, today])
+    add_bars(tokens, "open", [today, today + DAY])
+    watermarks = IngestionWatermarks(db.get_engine()).load()
+    plan = dict(watermarks.plan(default_from=today - 30 * DAY, now=now))
+    # "open" holds the still-open candle closing tonight, "new" has no bars
+    assert plan == {"open": today + DAY, "new": today - 30 * DAY}
+
+    # A day later "closed" is missing a candle, and "open" has closed and is behind too
+    later = dict(watermarks.plan(default_from=0, now=datetime.fromtimestamp(today + 2 * DAY + 60)))
+    assert later == {"closed": today, "open": today + DAY, "new": 0}
+
+def test_up_to_date_universe_plans_no_requests(tokens):
+    today = 1_700_006_400 - 1_700_006_400 % DAY
+    for token_id in ["closed", "open", "new"]:
+        add_bars(tokens, token_id, [today - DAY, today])
+    watermarks = IngestionWatermarks(db.get_engine()).load()
+    for seconds in (0, 3600, DAY - 1):
+        assert watermarks.plan(default_from=0, now=datetime.fromtimestamp(today + seconds)) == []
+
+def test_advance_moves_the_plan_forward(tokens):
+    watermarks = IngestionWatermarks(db.get_engine()).load()
+    watermarks.advance("new", 5 * DAY)
+    watermarks.advance("new", 3 * DAY)
+    assert watermarks.get("new") == 5 * DAY
+    assert dict(watermarks.plan(default_from=0))["new"] == 5 * DAY
+
+@pytest.mark.skipif(not price_cache.available(), reason="pyarrow is not installed")
+def test_refreshed_candle_reaches_the_price_cache(tokens, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    add_bars(tokens, "open", [DAY, 2 * DAY], close=1.0)
+    price_cache.refresh(cache_dir)
+    # The next run re-upserts the open candle with its newer values
+    add_bars(tokens, "open", [2 * DAY], close=1.5)
+    price_cache.refresh(cache_dir)
+    cached = price_cache.load(["token_id", "timestamp", "close"], cache_dir=cache_dir)
+    assert list(cached["close"]) == [1.0, 1.5]